@@ -0,0 +1,939 @@
+# clock_host.py
+# Host-side (CPython) control of one or many ESP32 clocks over serial,
+# independent of any GUI.
+#
+# Connection keeps one port open for good: it reconnects with exponential
+# backoff and queues writes while the port is gone. ClockLink runs the
+# text protocol over a Connection: it splits lines and resolves the
+# futures of a RequestTable from "OK|ERR @id NAME[:data]" replies. Fleet runs the same
+# operation on every link from a thread pool, so N devices take about as
+# long as one, and reports a result or error per port. ClockDaemon keeps
+# a Fleet open, resyncs it on a schedule and serves a local HTTP API.
+# discover() finds the clocks among all serial ports by asking each for
+# its ID in parallel.
+#
+#   python clock_host.py [--record DIR] ACTION ...
+#   python clock_host.py ports [--all]
+#   python clock_host.py status|alarm-set HH:MM|alarm-clear|sync PORT...
+#   python clock_host.py send COMMAND PORT...
+#   python clock_host.py upload FILE PORT...
+#   python clock_host.py daemon [--resync-hours H] [--http HOST:PORT]
+#                               [--telemetry SECONDS] PORT...
+import argparse
+import base64
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeout
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import serial
+import serial.tools.list_ports
+
+import frame
+import melody
+import telemetry
+from serial_session import SessionRecorder, session_path
+from ntp_pool import NtpPool, DEFAULT_SERVERS
+
+BAUDRATE = 115200
+REPLY_TIMEOUT = 2.0
+ECHO_SAMPLES = 16  # ECHO round trips used to map host time onto device ticks
+SET_LEAD = 0.3  # seconds a precise NTP_SET is sent ahead of its second
+SET_ATTEMPTS = 3  # precise_set() tries, each with a fresh ECHO measurement
+TICKS_PERIOD = 1 << 30  # MicroPython ticks_us wraps here
+FLEET_WORKERS = 64
+FLEET_TIMEOUT = 10.0  # seconds for one broadcast operation on every device
+MAX_LINE = 4096
+BACKOFF_MIN = 0.5  # seconds before the first reconnect attempt
+BACKOFF_MAX = 30.0
+QUEUE_MAX = 256  # writes held while disconnected
+WAKE_IDLE_S = 20.0  # quiet this long, the clock may be in light sleep (power.py)
+WAKE_PREAMBLE = b"\n"  # lost while the clock wakes; blank lines are ignored
+WAKE_DELAY = 0.03  # seconds for the clock to wake before the real data
+OPEN_WAIT = 1.0  # seconds ClockLink.open() waits for the first connect
+UPLOAD_CHUNK = 72  # bytes per MEL_DATA line (96 base64 chars)
+MAX_IN_FLIGHT = 4  # tagged commands sent before their replies arrive
+UPLOAD_WINDOW = 2  # MEL_DATA lines in flight; the device writes flash per line
+RESYNC_HOURS = 6.0
+HTTP_ADDRESS = ("127.0.0.1", 8765)
+DISCOVER_TIMEOUT = 1.5  # seconds every port together gets to answer ID, twice
+DEVICE_KIND = "alarmclock"  # see main.py cmd_id
+
+log = logging.getLogger("clock_host")
+
+
+def list_ports():
+    return [p.device for p in serial.tools.list_ports.comports()]
+
+
+class ClockInfo:
+    """A clock found by discover()."""
+
+    def __init__(self, port, device_id, firmware):
+        self.port = port
+        self.device_id = device_id  # machine.unique_id() in hex
+        self.firmware = firmware
+
+    def __str__(self):
+        return f"{self.port} {self.device_id} (firmware {self.firmware})"
+
+
+def probe(port, deadline):
+    """ClockInfo of the clock on `port`, or None if the port answers
+    anything else, or nothing, before time.monotonic() reaches `deadline`.
+    A sleeping clock drops the byte that wakes it, so ID goes after a
+    wake newline and is asked again halfway to the deadline.
+    """
+    with serial.Serial(port, BAUDRATE, timeout=0.05, write_timeout=0.5) as s:
+        s.reset_input_buffer()
+        s.write(WAKE_PREAMBLE)  # Also ends any half-sent line
+        time.sleep(WAKE_DELAY)
+        s.write(b"@1 ID\n")
+        retry_at = time.monotonic() + (deadline - time.monotonic()) / 2
+        buf = bytearray()
+        while time.monotonic() < deadline:
+            if retry_at is not None and time.monotonic() >= retry_at:
+                s.write(b"\n@2 ID\n")
+                retry_at = None
+            buf += s.read(s.in_waiting or 1)
+            while True:
+                i = buf.find(b"\n")
+                if i < 0:
+                    break
+                line = buf[:i].decode("utf-8", "replace").strip()
+                del buf[:i + 1]
+                if line.startswith(("OK @1 ID:", "OK @2 ID:")):
+                    fields = line[9:].split(":")
+                    if len(fields) >= 3 and fields[0] == DEVICE_KIND:
+                        return ClockInfo(port, fields[1], fields[2])
+            if len(buf) > MAX_LINE:
+                buf.clear()
+    return None
+
+
+def discover(ports=None, timeout=DISCOVER_TIMEOUT, workers=FLEET_WORKERS):
+    """Clocks among `ports` (default: every serial port), probed all at
+    once, so this takes about `timeout` however many ports there are.
+    Ports that fail to open, stay silent or answer something else are
+    left out; a port that opens slowly is given up at the deadline.
+    """
+    if ports is None:
+        ports = list_ports()
+    if not ports:
+        return []
+    deadline = time.monotonic() + timeout
+    pool = ThreadPoolExecutor(max_workers=max(1, min(workers, len(ports))))
+    futures = [pool.submit(probe, port, deadline) for port in ports]
+    done, _ = wait(futures, timeout + 0.5)
+    pool.shutdown(wait=False)
+    found = []
+    for future in futures:
+        if future in done and not future.exception() and future.result():
+            found.append(future.result())
+    return found
+
+
+class TimeSetResult:
+    """Outcome of precise_set(): what was written and how well."""
+
+    def __init__(self, dt, late_ms, uncertainty_ms, rtt_ms, readback_ok):
+        self.dt = dt
+        self.late_ms = late_ms
+        self.uncertainty_ms = uncertainty_ms
+        self.rtt_ms = rtt_ms
+        self.readback_ok = readback_ok
+
+    def __str__(self):
+        return (f"{self.dt.strftime('%Y-%m-%d %H:%M:%S')} UTC, residual {self.late_ms:+.2f} ms "
+                f"±{self.uncertainty_ms:.2f} ms (best RTT {self.rtt_ms:.1f} ms, "
+                f"read back {'ok' if self.readback_ok else 'MISMATCH'})")
+
+
+def measure_device_clock(request, samples=ECHO_SAMPLES):
+    """Offset between time.time() and device ticks_us, from ECHO.
+
+    `request(command, timeout)` returns (data, time.time() of the reply).
+    Each round trip bounds the device tick between send and receive; the
+    intersection of all bounds is the estimate. Returns (device tick at
+    host time t0, t0, uncertainty in us, best RTT in s). Lost round trips
+    are skipped as long as half of them answer.
+    """
+    lo, hi = -float("inf"), float("inf")
+    base = t0 = None
+    best_rtt = float("inf")
+    answered = 0
+    for _ in range(samples):
+        t1 = time.time()
+        try:
+            data, t4 = request("ECHO", 0.5)
+        except IOError:
+            continue
+        answered += 1
+        tick = int(data)
+        if base is None:
+            base, t0 = tick, t1
+        rel = (tick - base) % TICKS_PERIOD  # unwrapped, samples are close
+        lo = max(lo, rel - (t4 - t0) * 1e6)
+        hi = min(hi, rel - (t1 - t0) * 1e6)
+        best_rtt = min(best_rtt, t4 - t1)
+    if answered < max(1, samples // 2):
+        raise IOError(f"only {answered} of {samples} ECHO replies")
+    if lo > hi:
+        raise IOError("inconsistent round trips")
+    return base + (lo + hi) / 2, t0, (hi - lo) / 2, best_rtt
+
+
+def precise_set(request, ntp_result):
+    """Set the device RTC from an ntp_pool.NtpResult at a second boundary.
+
+    Host time is mapped onto device ticks, then NTP_SET is sent SET_LEAD
+    early with the tick at which its second starts; the device holds it
+    until then and replies with its lateness and the RTC read back.
+
+    A lost command or reply (or a set that arrives late) is retried up
+    to SET_ATTEMPTS times, each time with a fresh measurement: the old
+    tick mapping may be stale and a repeated set is harmless.
+    """
+    error = None
+    for attempt in range(SET_ATTEMPTS):
+        try:
+            return _precise_set_once(request, ntp_result)
+        except IOError as e:
+            error = e
+            log.debug("precise set attempt %d failed: %s", attempt + 1, e)
+    raise error
+
+
+def _precise_set_once(request, ntp_result):
+    tick0, t0, uncertainty, rtt = measure_device_clock(request)
+    target = int(ntp_result.now() + SET_LEAD) + 1
+    host_at = target - ntp_result.offset
+    at = int(tick0 + (host_at - t0) * 1e6) % TICKS_PERIOD
+    dt = datetime.fromtimestamp(target, tz=timezone.utc)
+    fields = (dt.year, dt.month, dt.day, dt.hour, dt.minute, dt.second)
+    command = "NTP_SET:" + ":".join(str(v) for v in fields) + f":{at}"
+    data, _ = request(command, SET_LEAD + 3)
+    late_us, *readback = (int(v) for v in data.split(":"))
+    return TimeSetResult(dt, late_us / 1000, uncertainty / 1000, rtt * 1000,
+                         tuple(readback) == fields)
+
+
+def load_melody_file(path):
+    """(name, packed bytes) from a .mel file or an RTTTL text file."""
+    if path.endswith(".mel"):
+        with open(path, "rb") as f:
+            data = f.read()
+        name = os.path.splitext(os.path.basename(path))[0]
+    else:
+        with open(path, encoding="utf-8") as f:
+            tune = melody.parse_rtttl(f.read())
+        data, name = bytes(tune.data), tune.name
+    return re.sub(r"[^A-Za-z0-9_-]", "_", name)[:24] or "tune", data
+
+
+def upload_melody(requests, name, data):
+    """Store a melody on the device (MEL_BEGIN/MEL_DATA/MEL_END) through
+    a RequestTable. At most UPLOAD_WINDOW data lines are in flight, so the
+    device's small UART buffer never overflows while it writes flash.
+    """
+    requests.call(f"MEL_BEGIN:{name}:{len(data)}")
+    window = deque()
+    for i in range(0, len(data), UPLOAD_CHUNK):
+        if len(window) >= UPLOAD_WINDOW:
+            requests.wait(window.popleft())
+        chunk = base64.b64encode(data[i:i + UPLOAD_CHUNK]).decode("ascii")
+        window.append(requests.submit(f"MEL_DATA:{chunk}"))
+    for future in window:
+        requests.wait(future)
+    requests.call(f"MEL_END:{frame.crc16(data):04x}")
+    return f"'{name}' uploaded ({len(data)} bytes)"
+
+
+class RequestTable:
+    """Correlates tagged commands with their replies.
+
+    submit() gives each command an @id and returns a Future that resolves
+    to (data, reply time) on "OK @id", or fails with IOError on "ERR @id"
+    or after `timeout`. Up to `max_in_flight` commands are on the wire at
+    once; later ones wait here and go out in order as replies come in.
+    `send(line)` writes one tagged line; the owner feeds replies to
+    resolve() and calls expire() regularly (e.g. on every read).
+    """
+
+    def __init__(self, send, max_in_flight=MAX_IN_FLIGHT):
+        self._send = send
+        self.max_in_flight = max_in_flight
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self._in_flight = {}  # rid -> [future, deadline, name]
+        self._backlog = deque()  # (rid, command, timeout, future)
+
+    @property
+    def depth(self):
+        return len(self._in_flight) + len(self._backlog)
+
+    def submit(self, command, timeout=REPLY_TIMEOUT):
+        future = Future()
+        with self._lock:
+            self._next_id = self._next_id % 9999 + 1
+            self._backlog.append((str(self._next_id), command, timeout, future))
+        self._pump()
+        return future
+
+    def call(self, command, timeout=REPLY_TIMEOUT):
+        """submit() and wait: returns (data, reply time)."""
+        return self.wait(self.submit(command, timeout), timeout)
+
+    def wait(self, future, timeout=REPLY_TIMEOUT):
+        # expire() normally fails the future at its deadline; this only
+        # guards against an owner that stopped calling it (e.g. while the
+        # port is gone). Each queued command may take `timeout`.
+        try:
+            return future.result(timeout * (self.depth + 1) + 1.0)
+        except FutureTimeout:
+            raise IOError("no reply") from None
+
+    def resolve(self, rid, ok, reply, rx_time):
+        """Complete the request `rid`; False if it is not ours."""
+        with self._lock:
+            entry = self._in_flight.pop(rid, None)
+        if entry is None:
+            return False
+        if ok:
+            entry[0].set_result((reply.partition(":")[2], rx_time))
+        else:
+            entry[0].set_exception(IOError(reply))
+        self._pump()
+        return True
+
+    def expire(self):
+        now = time.monotonic()
+        with self._lock:
+            late = [rid for rid, entry in self._in_flight.items() if entry[1] <= now]
+            entries = [self._in_flight.pop(rid) for rid in late]
+        for future, _, name in entries:
+            future.set_exception(IOError("no reply to " + name))
+        if entries:
+            self._pump()
+
+    def fail_all(self, error):
+        with self._lock:
+            entries = list(self._in_flight.values())
+            entries += [[f, 0, c] for _, c, _, f in self._backlog]
+            self._in_flight.clear()
+            self._backlog.clear()
+        for future, _, _ in entries:
+            future.set_exception(IOError(error))
+
+    def _pump(self):
+        while True:
+            with self._lock:
+                if not self._backlog or len(self._in_flight) >= self.max_in_flight:
+                    return
+                rid, command, timeout, future = self._backlog.popleft()
+                name = command.split(":")[0]
+                # The reply can race the send, so register first
+                self._in_flight[rid] = [future, time.monotonic() + timeout, name]
+            try:
+                self._send(f"@{rid} {command}")
+            except Exception as e:
+                with self._lock:
+                    self._in_flight.pop(rid, None)
+                future.set_exception(IOError(str(e)))
+
+
+class Connection:
+    """One long-lived serial port.
+
+    A background thread opens the port, reads it and, when it fails
+    (cable pulled, board reset), closes it and retries after BACKOFF_MIN
+    seconds, doubling up to BACKOFF_MAX. write() never fails because of
+    the link: while disconnected, or while older data is still queued,
+    data waits in a queue (at most QUEUE_MAX writes) and is flushed in
+    order after the reconnect.
+
+    on_data(data, rx_time) is called from the thread after every read,
+    with b"" on a read timeout, so callers can run their own timers.
+    on_state(connection) is called on every state change, before the
+    queue is flushed after a reconnect.
+
+    The byte that wakes a clock from light sleep is lost, so after
+    WAKE_IDLE_S without writes a WAKE_PREAMBLE goes out first, WAKE_DELAY
+    ahead of the data.
+
+    `opener(port, baudrate, timeout=...)` opens the port, serial.Serial
+    by default; serial_session.ReplayPort stands in for it without
+    hardware. With `recorder` set (a serial_session.SessionRecorder),
+    every byte read or written is recorded with its time.
+    """
+
+    def __init__(self, port, baudrate=BAUDRATE, on_data=None, on_state=None, opener=None):
+        self.port = port
+        self.baudrate = baudrate
+        self.on_data = on_data
+        self.on_state = on_state
+        self.opener = opener or serial.Serial
+        self.recorder = None
+        self.state = "closed"  # closed, connecting, open, reconnecting
+        self.last_error = None
+        self.reconnects = 0
+        self.next_attempt = 0.0  # time.monotonic() of the next reconnect
+        self._serial = None
+        self._last_tx = 0.0  # time.monotonic() of the last write
+        self._queue = deque()
+        self._lock = threading.Lock()  # orders writes against the flush
+        self._opened = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def queue_depth(self):
+        return len(self._queue)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._set_state("connecting")
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def wait_open(self, timeout):
+        return self._opened.wait(timeout)
+
+    def close(self):
+        self._stop.set()
+        self._drop()
+        self._set_state("closed")
+        if self.recorder:
+            self.recorder.close()
+
+    def set_port(self, port):
+        if port == self.port:
+            return
+        self.port = port
+        self._drop()  # The thread reconnects to the new port at once
+
+    def clear_queue(self):
+        with self._lock:
+            n = len(self._queue)
+            self._queue.clear()
+        return n
+
+    def write(self, data):
+        with self._lock:
+            if self._serial is None or self._queue:
+                if len(self._queue) >= QUEUE_MAX:
+                    raise IOError(f"{self.port}: send queue full")
+                self._queue.append(data)
+                return
+            try:
+                self._write(data)
+            except Exception as e:
+                self._queue.appendleft(data)
+                self._fail(e)
+
+    def _write(self, data):
+        # Caller holds self._lock
+        port = self._serial
+        if time.monotonic() - self._last_tx > WAKE_IDLE_S:
+            port.write(WAKE_PREAMBLE)
+            port.flush()
+            if self.recorder:
+                self.recorder.write(b">", WAKE_PREAMBLE)
+            time.sleep(WAKE_DELAY)
+        port.write(data)
+        port.flush()
+        self._last_tx = time.monotonic()
+        if self.recorder:
+            self.recorder.write(b">", data)
+
+    def _set_state(self, state):
+        self.state = state
+        if self.on_state:
+            self.on_state(self)
+
+    def _fail(self, error):
+        self.last_error = str(error)
+        self._drop()
+
+    def _drop(self):
+        port, self._serial = self._serial, None
+        self._opened.clear()
+        if port:
+            try:
+                port.close()
+            except Exception:
+                pass
+
+    def _flush(self):
+        with self._lock:
+            while self._queue and self._serial is not None:
+                try:
+                    self._write(self._queue[0])
+                except Exception as e:
+                    self._fail(e)
+                    return
+                self._queue.popleft()
+
+    def _run(self):
+        backoff = BACKOFF_MIN
+        while not self._stop.is_set():
+            try:
+                port = self.opener(self.port, self.baudrate, timeout=0.1)
+            except Exception as e:
+                self.last_error = str(e)
+                self.next_attempt = time.monotonic() + backoff
+                if self.state != "reconnecting":
+                    self._set_state("reconnecting")
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, BACKOFF_MAX)
+                continue
+            backoff = BACKOFF_MIN
+            with self._lock:
+                self._serial = port
+                self._last_tx = 0.0  # The board may have slept meanwhile
+            if self.state == "reconnecting":
+                self.reconnects += 1
+            if self.recorder:
+                self.recorder.write(b"!", self.port.encode("utf-8"))
+            self.last_error = None
+            self._set_state("open")
+            self._opened.set()
+            self._flush()
+            while not self._stop.is_set() and self._serial is port:
+                try:
+                    data = port.read(port.in_waiting or 1)
+                except Exception as e:
+                    if self._serial is port:
+                        self._fail(e)
+                    break
+                rx_time = time.time()
+                if data and self.recorder:
+                    self.recorder.write(b"<", data, rx_time)
+                if self.on_data:
+                    self.on_data(data, rx_time)
+            if not self._stop.is_set():
+                self.next_attempt = time.monotonic()
+                self._set_state("reconnecting")
+
+
+class ClockLink:
+    """One device on one serial port, text protocol only, over a
+    Connection that reconnects on its own.
+
+    Lines that are not replies to request() go to on_line(link, line),
+    and connection state changes to on_state(link), both called from the
+    reader thread. During on_line, link.rx_time is the time.time() at
+    which the line was read.
+    """
+
+    def __init__(self, port, baudrate=BAUDRATE, opener=None):
+        self.port = port
+        self.connection = Connection(port, baudrate, self._on_data, self._on_state, opener)
+        self.on_line = None
+        self.on_state = None
+        self.requests = RequestTable(self._send_line)
+        self._buf = bytearray()
+        self.rx_time = 0.0
+
+    @property
+    def state(self):
+        return self.connection.state
+
+    @property
+    def last_error(self):
+        return self.connection.last_error
+
+    def open(self):
+        """Start the connection; raises if the first attempt fails (it
+        keeps retrying in the background).
+        """
+        self.connection.start()
+        if not self.connection.wait_open(OPEN_WAIT):
+            raise IOError(self.connection.last_error or f"{self.port} not connected")
+
+    def close(self):
+        self.connection.close()
+        self.requests.fail_all(f"{self.port} closed")
+
+    def _send_line(self, line):
+        if self.connection.state == "closed":
+            raise IOError(f"{self.port} not open")
+        self.connection.write((line + "\n").encode("utf-8"))
+
+    def _on_state(self, connection):
+        if self.on_state:
+            self.on_state(self)
+
+    def _on_data(self, data, rx_time):
+        self.rx_time = rx_time
+        self.requests.expire()
+        buf = self._buf
+        buf += data
+        while True:
+            i = buf.find(b"\n")
+            if i < 0:
+                break
+            line = buf[:i].decode("utf-8", "replace").strip()
+            del buf[:i + 1]
+            if line:
+                self._handle_line(line)
+        if len(buf) > MAX_LINE:
+            buf.clear()
+
+    def _handle_line(self, line):
+        ok = line.startswith("OK ")
+        if ok or line.startswith("ERR "):
+            reply = line.partition(" ")[2]
+            if reply.startswith("@"):
+                rid, _, reply = reply[1:].partition(" ")
+                if self.requests.resolve(rid, ok, reply, self.rx_time):
+                    return
+        if self.on_line:
+            self.on_line(self, line)
+
+    def submit(self, command, timeout=REPLY_TIMEOUT):
+        """Future of (data, reply time); several may be in flight."""
+        return self.requests.submit(command, timeout)
+
+    def request(self, command, timeout=REPLY_TIMEOUT):
+        """Send `command` and wait for its reply: (data, time.time() when
+        the reply was read). Raises IOError on ERR or timeout. While
+        reconnecting the command is queued and counts against `timeout`.
+        """
+        return self.requests.call(command, timeout)
+
+    def set_alarm(self, hh, mm):
+        return self.request(f"ALARM_SET:{hh:02d}:{mm:02d}")[0]
+
+    def clear_alarm(self):
+        return self.request("ALARM_CLEAR")[0]
+
+    def alarm_status(self):
+        return self.request("ALARM_STATUS")[0]
+
+    def sync_time(self, ntp_result):
+        return precise_set(self.request, ntp_result)
+
+    def upload_melody(self, name, data):
+        return upload_melody(self.requests, name, data)
+
+
+class Fleet:
+    """Many ClockLinks driven in parallel. Every operation returns
+    {port: (ok, result or error text)} and never waits longer than
+    `timeout` in total; devices still busy then report a timeout.
+    """
+
+    def __init__(self, ports, workers=FLEET_WORKERS):
+        self.links = {port: ClockLink(port) for port in ports}
+        self._pool = ThreadPoolExecutor(max_workers=max(1, min(workers, len(self.links))))
+
+    def broadcast(self, operation, timeout=FLEET_TIMEOUT, on_result=None):
+        """Run operation(link) on every link. on_result(port, ok, result)
+        is called from a worker thread as each device finishes.
+        """
+        def run(link):
+            try:
+                result = (True, operation(link))
+            except Exception as e:
+                result = (False, str(e) or type(e).__name__)
+            if on_result:
+                on_result(link.port, *result)
+            return result
+
+        futures = {self._pool.submit(run, link): port for port, link in self.links.items()}
+        done, _ = wait(futures, timeout)
+        results = {}
+        for future, port in futures.items():
+            results[port] = future.result() if future in done else (False, "timeout")
+        return results
+
+    def record(self, directory):
+        """Record every link's traffic to its own session file."""
+        for port, link in self.links.items():
+            link.connection.recorder = SessionRecorder(session_path(directory, port))
+
+    def open_all(self, **kwargs):
+        def open_link(link):
+            link.open()
+            return "connected"
+        return self.broadcast(open_link, **kwargs)
+
+    def set_alarm(self, hh, mm, **kwargs):
+        return self.broadcast(lambda link: link.set_alarm(hh, mm), **kwargs)
+
+    def clear_alarm(self, **kwargs):
+        return self.broadcast(ClockLink.clear_alarm, **kwargs)
+
+    def alarm_status(self, **kwargs):
+        return self.broadcast(ClockLink.alarm_status, **kwargs)
+
+    def sync_time(self, ntp_result, **kwargs):
+        # One NTP result for all devices, so they agree with each other
+        return self.broadcast(lambda link: link.sync_time(ntp_result), **kwargs)
+
+    def close(self):
+        for link in self.links.values():
+            link.close()
+        self._pool.shutdown(wait=False)
+
+
+class ClockDaemon:
+    """Holds a Fleet open, resyncs every `resync_hours` and answers a
+    local HTTP API with JSON:
+
+        GET    /devices   state, last error and last sync per port
+        GET    /alarm     ALARM_STATUS of every device
+        POST   /alarm     {"time": "HH:MM"}
+        DELETE /alarm
+        POST   /sync      resync now
+        POST   /command   {"command": "TZ_GET"}, sent to every device
+
+    With `telemetry_s` set, every device is asked for TELEMETRY every
+    `telemetry_s` seconds (again after each reconnect, the board may have
+    reset) and the records are stored by a telemetry.Recorder.
+    """
+
+    def __init__(self, ports, servers=DEFAULT_SERVERS, resync_hours=RESYNC_HOURS,
+                 address=HTTP_ADDRESS, telemetry_s=0, telemetry_dir=telemetry.TELEMETRY_DIR):
+        self.fleet = Fleet(ports)
+        self.ntp_pool = NtpPool(servers)
+        self.resync_s = resync_hours * 3600
+        self.address = address
+        self.last_sync = {}  # port -> (ok, text, time.time())
+        self.last_telemetry = {}  # port -> record, see telemetry.FIELDS
+        self.telemetry_s = telemetry_s
+        self.recorder = telemetry.Recorder(telemetry_dir) if telemetry_s else None
+        if self.recorder:
+            for link in self.fleet.links.values():
+                link.on_state = self._start_telemetry
+                link.on_line = self._on_line
+        self._sync_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._http = None
+
+    def sync(self):
+        with self._sync_lock:
+            result = self.ntp_pool.query()
+            log.info("NTP %r", result)
+            results = self.fleet.sync_time(result)
+            now = time.time()
+            for port, (ok, text) in results.items():
+                self.last_sync[port] = (ok, str(text), now)
+                log.log(logging.INFO if ok else logging.WARNING, "%s: %s", port, text)
+            return results
+
+    def _start_telemetry(self, link):
+        # Reader thread: must not wait for the reply here
+        if link.state == "open":
+            future = link.submit(f"TELEMETRY:{self.telemetry_s}")
+            future.add_done_callback(lambda f: f.exception() and log.warning(
+                "%s: TELEMETRY failed: %s", link.port, f.exception()))
+
+    def _on_line(self, link, line):
+        if not line.startswith("TELEMETRY:"):
+            return
+        try:
+            values = telemetry.parse_line(line[10:])
+        except ValueError:
+            log.debug("%s: bad telemetry %r", link.port, line)
+            return
+        self.recorder.write(link.port, values, link.rx_time)
+        self.last_telemetry[link.port] = (link.rx_time,) + values
+
+    def _scheduler(self):
+        # Links reconnect on their own (Connection), so just resync
+        while not self._stop.is_set():
+            try:
+                self.sync()
+            except Exception as e:
+                log.error("resync failed: %s", e)
+            self._stop.wait(self.resync_s)
+
+    def api(self, method, path, body):
+        """(HTTP status, JSON-able object) for one request."""
+        fleet = self.fleet
+        if path == "/devices" and method == "GET":
+            return 200, {port: {"state": link.state, "last_error": link.last_error,
+                                "reconnects": link.connection.reconnects,
+                                "queued": link.connection.queue_depth,
+                                "last_sync": self.last_sync.get(port),
+                                "telemetry": self._telemetry_summary(port)}
+                         for port, link in fleet.links.items()}
+        if path == "/alarm" and method == "GET":
+            return 200, _results(fleet.alarm_status())
+        if path == "/alarm" and method == "POST":
+            hh, mm = (int(v) for v in body["time"].split(":"))
+            return 200, _results(fleet.set_alarm(hh, mm))
+        if path == "/alarm" and method == "DELETE":
+            return 200, _results(fleet.clear_alarm())
+        if path == "/sync" and method == "POST":
+            return 200, _results(self.sync())
+        if path == "/command" and method == "POST":
+            command = body["command"]
+            return 200, _results(fleet.broadcast(lambda link: link.request(command)[0]))
+        return 404, {"error": f"no route {method} {path}"}
+
+    def _telemetry_summary(self, port):
+        record = self.last_telemetry.get(port)
+        if record is None:
+            return None
+        return {"time": record[0], "drift_s": round(telemetry.drift(record), 3),
+                "temp_c": record[3] / 4, "mem_free": record[4], "loop_max_us": record[5]}
+
+    def serve_forever(self):
+        for port, (ok, result) in self.fleet.open_all().items():
+            if not ok:
+                log.warning("%s: %s (retrying)", port, result)
+        threading.Thread(target=self._scheduler, daemon=True).start()
+        self._http = ThreadingHTTPServer(self.address, _ApiHandler)
+        self._http.clock_daemon = self
+        log.info("API on http://%s:%d", *self.address)
+        try:
+            self._http.serve_forever()
+        finally:
+            self.stop()
+
+    def stop(self):
+        self._stop.set()
+        if self._http:
+            self._http.server_close()
+        self.fleet.close()
+        if self.recorder:
+            self.recorder.close()
+
+
+def _results(results):
+    return {port: {"ok": ok, "result": str(result)} for port, (ok, result) in results.items()}
+
+
+class _ApiHandler(BaseHTTPRequestHandler):
+    def _handle(self, method):
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length)) if length else {}
+            code, reply = self.server.clock_daemon.api(method, self.path, body)
+        except (ValueError, KeyError, TypeError) as e:
+            code, reply = 400, {"error": str(e) or type(e).__name__}
+        except Exception as e:
+            code, reply = 500, {"error": str(e) or type(e).__name__}
+        data = json.dumps(reply).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+    def log_message(self, format, *args):
+        log.debug(format, *args)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="clock_host", description="Control ESP32 alarm clocks over serial.")
+    parser.add_argument("--servers", type=lambda v: v.split(","), default=list(DEFAULT_SERVERS),
+                        help="comma-separated NTP servers (host or host:port)")
+    parser.add_argument("--timeout", type=float, default=FLEET_TIMEOUT, help="seconds per operation")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    parser.add_argument("--record", metavar="DIR", help="record every serial session (serial_session.py)")
+    sub = parser.add_subparsers(dest="action", required=True)
+    p = sub.add_parser("ports", help="list the clocks found on serial ports")
+    p.add_argument("--all", action="store_true", help="list every port without probing")
+    p.add_argument("--wait", type=float, default=DISCOVER_TIMEOUT, help="seconds to wait for replies")
+    for name in ("status", "alarm-clear", "sync"):
+        sub.add_parser(name).add_argument("ports", nargs="+")
+    p = sub.add_parser("alarm-set")
+    p.add_argument("time", help="HH:MM")
+    p.add_argument("ports", nargs="+")
+    p = sub.add_parser("send", help="send a raw command, e.g. TZ_GET")
+    p.add_argument("command")
+    p.add_argument("ports", nargs="+")
+    p = sub.add_parser("upload", help="upload a .mel or RTTTL melody")
+    p.add_argument("file")
+    p.add_argument("ports", nargs="+")
+    p = sub.add_parser("daemon", help="keep ports open, resync, serve the HTTP API")
+    p.add_argument("--resync-hours", type=float, default=RESYNC_HOURS)
+    p.add_argument("--http", default="%s:%d" % HTTP_ADDRESS, help="HOST:PORT of the API")
+    p.add_argument("--telemetry", type=int, default=0, metavar="SECONDS",
+                   help="record device telemetry at this period (0: off)")
+    p.add_argument("--telemetry-dir", default=telemetry.TELEMETRY_DIR)
+    p.add_argument("ports", nargs="+")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format="%(asctime)s %(levelname)s %(message)s")
+
+    if args.action == "ports":
+        if args.all:
+            for port in list_ports():
+                print(port)
+        else:
+            for clock in discover(timeout=args.wait):
+                print(clock)
+        return 0
+    if args.action == "daemon":
+        host, _, port = args.http.rpartition(":")
+        daemon = ClockDaemon(args.ports, args.servers, args.resync_hours, (host, int(port)),
+                             args.telemetry, args.telemetry_dir)
+        if args.record:
+            daemon.fleet.record(args.record)
+        try:
+            daemon.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    if args.action == "upload":
+        try:
+            name, data = load_melody_file(args.file)
+        except (OSError, ValueError) as e:
+            parser.error(f"{args.file}: {e}")
+    fleet = Fleet(args.ports)
+    if args.record:
+        fleet.record(args.record)
+    try:
+        results = {port: r for port, r in fleet.open_all(timeout=args.timeout).items() if not r[0]}
+        kwargs = {"timeout": args.timeout}
+        if args.action == "status":
+            operation = fleet.alarm_status
+        elif args.action == "alarm-clear":
+            operation = fleet.clear_alarm
+        elif args.action == "alarm-set":
+            hh, mm = (int(v) for v in args.time.split(":"))
+            operation = lambda **kw: fleet.set_alarm(hh, mm, **kw)
+        elif args.action == "sync":
+            ntp_result = NtpPool(args.servers).query()
+            log.info("NTP %r", ntp_result)
+            operation = lambda **kw: fleet.sync_time(ntp_result, **kw)
+        elif args.action == "send":
+            operation = lambda **kw: fleet.broadcast(lambda link: link.request(args.command)[0], **kw)
+        else:
+            operation = lambda **kw: fleet.broadcast(lambda link: link.upload_melody(name, data), **kw)
+        for port, result in operation(**kwargs).items():
+            results.setdefault(port, result)
+    finally:
+        fleet.close()
+    for port, (ok, result) in sorted(results.items()):
+        print(f"{port}: {'ok' if ok else 'error'} {result}")
+    return 0 if all(ok for ok, _ in results.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
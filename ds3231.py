@@ -8,7 +8,14 @@ class DS3231:
     def _dec2bcd(self, dec): return ((dec // 10) << 4) + (dec % 10)
 
     def read_time(self):
-        data = self.i2c.readfrom_mem(self.addr, 0x00, 7)
+        return self.decode(self.i2c.readfrom_mem(self.addr, 0x00, 7))
+
+    def read_raw(self, buf):
+        # Registers 0x00-0x06 (BCD) into a preallocated 7-byte buffer
+        self.i2c.readfrom_mem_into(self.addr, 0x00, buf)
+        return buf
+
+    def decode(self, data):
         return (
             self._bcd2dec(data[6]) + 2000,
             self._bcd2dec(data[5]),
@@ -30,3 +37,28 @@ class DS3231:
             self._dec2bcd(year - 2000)
         ]))
 
+
+    # Alarm 2 / INT pin (used as a wake source by power.py)
+    def alarm2_every_minute(self):
+        # A2M2..A2M4 set: alarm fires at second 00 of every minute
+        self.i2c.writeto_mem(self.addr, 0x0B, b'\x80\x80\x80')
+        self.clear_alarm_flags()
+        ctrl = self.i2c.readfrom_mem(self.addr, 0x0E, 1)[0]
+        self.i2c.writeto_mem(self.addr, 0x0E, bytes([ctrl | 0x06]))  # INTCN | A2IE
+
+    def disable_alarm_interrupts(self):
+        ctrl = self.i2c.readfrom_mem(self.addr, 0x0E, 1)[0]
+        self.i2c.writeto_mem(self.addr, 0x0E, bytes([ctrl & ~0x03]))
+
+    def clear_alarm_flags(self):
+        # INT stays low until A1F/A2F are cleared
+        status = self.i2c.readfrom_mem(self.addr, 0x0F, 1)[0]
+        self.i2c.writeto_mem(self.addr, 0x0F, bytes([status & ~0x03]))
+
+    def temperature(self):
+        # Signed MSB plus two fraction bits, in 1/4 degC steps
+        data = self.i2c.readfrom_mem(self.addr, 0x11, 2)
+        t = (data[0] << 2) | (data[1] >> 6)
+        if t & 0x200:
+            t -= 0x400
+        return t / 4
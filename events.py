@@ -0,0 +1,99 @@
+# events.py
+# Allocation-free ring buffer of timestamped input events, filled from
+# the encoder and button IRQs and drained by the main loop.
+from array import array
+from machine import idle
+from time import ticks_ms, ticks_diff
+
+EV_DELTA = 1  # value: signed change of the encoder value
+EV_PRESS = 2  # button down; clicks are taken from EV_RELEASE
+EV_RELEASE = 3  # value: press duration in ms
+EV_LONG_PRESS = 4  # value: press duration in ms, follows EV_RELEASE
+
+EVENT_SLOTS = 32
+LONG_PRESS_MS = 800
+BUTTON_DEBOUNCE_MS = 30
+
+
+class InputEvents:
+    def __init__(self, size=EVENT_SLOTS):
+        self._size = size
+        self._kind = bytearray(size)
+        self._value = array("i", [0] * size)
+        self._time = array("i", [0] * size)
+        self._head = 0  # next write (IRQ side)
+        self._tail = 0  # next read (main loop)
+        self.dropped = 0
+        self.value = 0  # of the event get() returned last
+        self.time = 0
+        self._down = False
+        self._down_at = 0
+        self._edge_at = 0
+
+    def push(self, kind, value=0):
+        """Queue an event. Safe to call from IRQ context; never allocates."""
+        head = self._head
+        nxt = head + 1
+        if nxt == self._size:
+            nxt = 0
+        if nxt == self._tail:
+            self.dropped += 1
+            return
+        self._kind[head] = kind
+        self._value[head] = value
+        self._time[head] = ticks_ms() & 0x3FFFFFFF
+        self._head = nxt
+
+    def pending(self):
+        return self._head != self._tail
+
+    def get(self):
+        """Pop the oldest event and return its kind, 0 if there is none.
+        Its value and ticks_ms are left in self.value and self.time.
+        """
+        tail = self._tail
+        if tail == self._head:
+            return 0
+        kind = self._kind[tail]
+        self.value = self._value[tail]
+        self.time = self._time[tail]
+        tail += 1
+        self._tail = 0 if tail == self._size else tail
+        return kind
+
+    def wait(self, timeout_ms):
+        """Idle until an event is queued or `timeout_ms` has passed."""
+        # idle() stops the CPU until the next interrupt, so this returns
+        # right after the IRQ that queued the event. The drain is not
+        # handed to micropython.schedule: the handlers draw on the LCD,
+        # which the main loop may be half-way through writing.
+        start = ticks_ms()
+        while self._head == self._tail and ticks_diff(ticks_ms(), start) < timeout_ms:
+            idle()
+
+    def clear(self):
+        self._tail = self._head
+
+    # IRQ feeders
+
+    def button_irq(self, pin):
+        """Pin IRQ handler for an active-low button on both edges."""
+        now = ticks_ms()
+        if ticks_diff(now, self._edge_at) < BUTTON_DEBOUNCE_MS:
+            return
+        self._edge_at = now
+        if not pin.value():
+            if not self._down:
+                self._down = True
+                self._down_at = now
+                self.push(EV_PRESS)
+        elif self._down:
+            self._down = False
+            held = ticks_diff(now, self._down_at)
+            self.push(EV_RELEASE, held)
+            if held >= LONG_PRESS_MS:
+                self.push(EV_LONG_PRESS, held)
+
+    def rotary_delta(self, delta):
+        """Sink for Rotary: called from its IRQ with the value change."""
+        self.push(EV_DELTA, delta)
@@ -0,0 +1,41 @@
+# fmt.py
+# Allocation-free formatting into preallocated bytearray line buffers.
+#
+# Numbers are written with a two-digit lookup table, so redrawing the
+# clock or a menu line creates no str objects.
+
+# b"00010203...99": digits of n at _D2[2n], _D2[2n + 1]
+_D2 = bytearray(200)
+for _n in range(100):
+    _D2[2 * _n] = 48 + _n // 10
+    _D2[2 * _n + 1] = 48 + _n % 10
+_D2 = bytes(_D2)
+SPACE = 32
+
+
+def put2(buf, pos, n):
+    """Write 0 <= n <= 99 as two digits at buf[pos]."""
+    n <<= 1
+    buf[pos] = _D2[n]
+    buf[pos + 1] = _D2[n + 1]
+
+
+def put4(buf, pos, n):
+    """Write 0 <= n <= 9999 as four digits at buf[pos]."""
+    put2(buf, pos, n // 100)
+    put2(buf, pos + 2, n % 100)
+
+
+def fill(buf, text, pos=0, end=None):
+    """Copy bytes `text` into buf[pos:] and pad with spaces up to `end`."""
+    if end is None:
+        end = len(buf)
+    i = pos
+    for c in text:
+        if i >= end:
+            return
+        buf[i] = c
+        i += 1
+    while i < end:
+        buf[i] = SPACE
+        i += 1
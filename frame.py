@@ -0,0 +1,172 @@
+# frame.py
+# Binary framed protocol shared by main.py (MicroPython) and the host app.
+#
+# Frame:  A5 | len:u16le | seq:u8 | type:u8 | payload[len] | crc:u16le
+# The CRC-16/CCITT-FALSE covers len..payload. Every frame except ACK is
+# acknowledged with ACK(seq, status); the sender retransmits on timeout
+# and the receiver drops (but re-ACKs) a repeated sequence number.
+#
+# Both ends start in text mode. "BIN" switches the device to frames once
+# it has replied "OK BIN:<version>"; a MODE_TEXT frame switches back.
+import struct
+
+VERSION = 1
+SYNC = 0xA5
+MAX_PAYLOAD = 1024
+
+# Frame types
+ACK = 0x01  # payload: acked seq u8, status u8
+MODE_TEXT = 0x02
+TEXT = 0x03  # payload: utf-8 text command or reply line
+TIME_SET = 0x10  # payload: TIME
+TIME_GET = 0x11
+TIME = 0x12
+ALARM_SET = 0x20  # payload: hh u8, mm u8
+ALARM_CLEAR = 0x21
+ALARM_TABLE_GET = 0x22
+ALARM_TABLE = 0x23  # payload: count u8, count * ALARM_ENTRY
+TELEMETRY_GET = 0x30
+TELEMETRY = 0x31  # payload: TELEMETRY_FMT
+
+# ACK status codes
+ST_OK = 0
+ST_ERROR = 1
+ST_UNKNOWN = 2
+
+TIME_FMT = "<HBBBBB"  # y, m, d, hh, mm, ss
+ALARM_ENTRY_FMT = "<BBB"  # hh, mm, flags
+ALARM_ENABLED = 0x01
+ALARM_PLAYING = 0x02
+ALARM_PAUSED = 0x04
+ALARM_SNOOZED = 0x08
+EPOCH_2000 = 0x40  # TELEMETRY flags: epoch of the rtc seconds
+EPOCH_1970 = 0x80
+# rtc seconds (UTC, device epoch), ticks_ms, temp in 1/4 degC, free heap,
+# worst loop time in us, alarm flags | EPOCH_2000 or EPOCH_1970
+TELEMETRY_FMT = "<IIhIIB"
+
+_HEADER = 5  # sync, len, seq, type
+
+
+def _crc_table():
+    table = []
+    for i in range(256):
+        crc = i << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else crc << 1
+        table.append(crc & 0xFFFF)
+    return table
+
+
+_CRC_TABLE = _crc_table()
+
+
+def crc16(data, crc=0xFFFF):
+    table = _CRC_TABLE
+    for b in data:
+        crc = ((crc << 8) & 0xFFFF) ^ table[((crc >> 8) ^ b) & 0xFF]
+    return crc
+
+
+def encode(seq, ftype, payload=b""):
+    n = len(payload)
+    if n > MAX_PAYLOAD:
+        raise ValueError("payload too long")
+    body = bytes((n & 0xFF, n >> 8, seq & 0xFF, ftype)) + bytes(payload)
+    crc = crc16(body)
+    return bytes((SYNC,)) + body + bytes((crc & 0xFF, crc >> 8))
+
+
+def encode_ack(seq, ack_seq, status=ST_OK):
+    return encode(seq, ACK, bytes((ack_seq & 0xFF, status)))
+
+
+class FrameDecoder:
+    """Incremental decoder. feed() bytes in any chunking; on_frame(seq,
+    type, payload) is called for every frame with a valid CRC. Garbage
+    and corrupt frames are skipped by resyncing on the next SYNC byte.
+    """
+
+    def __init__(self, on_frame, max_payload=MAX_PAYLOAD):
+        self.on_frame = on_frame
+        self._buf = bytearray(_HEADER + max_payload + 2)
+        self._max = max_payload
+        self._n = 0
+        self._need = 1
+        self.crc_errors = 0
+
+    def reset(self):
+        self._n = 0
+        self._need = 1
+
+    def feed(self, data):
+        for b in data:
+            self.feed_byte(b)
+
+    def feed_byte(self, b):
+        pending = self._step(b)
+        # After a bad frame, rescan the bytes that followed its SYNC for
+        # another frame start. A loop, not recursion: a garbage burst
+        # would exceed MicroPython's small recursion limit.
+        i = 0
+        while pending is not None and i < len(pending):
+            more = self._step(pending[i])
+            i += 1
+            if more is not None:
+                pending, i = more + pending[i:], 0
+
+    def _step(self, b):
+        # Returns None, or the bytes to rescan after a bad frame
+        buf = self._buf
+        if self._n == 0 and b != SYNC:
+            return
+        buf[self._n] = b
+        self._n += 1
+        if self._n < self._need:
+            return
+        if self._n == 1:
+            self._need = _HEADER
+            return
+        if self._n == _HEADER and self._need == _HEADER:
+            length = buf[1] | (buf[2] << 8)
+            if length > self._max:
+                return self._resync()
+            self._need = _HEADER + length + 2
+            return
+        # Complete frame
+        end = self._need - 2
+        crc = buf[end] | (buf[end + 1] << 8)
+        if crc16(memoryview(buf)[1:end]) != crc:
+            self.crc_errors += 1
+            return self._resync()
+        seq, ftype = buf[3], buf[4]
+        payload = bytes(buf[_HEADER:end])
+        self.reset()
+        self.on_frame(seq, ftype, payload)
+
+    def _resync(self):
+        pending = bytes(self._buf[1:self._n])
+        self.reset()
+        return pending
+
+
+def pack_time(dt):
+    return struct.pack(TIME_FMT, *dt[:6])
+
+
+def unpack_time(payload):
+    return struct.unpack(TIME_FMT, payload)
+
+
+def pack_alarms(alarms):
+    """`alarms` is a list of (hh, mm, flags)."""
+    out = bytes((len(alarms),))
+    for a in alarms:
+        out += struct.pack(ALARM_ENTRY_FMT, *a)
+    return out
+
+
+def unpack_alarms(payload):
+    size = struct.calcsize(ALARM_ENTRY_FMT)
+    return [struct.unpack_from(ALARM_ENTRY_FMT, payload, 1 + i * size)
+            for i in range(payload[0])]
@@ -34,7 +34,11 @@ class I2cLcd(LcdApi):
     def __init__(self, i2c, i2c_addr, num_lines, num_columns): 
         self.i2c = i2c 
         self.i2c_addr = i2c_addr 
-        self.i2c.writeto(self.i2c_addr, bytearray([0])) 
+        # Preallocated transfer buffers: writes never allocate
+        self._buf1 = bytearray(1)
+        self._buf2 = bytearray(2)
+        self._buf4 = bytearray(4)
+        self.i2c.writeto(self.i2c_addr, self._buf1) 
         sleep_ms(20)   # Allow LCD time to powerup 
         
         # Send reset 3 times 
@@ -92,29 +96,35 @@ class I2cLcd(LcdApi):
     # The rest of the methods remain the same as in your original file
     def hal_write_init_nibble(self, nibble): 
         byte = ((nibble >> 4) & 0x0f) << SHIFT_DATA 
-        self.i2c.writeto(self.i2c_addr, bytearray([byte | MASK_E])) 
-        self.i2c.writeto(self.i2c_addr, bytearray([byte])) 
+        buf = self._buf2
+        buf[0] = byte | MASK_E
+        buf[1] = byte
+        self.i2c.writeto(self.i2c_addr, buf) 
         
     def hal_backlight_on(self): 
-        self.i2c.writeto(self.i2c_addr, bytearray([1 << SHIFT_BACKLIGHT])) 
+        self._buf1[0] = 1 << SHIFT_BACKLIGHT
+        self.i2c.writeto(self.i2c_addr, self._buf1) 
         
     def hal_backlight_off(self): 
-        self.i2c.writeto(self.i2c_addr, bytearray([0])) 
+        self._buf1[0] = 0
+        self.i2c.writeto(self.i2c_addr, self._buf1) 
+
+    def _write_byte(self, rs, value):
+        # Both nibbles with their E strobes in one I2C transaction; the
+        # PCF8574 latches each byte onto its outputs as it arrives.
+        hi = rs | (self.backlight << SHIFT_BACKLIGHT) | (((value >> 4) & 0x0f) << SHIFT_DATA)
+        lo = rs | (self.backlight << SHIFT_BACKLIGHT) | ((value & 0x0f) << SHIFT_DATA)
+        buf = self._buf4
+        buf[0] = hi | MASK_E
+        buf[1] = hi
+        buf[2] = lo | MASK_E
+        buf[3] = lo
+        self.i2c.writeto(self.i2c_addr, buf)
         
     def hal_write_command(self, cmd): 
-        byte = ((self.backlight << SHIFT_BACKLIGHT) | (((cmd >> 4) & 0x0f) << SHIFT_DATA)) 
-        self.i2c.writeto(self.i2c_addr, bytearray([byte | MASK_E])) 
-        self.i2c.writeto(self.i2c_addr, bytearray([byte])) 
-        byte = ((self.backlight << SHIFT_BACKLIGHT) | ((cmd & 0x0f) << SHIFT_DATA)) 
-        self.i2c.writeto(self.i2c_addr, bytearray([byte | MASK_E])) 
-        self.i2c.writeto(self.i2c_addr, bytearray([byte])) 
+        self._write_byte(0, cmd)
         if cmd <= 3: 
             sleep_ms(5) 
             
     def hal_write_data(self, data): 
-        byte = (MASK_RS | (self.backlight << SHIFT_BACKLIGHT) | (((data >> 4) & 0x0f) << SHIFT_DATA)) 
-        self.i2c.writeto(self.i2c_addr, bytearray([byte | MASK_E])) 
-        self.i2c.writeto(self.i2c_addr, bytearray([byte])) 
-        byte = (MASK_RS | (self.backlight << SHIFT_BACKLIGHT) | ((data & 0x0f) << SHIFT_DATA)) 
-        self.i2c.writeto(self.i2c_addr, bytearray([byte | MASK_E])) 
-        self.i2c.writeto(self.i2c_addr, bytearray([byte]))
+        self._write_byte(MASK_RS, data)
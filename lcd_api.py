@@ -133,6 +133,21 @@ class LcdApi:
         """ 
         for char in string: 
             self.putchar(char) 
+    def putbytes(self, data): 
+        """Write raw character codes from a bytes/bytearray at the current 
+        cursor position. Does no character mapping or newline handling and 
+        does not allocate, so preformatted line buffers can be redrawn 
+        cheaply. 
+        """ 
+        for code in data: 
+            self.hal_write_data(code) 
+        self.cursor_x += len(data) 
+        if self.cursor_x >= self.num_columns: 
+            self.cursor_x = 0 
+            self.cursor_y += 1 
+            if self.cursor_y >= self.num_lines: 
+                self.cursor_y = 0 
+            self.move_to(self.cursor_x, self.cursor_y) 
     def custom_char(self, location, charmap): 
         """Write a character to one of the 8 CGRAM locations, available 
         as chr(0) through chr(7). 
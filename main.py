@@ -1,32 +1,57 @@
 # FINAL WORKING CODE (25-06-2025)
-from machine import Pin, SoftI2C
-from time import sleep, ticks_ms, localtime, mktime
-import sys
-import select
+from machine import Pin, SoftI2C, unique_id
+from time import sleep, ticks_ms, ticks_us, ticks_diff, ticks_add, mktime, gmtime
 import rotary_irq_esp
 import network
-import ntptime
+import sntp
+from tz import TimeZone, DEFAULT_TZ, epoch_days
 from ds3231 import DS3231
+from power import IdleManager
+from stats import Stats
+from events import InputEvents, EV_DELTA, EV_RELEASE, EV_LONG_PRESS, LONG_PRESS_MS
+from uart_server import CommandServer, LATER
 from i2c_lcd import I2cLcd
-from sound import GORILLACELL_BUZZER, mario
+from sound import GORILLACELL_BUZZER, Sequencer, Envelope
+import os
+import ubinascii
+from melody import Melody, Upload, load_library, open_file, list_files, melody_path, valid_name
+import songs
 import esp32
+import gc
+import struct
+from array import array
+import frame
+from fmt import put2, put4, fill
 
 # Configuration
+DEVICE_KIND = "alarmclock"  # first field of the ID reply, hosts probe for it
+FIRMWARE_VERSION = "1"
 I2C_ADDR = 0x27
 I2C_NUM_ROWS = 4
 I2C_NUM_COLS = 20
 WIFI_SSID = "Your WIFI_SSID"
 WIFI_PASS = "Your WIFI_PASS"
-TIMEZONE_OFFSET = 3  # UTC+3 (Odessa)
-DEBOUNCE_MS = 300  # Button debounce time
-ENCODER_DEBOUNCE_MS = 50  # Encoder rotation debounce time
+TIMEZONE = DEFAULT_TZ  # POSIX TZ string, RTC itself is kept in UTC
+TZ_MAX = 64  # longest TZ string stored in NVS, sizes the load buffer
 SNOOZE_MINUTES = 5
 ALARM_DURATION = 300  # 5 minutes in seconds
-MELODY_SPEED = 150  # Note duration in ms for Mario theme
-MELODY_DUTY = 32767  # PWM duty cycle for buzzer
+ALARM_TUNE = "mario"  # Default tune: uploaded .mel, tunes.txt (RTTTL) or built-in
+MELODY_DUTY = 32767  # PWM duty cycle for buzzer (full volume)
+ALARM_START_DUTY = 1500  # Alarm starts quiet ...
+ALARM_RAMP_MS = 60000  # ... and reaches MELODY_DUTY after this long
+NOTE_ATTACK = (96, 192)  # Per-note levels (/256) every NOTE_STEP_MS, () = off
+NOTE_DECAY = (160, 64)
+NOTE_STEP_MS = 8
+IDLE_SLEEP_MS = 30000  # Light sleep after this long without input
+EDIT_ACCEL = 8  # Steps per detent when spinning fast while editing a value
+SLEEP_BACKLIGHT_OFF = True
+MAX_SET_AHEAD_US = 2000000  # a timed NTP_SET may arrive at most this early
+NTP_SET_SPIN_MS = 30  # the main loop spins for a timed NTP_SET from this close
+TELEMETRY_MIN_S = 1  # shortest TELEMETRY report period
 
 # Pins
 BUZZER_PIN = 4  # D4
+RTC_INT_PIN = 27  # DS3231 INT/SQW, must be an RTC GPIO for ext0 wake
 
 # NVS Initialization
 nvs = esp32.NVS("alarm_settings")
@@ -40,6 +65,9 @@ try:
     rtc = DS3231(i2c)
     buzzer = GORILLACELL_BUZZER(BUZZER_PIN)
     buzzer.pwm.duty_u16(0)  # Explicitly silence buzzer at startup
+    sequencer = Sequencer(buzzer)
+    alarm_envelope = Envelope(MELODY_DUTY, ALARM_START_DUTY, ALARM_RAMP_MS,
+                              attack=NOTE_ATTACK, decay=NOTE_DECAY, step_ms=NOTE_STEP_MS)
     encoder = rotary_irq_esp.RotaryIRQ(18, 19, min_val=0, max_val=1, range_mode=rotary_irq_esp.RotaryIRQ.RANGE_BOUNDED)
     encoder_button = Pin(23, Pin.IN, Pin.PULL_UP)
 except Exception as e:
@@ -55,16 +83,13 @@ STATE_MAIN = 0
 STATE_NTP_MENU = 1
 STATE_RTC_MENU = 2
 STATE_ALARM_CONTROL = 3
+STATE_EDIT = 4
 
 current_state = STATE_MAIN
 current_pos = 0
 menu_offset = 0
-button_pressed = False
-last_button_time = 0
-last_encoder_time = 0
-last_encoder_val = 0
-display_time = ""
-display_date = ""
+shown_ss = -1  # Raw BCD seconds last drawn; -1 forces a redraw
+shown_day = -1
 ntp_sync_result = None
 alarm_time = None
 alarm_active = False
@@ -73,9 +98,14 @@ alarm_paused = False
 snooze_time = None
 last_alarm_check = 0
 alarm_start_time = 0
-note_index = 0
-last_note_time = 0
 force_display_refresh = False
+tz = TimeZone(TIMEZONE)
+alarm_tune = ALARM_TUNE
+edit_fields = ()  # STATE_EDIT: (label, min, max, range mode) per field
+edit_values = []
+edit_index = 0
+edit_apply = None  # Called with edit_values after the last field
+ntp_set_pending = None  # (rid, name, fields, at) of a timed NTP_SET, see finish_ntp_set
 
 def load_alarm_settings():
     global alarm_time, alarm_active
@@ -94,6 +124,64 @@ def load_alarm_settings():
         alarm_time = None
         alarm_active = False
 
+def load_timezone():
+    global tz
+    try:
+        buf = bytearray(TZ_MAX)
+        n = nvs.get_blob("tz", buf)
+        tz = TimeZone(bytes(buf[:n]).decode())
+    except Exception as e:
+        print("NVS tz load error:", e)
+        tz = TimeZone(TIMEZONE)
+
+def save_timezone(spec):
+    global tz
+    data = spec.encode()
+    if len(data) > TZ_MAX:
+        raise ValueError("longer than {} bytes".format(TZ_MAX))
+    tz = TimeZone(spec)  # Raises ValueError before anything is stored
+    nvs.set_blob("tz", data)
+    nvs.commit()
+
+_rtc_raw = bytearray(7)
+_local = array("H", (0, 0, 0, 0, 0, 0))  # y, m, d, hh, mm, ss
+
+def local_from_raw(raw):
+    # BCD registers straight into _local: small integers only, no tuples,
+    # so the once-a-second callers allocate nothing. Callers that keep
+    # the result must copy it.
+    b = raw[6]
+    y = (b >> 4) * 10 + (b & 15) + 2000
+    b = raw[5] & 0x1F  # Bit 7 is the century flag
+    m = (b >> 4) * 10 + (b & 15)
+    b = raw[4]
+    d = (b >> 4) * 10 + (b & 15)
+    b = raw[2] & 0x3F  # 24-hour mode
+    sod = ((b >> 4) * 10 + (b & 15)) * 3600
+    b = raw[1]
+    sod += ((b >> 4) * 10 + (b & 15)) * 60
+    b = raw[0]
+    sod += (b >> 4) * 10 + (b & 15)
+    return tz.local_into(_local, epoch_days(y, m, d), sod)
+
+def load_alarm_tune():
+    global alarm_tune
+    try:
+        buf = bytearray(32)
+        n = nvs.get_blob("alarm_tune", buf)
+        alarm_tune = bytes(buf[:n]).decode()
+    except Exception:
+        alarm_tune = ALARM_TUNE  # Never set
+
+def save_alarm_tune(name):
+    global alarm_tune
+    nvs.set_blob("alarm_tune", name.encode())
+    nvs.commit()
+    alarm_tune = name
+
+def read_local_time():
+    return local_from_raw(rtc.read_raw(_rtc_raw))
+
 def save_alarm_settings():
     try:
         if alarm_time:
@@ -112,20 +200,39 @@ def save_alarm_settings():
         lcd.putstr("NVS Save Error")
         sleep(1)
 
-def handle_button(pin):
-    global button_pressed, last_button_time
-    now = ticks_ms()
-    if now - last_button_time > DEBOUNCE_MS:
-        button_pressed = True
-        last_button_time = now
-
-encoder_button.irq(trigger=Pin.IRQ_FALLING, handler=handle_button)
+_BOTH_EDGES = Pin.IRQ_RISING | Pin.IRQ_FALLING
+events = InputEvents()
+encoder_button.irq(trigger=_BOTH_EDGES, handler=events.button_irq)
+encoder.set_event_sink(events.rotary_delta)
 
-def format_time(hh, mm, ss):
-    return f"{hh:02d}:{mm:02d}:{ss:02d}"
+power = IdleManager([
+    (encoder_button, events.button_irq, _BOTH_EDGES),
+    (encoder._pin_clk, encoder._process_rotary_pins, _BOTH_EDGES),
+    (encoder._pin_dt, encoder._process_rotary_pins, _BOTH_EDGES),
+], int_pin=RTC_INT_PIN, idle_ms=IDLE_SLEEP_MS)
+stats = Stats({"lcd": lcd, "rtc": rtc})
+try:
+    rtc.alarm2_every_minute()
+except Exception as e:
+    print("RTC alarm setup error:", e)
 
-def format_date(d, m, y):
-    return f"{d:02d}.{m:02d}.{y}"
+# Preallocated display lines, updated in place (see fmt.py)
+_time_line = bytearray(b"Time:      00:00:00")
+_date_line = bytearray(b"Date:    00.00.0000")
+_menu_line = bytearray(20)
+_BLANK_LINE = b" " * 20
+_STATUS_PLAYING = b"Status: PLAYING"
+_STATUS_PAUSED = b"Status: PAUSED"
+MAIN_MENU = (b"Get NTP Time", b"Get RTC Time", b"Set Alarm")
+NTP_MENU = (b"Sync with NTP", b"Save to RTC", b"Back")
+RTC_MENU = (b"View RTC Time", b"Set RTC Time", b"Back")
+_WRAP = rotary_irq_esp.RotaryIRQ.RANGE_WRAP
+_BOUNDED = rotary_irq_esp.RotaryIRQ.RANGE_BOUNDED
+ALARM_EDIT = ((b"Alarm hour", 0, 23, _WRAP), (b"Alarm minute", 0, 59, _WRAP))
+RTC_EDIT = ((b"Year", 2000, 2099, _BOUNDED), (b"Month", 1, 12, _WRAP), (b"Day", 1, 31, _WRAP),
+            (b"Hour", 0, 23, _WRAP), (b"Minute", 0, 59, _WRAP))
+ALARM_MENU = (b"Pause/Resume", b"Stop", b"Snooze")
+MENU_ROWS = 2
 
 def add_minutes_to_time(hh, mm, add_minutes):
     total_minutes = hh * 60 + mm + add_minutes
@@ -133,69 +240,86 @@ def add_minutes_to_time(hh, mm, add_minutes):
     new_mm = total_minutes % 60
     return (new_hh, new_mm)
 
+def draw_date(d, m, y):
+    global shown_day
+    day = (y << 9) | (m << 5) | d
+    if day != shown_day or force_display_refresh:
+        shown_day = day
+        put2(_date_line, 9, d)
+        put2(_date_line, 12, m)
+        put4(_date_line, 15, y)
+        lcd.move_to(0, 1)
+        lcd.putbytes(_date_line)
+
 def update_clock_display():
-    global display_time, display_date
+    global shown_ss
     try:
-        y, m, d, hh, mm, ss = rtc.read_time()
-        new_time = format_time(hh, mm, ss)
-        new_date = format_date(d, m, y)
-        if new_time != display_time or force_display_refresh:
-            display_time = new_time
-            lcd.move_to(0, 0)
-            lcd.putstr(f"Time: {display_time:>13}")
-        if new_date != display_date or force_display_refresh:
-            display_date = new_date
-            lcd.move_to(0, 1)
-            lcd.putstr(f"Date: {display_date:>13}")
+        # Only the seconds register is compared; nothing is converted or
+        # allocated until it changes.
+        raw = rtc.read_raw(_rtc_raw)
+        if raw[0] == shown_ss and not force_display_refresh:
+            return
+        shown_ss = raw[0]
+        t = local_from_raw(raw)
+        put2(_time_line, 11, t[3])
+        put2(_time_line, 14, t[4])
+        put2(_time_line, 17, t[5])
+        lcd.move_to(0, 0)
+        lcd.putbytes(_time_line)
+        draw_date(t[2], t[1], t[0])
     except Exception as e:
         print("RTC read error:", e)
 
+def draw_menu_line(row, text, selected, suffix=None):
+    _menu_line[0] = 62 if selected else 32  # ">" or " "
+    fill(_menu_line, text, 1)
+    if suffix:
+        fill(_menu_line, suffix, 20 - len(suffix))
+    lcd.move_to(0, row)
+    lcd.putbytes(_menu_line)
+
 def clear_menu_lines():
     for i in range(2, 4):
         lcd.move_to(0, i)
-        lcd.putstr(" " * 20)
+        lcd.putbytes(_BLANK_LINE)
 
-def show_main_menu():
-    clear_menu_lines()
-    items = ["Get NTP Time", "Get RTC Time"]
-    for i in range(2):
-        lcd.move_to(0, 2 + i)
-        prefix = ">" if current_pos == i else " "
-        item_text = items[i]
-        if i == 0 and alarm_active and alarm_time:
-            display_text = f"{prefix}{item_text:<17}AL"
-        else:
-            display_text = f"{prefix}{item_text:<19}"
-        lcd.putstr(display_text)
-
-def show_ntp_menu():
-    clear_menu_lines()
-    items = ["Sync with NTP", "Save to RTC", "Back"]
-    max_display = 2
-    for i in range(max_display):
+def show_menu(items, suffix=None):
+    # MENU_ROWS entries from menu_offset; `suffix` goes on the top row
+    for i in range(MENU_ROWS):
         pos = i + menu_offset
         if pos < len(items):
+            draw_menu_line(2 + i, items[pos], pos == current_pos, suffix if i == 0 else None)
+        else:
             lcd.move_to(0, 2 + i)
-            prefix = ">" if pos == current_pos else " "
-            lcd.putstr(prefix + items[pos][:19])
+            lcd.putbytes(_BLANK_LINE)
+
+def show_main_menu():
+    show_menu(MAIN_MENU, b"AL" if alarm_active and alarm_time else None)
+
+def show_ntp_menu():
+    show_menu(NTP_MENU)
 
 def show_rtc_menu():
-    clear_menu_lines()
-    items = ["View RTC Time", "Back"]
-    for i in range(2):
-        lcd.move_to(0, 2 + i)
-        prefix = ">" if current_pos == i else " "
-        lcd.putstr(prefix + items[i][:19])
+    show_menu(RTC_MENU)
 
-def show_alarm_control():
-    clear_menu_lines()
-    items = ["Pause/Resume", "Stop", "Snooze"]
+def show_edit():
+    label, lo, hi, mode = edit_fields[edit_index]
+    fill(_menu_line, label)
     lcd.move_to(0, 2)
-    status = "PAUSED" if alarm_paused else "PLAYING"
-    lcd.putstr(f"Status: {status:<12}")
+    lcd.putbytes(_menu_line)
+    fill(_menu_line, b"> ")
+    if hi > 99:
+        put4(_menu_line, 2, edit_values[edit_index])
+    else:
+        put2(_menu_line, 2, edit_values[edit_index])
     lcd.move_to(0, 3)
-    prefix = ">" if current_pos < len(items) else " "
-    lcd.putstr(prefix + items[current_pos][:19])
+    lcd.putbytes(_menu_line)
+
+def show_alarm_control():
+    fill(_menu_line, _STATUS_PAUSED if alarm_paused else _STATUS_PLAYING)
+    lcd.move_to(0, 2)
+    lcd.putbytes(_menu_line)
+    draw_menu_line(3, ALARM_MENU[current_pos], current_pos < len(ALARM_MENU))
 
 def update_display():
     global force_display_refresh, previous_pos
@@ -207,6 +331,8 @@ def update_display():
         show_ntp_menu()
     elif current_state == STATE_RTC_MENU:
         show_rtc_menu()
+    elif current_state == STATE_EDIT:
+        show_edit()
     elif current_state == STATE_ALARM_CONTROL:
         lcd.clear()
         lcd.move_to(0, 0)
@@ -215,9 +341,6 @@ def update_display():
     if force_display_refresh:
         force_display_refresh = False
 
-def apply_timezone(tm):
-    return localtime(mktime(tm[:8]) + TIMEZONE_OFFSET * 3600)
-
 def sync_with_ntp():
     # ... (function is unchanged)
     global ntp_sync_result
@@ -233,9 +356,8 @@ def sync_with_ntp():
             sleep(1)
     if wlan.isconnected():
         try:
-            ntptime.settime()
-            t = apply_timezone(localtime())
-            ntp_sync_result = t[:6]
+            ntp_sync_result = sntp.query()
+            print("NTP delay: {} us".format(ntp_sync_result.delay_us))
             lcd.move_to(0, 2)
             lcd.putstr("NTP Sync OK" + " " * 9)
             sleep(1)
@@ -252,28 +374,34 @@ def sync_with_ntp():
 def save_to_rtc():
     # ... (function is unchanged)
     if ntp_sync_result:
-        rtc.set_time(ntp_sync_result)
+        # Written at the next NTP second boundary, not when the sync finished
+        sntp.write_rtc(rtc, ntp_sync_result)
         lcd.move_to(0, 2)
         lcd.putstr("Saved to RTC" + " " * 8)
         sleep(1)
 
+def show_status(text):
+    # Non-blocking one-line message on the bottom row
+    lcd.move_to(0, 3)
+    lcd.putstr(f"{text:<20}"[:20])
+
 def set_rtc_time(y, m, d, hh, mm, ss):
-    # ... (function is unchanged)
-    try:
-        rtc.set_time((y, m, d, hh, mm, ss))
-        lcd.move_to(0, 2)
-        lcd.putstr(f"RTC Set: {hh:02d}:{mm:02d}:{ss:02d}  ")
-        sleep(1)
-    except Exception as e:
-        print("RTC set error:", e)
-        lcd.move_to(0, 2)
-        lcd.putstr("RTC Set Error" + " " * 7)
-        sleep(1)
+    rtc.set_time((y, m, d, hh, mm, ss))
+    show_status(f"RTC Set: {hh:02d}:{mm:02d}:{ss:02d}")
+
+def set_rtc_local(y, m, d, hh, mm):
+    # The RTC runs in UTC; the offset is looked up one standard offset
+    # before the local time, then again at the UTC instant found
+    local = epoch_days(y, m, d) * 86400 + hh * 3600 + mm * 60
+    t = local - tz.utc_offset(local - tz.std_offset)
+    t = local - tz.utc_offset(t)
+    rtc.set_time(gmtime(t)[:6])
+    show_status(f"RTC Set: {hh:02d}:{mm:02d}:00")
 
 def show_rtc_time():
     # ... (function is unchanged)
     try:
-        y, m, d, hh, mm, ss = rtc.read_time()
+        y, m, d, hh, mm, ss = read_local_time()
         lcd.move_to(0, 2)
         lcd.putstr(f"{hh:02d}:{mm:02d}:{ss:02d}" + " " * 12)
         lcd.move_to(0, 3)
@@ -296,41 +424,25 @@ def reset_buzzer():
         lcd.putstr("Buzzer Error")
         sleep(1)
 
-def play_melody():
-    # ... (function is unchanged)
-    global note_index, alarm_playing, alarm_paused, last_note_time
-    if not alarm_playing or alarm_paused:
-        reset_buzzer()
-        return
-    now = ticks_ms()
-    if now - last_note_time < MELODY_SPEED:
-        return
-    melody = mario
-    if note_index >= len(melody):
-        note_index = 0
-    note = melody[note_index]
+def alarm_song():
+    # Uploaded file (streamed from flash), then tunes.txt, then built-in
+    tune = open_file(alarm_tune) or load_library().get(alarm_tune)
+    tune = tune or Melody(getattr(songs, alarm_tune, songs.mario), alarm_tune)
+    # Checked once here; the sequencer plays it without per-note checks
     try:
-        if note <= 0 or note > 20000:
-            buzzer.pwm.duty_u16(0)
-        else:
-            buzzer.pwm.freq(note)
-            buzzer.pwm.duty_u16(MELODY_DUTY)
+        return tune.validate()
     except ValueError as e:
-        print(f"Note error at index {note_index}: {e}")
-        buzzer.pwm.duty_u16(0)
-        lcd.move_to(0, 3)
-        lcd.putstr("Note Error")
-        sleep(1)
-    note_index += 1
-    last_note_time = now
+        print("Alarm tune error:", e)
+        if hasattr(tune, "close"):
+            tune.close()
+        return Melody(songs.mario, "mario")
 
 def play_alarm():
     # ... (function is unchanged)
-    global alarm_playing, alarm_start_time, note_index, last_note_time
+    global alarm_playing, alarm_start_time
     try:
         reset_buzzer()
-        note_index = 0
-        last_note_time = ticks_ms()
+        sequencer.start(alarm_song(), loop=True, envelope=alarm_envelope)
         alarm_playing = True
         alarm_start_time = ticks_ms()
         print("Alarm started")
@@ -341,16 +453,16 @@ def play_alarm():
         sleep(1)
 
 def stop_alarm():
-    global alarm_active, alarm_playing, alarm_paused, snooze_time, current_state, note_index, force_display_refresh, previous_pos
+    global alarm_active, alarm_playing, alarm_paused, snooze_time, current_state, current_pos, force_display_refresh, previous_pos
     try:
-        reset_buzzer()
+        sequencer.stop()
         alarm_active = False
         alarm_playing = False
         alarm_paused = False
         snooze_time = None
-        note_index = 0
         current_state = STATE_MAIN
-        encoder.set(max_val=1)
+        current_pos = 0
+        menu_encoder()
         save_alarm_settings()
         
         # *** FIX IS HERE: Force a complete, immediate screen redraw ***
@@ -374,7 +486,7 @@ def pause_alarm():
     try:
         if alarm_playing:
             alarm_paused = True
-            reset_buzzer()
+            sequencer.pause()
             update_display()
             print("Alarm paused")
     except Exception as e:
@@ -389,7 +501,7 @@ def resume_alarm():
     try:
         if alarm_paused:
             alarm_paused = False
-            last_note_time = ticks_ms()
+            sequencer.resume()
             update_display()
             print("Alarm resumed")
     except Exception as e:
@@ -399,17 +511,17 @@ def resume_alarm():
         sleep(1)
 
 def snooze_alarm():
-    global alarm_active, alarm_playing, alarm_paused, snooze_time, current_state, note_index, force_display_refresh, previous_pos
+    global alarm_active, alarm_playing, alarm_paused, snooze_time, current_state, current_pos, force_display_refresh, previous_pos
     try:
-        y, m, d, hh, mm, ss = rtc.read_time()
+        y, m, d, hh, mm, ss = read_local_time()
         snooze_hh, snooze_mm = add_minutes_to_time(hh, mm, SNOOZE_MINUTES)
         snooze_time = (snooze_hh, snooze_mm)
-        reset_buzzer()
+        sequencer.stop()
         alarm_playing = False
         alarm_paused = False
-        note_index = 0
         current_state = STATE_MAIN
-        encoder.set(max_val=1)
+        current_pos = 0
+        menu_encoder()
         
         # Show temporary message
         lcd.move_to(0, 3)
@@ -432,7 +544,6 @@ def snooze_alarm():
         sleep(1)
 
 def get_alarm_status():
-    # ... (function is unchanged)
     status = "STOPPED"
     if alarm_active and alarm_time:
         if alarm_playing:
@@ -441,57 +552,282 @@ def get_alarm_status():
             status = f"SNOOZED:{snooze_time[0]:02d}:{snooze_time[1]:02d}"
         else:
             status = f"SET:{alarm_time[0]:02d}:{alarm_time[1]:02d}"
-    print(f"ALARM_STATUS:{status}")
+    return status
+
+def _parse_ints(args, count):
+    parts = args.split(":")
+    if len(parts) != count:
+        raise ValueError("expected {} fields".format(count))
+    return [int(p) for p in parts]
+
+def set_alarm_time(hh, mm):
+    global alarm_time, alarm_active, force_display_refresh
+    alarm_time = (hh, mm)
+    alarm_active = True
+    save_alarm_settings()
+    show_status(f"Alarm set: {hh:02d}:{mm:02d}")
+    force_display_refresh = True  # Force main menu to show "AL"
+
+def cmd_alarm_set(args):
+    hh, mm = _parse_ints(args, 2)
+    if not (0 <= hh <= 23 and 0 <= mm <= 59):
+        show_status("Invalid Time")
+        raise ValueError("invalid time")
+    set_alarm_time(hh, mm)
+    return f"{hh:02d}:{mm:02d}"
+
+def cmd_alarm_clear(args):
+    global alarm_time, force_display_refresh
+    stop_alarm()
+    alarm_time = None
+    save_alarm_settings()
+    show_status("Alarm cleared")
+    force_display_refresh = True
+
+def cmd_alarm_pause(args):
+    pause_alarm()
+    return get_alarm_status()
+
+def cmd_alarm_resume(args):
+    resume_alarm()
+    return get_alarm_status()
+
+def cmd_alarm_snooze(args):
+    snooze_alarm()
+    return get_alarm_status()
+
+def cmd_alarm_status(args):
+    return get_alarm_status()
+
+def cmd_id(args):
+    # ID -> kind:unique id:firmware, used by hosts to find clocks among ports
+    return "{}:{}:{}".format(DEVICE_KIND, ubinascii.hexlify(unique_id()).decode(), FIRMWARE_VERSION)
+
+def cmd_echo(args):
+    # Answered at once: the host maps its clock onto our ticks_us from these
+    return str(ticks_us())
+
+def cmd_ntp_set(args):
+    # NTP_SET:y:m:d:hh:mm:ss[:at] where `at` is the ticks_us (see ECHO) at
+    # which that second begins. A timed set is sent early; the main loop
+    # keeps running and finish_ntp_set() writes the RTC at `at`, then
+    # replies with the lateness in us and the RTC read back.
+    global ntp_set_pending
+    fields = [int(p) for p in args.split(":")]
+    if len(fields) == 6:
+        set_rtc_time(*fields)
+        return
+    if len(fields) != 7:
+        raise ValueError("expected 6 or 7 fields")
+    at = fields[6]
+    wait = ticks_diff(at, ticks_us())
+    if wait < 0:
+        raise ValueError("late by {} us".format(-wait))
+    if wait > MAX_SET_AHEAD_US:
+        raise ValueError("too early")
+    if ntp_set_pending:
+        raise ValueError("busy")
+    ntp_set_pending = uart.current + (fields[:6], at)
+    return LATER
+
+def ntp_set_wait_ms(limit):
+    # How long the main loop may idle before finish_ntp_set() must run
+    if ntp_set_pending is None:
+        return limit
+    left = ticks_diff(ntp_set_pending[3], ticks_us()) // 1000 - NTP_SET_SPIN_MS
+    return max(0, min(limit, left))
+
+def finish_ntp_set():
+    global ntp_set_pending
+    if ntp_set_pending is None:
+        return
+    rid, name, fields, at = ntp_set_pending
+    wait = ticks_diff(at, ticks_us())
+    if wait > NTP_SET_SPIN_MS * 1000:
+        return
+    ntp_set_pending = None
+    if wait < 0:
+        uart.reply(False, rid, name, "late by {} us".format(-wait))
+        return
+    while ticks_diff(at, ticks_us()) > 0:
+        pass
+    t = ticks_us()
+    try:
+        set_rtc_time(*fields)
+        late = ticks_diff(t, at)
+        uart.reply(True, rid, name, "{}:{}:{}:{}:{}:{}:{}".format(late, *rtc.read_time()))
+    except Exception as e:
+        uart.reply(False, rid, name, str(e) or type(e).__name__)
+
+def cmd_tz_set(args):
+    global force_display_refresh
+    save_timezone(args)
+    force_display_refresh = True
+    return tz.spec
+
+def cmd_tz_get(args):
+    return tz.spec
+
+upload = Upload()
+
+def cmd_mel_begin(args):
+    name, size = args.split(":")
+    upload.begin(name, int(size))
+
+def cmd_mel_data(args):
+    upload.data(ubinascii.a2b_base64(args))
+    return str(upload.received)
+
+def cmd_mel_end(args):
+    return upload.end(int(args, 16))
+
+def cmd_mel_list(args):
+    return ",".join(list_files())
+
+def cmd_mel_del(args):
+    if not valid_name(args):
+        raise ValueError("bad name")
+    os.remove(melody_path(args))
+
+def cmd_alarm_tune(args):
+    if args:
+        if not valid_name(args):
+            raise ValueError("bad name")
+        save_alarm_tune(args)
+    return alarm_tune
+
+def cmd_stats(args):
+    return stats.dump()
+
+def cmd_stats_on(args):
+    stats.enable()
+    return stats.dump()
+
+def cmd_stats_off(args):
+    stats.disable()
+    return stats.dump()
+
+def cmd_stats_reset(args):
+    stats.reset()
+    return stats.dump()
+
+def alarm_flags():
+    flags = 0
+    if alarm_active:
+        flags |= frame.ALARM_ENABLED
+    if alarm_playing:
+        flags |= frame.ALARM_PLAYING
+    if alarm_paused:
+        flags |= frame.ALARM_PAUSED
+    if snooze_time:
+        flags |= frame.ALARM_SNOOZED
+    return flags
+
+def frame_time_set(payload):
+    set_rtc_time(*frame.unpack_time(payload))
+
+def frame_time_get(payload):
+    return frame.TIME, frame.pack_time(rtc.read_time())
+
+def frame_alarm_set(payload):
+    cmd_alarm_set("{}:{}".format(payload[0], payload[1]))
+
+def frame_alarm_clear(payload):
+    cmd_alarm_clear("")
+
+def frame_alarm_table(payload):
+    alarms = []
+    if alarm_time:
+        alarms.append((alarm_time[0], alarm_time[1], alarm_flags()))
+    return frame.ALARM_TABLE, frame.pack_alarms(alarms)
+
+_EPOCH_FLAG = frame.EPOCH_2000 if gmtime(0)[0] == 2000 else frame.EPOCH_1970
+telemetry_period_ms = 0  # 0: off, see cmd_telemetry
+telemetry_next = 0
+loop_worst_us = 0  # slowest main-loop pass since the last report
+
+def telemetry_values():
+    # Same fields as frame.TELEMETRY_FMT
+    return (mktime(rtc.read_time() + (0, 0)),
+            ticks_ms(),
+            int(rtc.temperature() * 4),
+            gc.mem_free(),
+            loop_worst_us,
+            alarm_flags() | _EPOCH_FLAG)
+
+def frame_telemetry(payload):
+    return frame.TELEMETRY, struct.pack(frame.TELEMETRY_FMT, *telemetry_values())
+
+def cmd_telemetry(args):
+    # TELEMETRY:<seconds> starts periodic reports, 0 stops them. Reports go
+    # out unprompted as "TELEMETRY:<fields>" lines, or TELEMETRY frames in
+    # binary mode. Off after every reset.
+    global telemetry_period_ms, telemetry_next
+    if args:
+        period = int(args)
+        if 0 < period < TELEMETRY_MIN_S:
+            raise ValueError("period too short")
+        telemetry_period_ms = period * 1000
+        telemetry_next = ticks_ms()
+    return str(telemetry_period_ms // 1000)
+
+def send_telemetry():
+    global telemetry_next, loop_worst_us
+    now = ticks_ms()
+    if not telemetry_period_ms or ticks_diff(now, telemetry_next) < 0:
+        return
+    telemetry_next = ticks_add(telemetry_next, telemetry_period_ms)
+    if ticks_diff(telemetry_next, now) <= 0:
+        telemetry_next = ticks_add(now, telemetry_period_ms)  # Fell behind
+    values = telemetry_values()
+    loop_worst_us = 0
+    if uart.binary:
+        uart.send_frame(frame.TELEMETRY, struct.pack(frame.TELEMETRY_FMT, *values))
+    else:
+        print("TELEMETRY:{}:{}:{}:{}:{}:{}".format(*values))
+
+uart = CommandServer()
+uart.on_activity = power.touch_host
+power.pending = lambda: events.pending() or uart.pending()
+for _name, _handler in (
+        ("ALARM_SET", cmd_alarm_set),
+        ("ALARM_CLEAR", cmd_alarm_clear),
+        ("ALARM_PAUSE", cmd_alarm_pause),
+        ("ALARM_RESUME", cmd_alarm_resume),
+        ("ALARM_SNOOZE", cmd_alarm_snooze),
+        ("ALARM_STATUS", cmd_alarm_status),
+        ("NTP_SET", cmd_ntp_set),
+        ("ECHO", cmd_echo),
+        ("ID", cmd_id),
+        ("TELEMETRY", cmd_telemetry),
+        ("TZ_SET", cmd_tz_set),
+        ("TZ_GET", cmd_tz_get),
+        ("MEL_BEGIN", cmd_mel_begin),
+        ("MEL_DATA", cmd_mel_data),
+        ("MEL_END", cmd_mel_end),
+        ("MEL_LIST", cmd_mel_list),
+        ("MEL_DEL", cmd_mel_del),
+        ("ALARM_TUNE", cmd_alarm_tune),
+        ("STATS", cmd_stats),
+        ("STATS_ON", cmd_stats_on),
+        ("STATS_OFF", cmd_stats_off),
+        ("STATS_RESET", cmd_stats_reset)):
+    uart.add(_name, _handler)
+for _ftype, _handler in (
+        (frame.TIME_SET, frame_time_set),
+        (frame.TIME_GET, frame_time_get),
+        (frame.ALARM_SET, frame_alarm_set),
+        (frame.ALARM_CLEAR, frame_alarm_clear),
+        (frame.ALARM_TABLE_GET, frame_alarm_table),
+        (frame.TELEMETRY_GET, frame_telemetry)):
+    uart.add_frame(_ftype, _handler)
 
 def handle_uart_commands():
-    # ... (function is unchanged)
-    global alarm_time, alarm_active
     try:
-        if sys.stdin in select.select([sys.stdin], [], [], 0)[0]:
-            cmd = sys.stdin.readline().strip()
-            if cmd.startswith("ALARM_SET:"):
-                parts = cmd[10:].split(":")
-                if len(parts) == 2:
-                    hh = int(parts[0])
-                    mm = int(parts[1])
-                    if 0 <= hh <= 23 and 0 <= mm <= 59:
-                        alarm_time = (hh, mm)
-                        alarm_active = True
-                        save_alarm_settings()
-                        lcd.move_to(0, 3)
-                        lcd.putstr(f"Alarm set: {hh:02d}:{mm:02d}" + " " * 6)
-                        sleep(1)
-                        force_display_refresh = True # Force main menu to show "AL"
-                    else:
-                        lcd.move_to(0, 3)
-                        lcd.putstr("Invalid Time" + " " * 8)
-                        sleep(1)
-            elif cmd == "ALARM_CLEAR":
-                stop_alarm()
-                alarm_time = None
-                save_alarm_settings()
-                lcd.move_to(0, 3)
-                lcd.putstr("Alarm cleared" + " " * 7)
-                sleep(1)
-                force_display_refresh = True
-            elif cmd == "ALARM_PAUSE":
-                pause_alarm()
-            elif cmd == "ALARM_RESUME":
-                resume_alarm()
-            elif cmd == "ALARM_SNOOZE":
-                snooze_alarm()
-            elif cmd == "ALARM_STATUS":
-                get_alarm_status()
-            elif cmd.startswith("NTP_SET:"):
-                parts = cmd[8:].split(":")
-                if len(parts) == 6:
-                    y, m, d, hh, mm, ss = map(int, parts)
-                    set_rtc_time(y, m, d, hh, mm, ss)
+        uart.poll()
     except Exception as e:
         print("UART command error:", e)
-        lcd.move_to(0, 3)
-        lcd.putstr("UART Error" + " " * 10)
-        sleep(1)
+        show_status("UART Error")
 
 
 def check_alarm():
@@ -504,10 +840,10 @@ def check_alarm():
         last_alarm_check = now
         if not alarm_active or not alarm_time:
             return
-        y, m, d, hh, mm, ss = rtc.read_time()
-        current_time = (hh, mm)
+        t = read_local_time()
         if not alarm_playing and not alarm_paused:
-            if (snooze_time and current_time == snooze_time) or (not snooze_time and current_time == alarm_time):
+            target = snooze_time or alarm_time
+            if t[3] == target[0] and t[4] == target[1]:
                 trigger_alarm()
         if alarm_playing and not alarm_paused and (now - alarm_start_time > ALARM_DURATION * 1000):
             stop_alarm()
@@ -524,7 +860,7 @@ def trigger_alarm():
         current_state = STATE_ALARM_CONTROL
         current_pos = 0
         menu_offset = 0
-        encoder.set(max_val=2)
+        menu_encoder()
         play_alarm()
         update_display()
         print("Alarm triggered")
@@ -534,102 +870,252 @@ def trigger_alarm():
         lcd.putstr("Trigger Error")
         sleep(1)
 
+def show_sleep_display():
+    global shown_ss
+    y, m, d, hh, mm, ss = read_local_time()
+    # Seconds are hidden while asleep: the display only changes once a minute
+    put2(_time_line, 11, hh)
+    put2(_time_line, 14, mm)
+    _time_line[16] = _time_line[17] = _time_line[18] = 32
+    lcd.move_to(0, 0)
+    lcd.putbytes(_time_line)
+    _time_line[16] = 58  # ":" back for the awake display
+    shown_ss = -1
+    draw_date(d, m, y)
+    return ss
+
+def enter_low_power():
+    global force_display_refresh, last_alarm_check
+    try:
+        ss = show_sleep_display()
+        if SLEEP_BACKLIGHT_OFF:
+            lcd.backlight_off()
+        print("Sleeping")
+        rtc.clear_alarm_flags()  # A stale A2F holds INT low: ext0 would wake at once
+        while True:
+            if power.sleep((60 - ss) * 1000):
+                break
+            rtc.clear_alarm_flags()
+            last_alarm_check = 0
+            check_alarm()
+            if alarm_playing:
+                break
+            ss = show_sleep_display()
+    except Exception as e:
+        print("Low power error:", e)
+        power.touch()
+    lcd.backlight_on()
+    if not encoder_button.value():
+        events.button_irq(encoder_button)  # The press that woke us
+    force_display_refresh = True
+    update_display()
+
+def menu_encoder():
+    # For the menu of current_state: one entry per detent, only value
+    # editing accelerates
+    encoder.set_acceleration(1)
+    encoder.set(value=0, min_val=0, max_val=menu_length() - 1, range_mode=_BOUNDED)
+
+def edit_field(index):
+    global edit_index
+    edit_index = index
+    label, lo, hi, mode = edit_fields[index]
+    encoder.set(value=edit_values[index], min_val=lo, max_val=hi, range_mode=mode)
+    encoder.set_acceleration(EDIT_ACCEL)
+    show_edit()
+
+def start_edit(fields, values, apply):
+    global current_state, edit_fields, edit_values, edit_apply
+    current_state = STATE_EDIT
+    edit_fields = fields
+    edit_values = list(values)
+    edit_apply = apply
+    edit_field(0)
+
+def apply_alarm_edit(values):
+    set_alarm_time(values[0], values[1])
+    sleep(1)
+
+def apply_rtc_edit(values):
+    y, m, d, hh, mm = values
+    # Day 31 in a shorter month becomes its last day
+    days = epoch_days(y + (m == 12), m % 12 + 1, 1) - epoch_days(y, m, 1)
+    set_rtc_local(y, m, min(d, days), hh, mm)
+    sleep(1)
+
+def menu_length():
+    if current_state == STATE_NTP_MENU:
+        return len(NTP_MENU)
+    if current_state == STATE_RTC_MENU:
+        return len(RTC_MENU)
+    if current_state == STATE_ALARM_CONTROL:
+        return len(ALARM_MENU)
+    return len(MAIN_MENU)
+
+def handle_encoder(delta):
+    # `delta` from the event ring; the encoder is reset to 0 with
+    # current_pos on every menu change, so the two move together
+    global current_pos, menu_offset
+    if current_state == STATE_EDIT:
+        # Same wrap/bounds as the encoder, which was set to this value
+        label, lo, hi, mode = edit_fields[edit_index]
+        edit_values[edit_index] = max(lo, min(hi, edit_values[edit_index] + delta))
+        show_edit()
+        return
+    new_val = max(0, min(current_pos + delta, menu_length() - 1))
+    if new_val == current_pos:
+        return
+    current_pos = new_val
+    if current_state != STATE_ALARM_CONTROL:
+        if current_pos >= menu_offset + MENU_ROWS:
+            menu_offset = current_pos - MENU_ROWS + 1
+        elif current_pos < menu_offset:
+            menu_offset = current_pos
+        menu_offset = max(0, min(menu_offset, menu_length() - MENU_ROWS))
+    update_display()
+
+def handle_button_press():
+    global current_state, current_pos, menu_offset, force_display_refresh
+    if current_state == STATE_MAIN:
+        if current_pos == 0:
+            current_state = STATE_NTP_MENU
+            menu_encoder()
+            current_pos = 0
+            menu_offset = 0
+        elif current_pos == 1:
+            current_state = STATE_RTC_MENU
+            menu_encoder()
+            current_pos = 0
+            menu_offset = 0
+        elif current_pos == 2:
+            start_edit(ALARM_EDIT, alarm_time or read_local_time()[3:5], apply_alarm_edit)
+    elif current_state == STATE_NTP_MENU:
+        if current_pos == 0:
+            sync_with_ntp()
+        elif current_pos == 1:
+            save_to_rtc()
+        elif current_pos == 2:
+            current_state = STATE_MAIN
+            menu_encoder()
+            current_pos = 0
+            menu_offset = 0
+            force_display_refresh = True
+    elif current_state == STATE_RTC_MENU:
+        if current_pos == 0:
+            show_rtc_time()
+        elif current_pos == 1:
+            start_edit(RTC_EDIT, read_local_time()[:5], apply_rtc_edit)
+        elif current_pos == 2:
+            current_state = STATE_MAIN
+            menu_encoder()
+            current_pos = 0
+            menu_offset = 0
+            force_display_refresh = True
+    elif current_state == STATE_ALARM_CONTROL:
+        if current_pos == 0:
+            if alarm_paused:
+                resume_alarm()
+            else:
+                pause_alarm()
+        elif current_pos == 1:
+            stop_alarm()
+            current_pos = 0
+            menu_offset = 0
+        elif current_pos == 2:
+            snooze_alarm()
+            current_pos = 0
+            menu_offset = 0
+    elif current_state == STATE_EDIT:
+        if edit_index + 1 < len(edit_fields):
+            edit_field(edit_index + 1)
+            return
+        edit_apply(edit_values)
+        current_state = STATE_MAIN
+        menu_encoder()
+        current_pos = 0
+        menu_offset = 0
+        force_display_refresh = True
+
+    # General update after any button press
+    if current_state != STATE_ALARM_CONTROL:
+         update_display()
+
+def handle_long_press():
+    # Hold and release: stop a ringing alarm, or back to the main screen
+    global current_state, current_pos, menu_offset, force_display_refresh
+    if current_state == STATE_ALARM_CONTROL:
+        stop_alarm()
+    elif current_state != STATE_MAIN:
+        current_state = STATE_MAIN
+        menu_encoder()
+        current_pos = 0
+        menu_offset = 0
+        force_display_refresh = True
+        update_display()
+
+
 # Main Loop
 try:
     load_alarm_settings()
+    load_timezone()
+    load_alarm_tune()
     lcd.clear()
     force_display_refresh = True
     update_display() # Initial draw
-    last_encoder_val = encoder.value()
     reset_buzzer()
     while True:
+        loop_start = stats.loop_begin()
+        pass_start = ticks_us()
+        finish_ntp_set()  # First: the wait below ends just ahead of it
         # Only update clock continuously if not in alarm state
         if current_state != STATE_ALARM_CONTROL:
+            t0 = stats.start()
             update_clock_display()
-            
+            stats.stop("clock", t0)
+
+        t0 = stats.start()
         handle_uart_commands()
+        stats.stop("uart", t0)
+        t0 = stats.start()
         check_alarm()
-        play_melody()
-
-        new_val = encoder.value()
-        if new_val != last_encoder_val:
-            now = ticks_ms()
-            if now - last_encoder_time > ENCODER_DEBOUNCE_MS:
-                if current_state == STATE_NTP_MENU:
-                    items = ["Sync with NTP", "Save to RTC", "Back"]
-                    max_display = 2
-                    current_pos = new_val
-                    if current_pos >= menu_offset + max_display:
-                        menu_offset = current_pos - max_display + 1
-                    elif current_pos < menu_offset:
-                        menu_offset = current_pos
-                    menu_offset = max(0, min(menu_offset, len(items) - max_display))
-                else:
-                    current_pos = new_val
-                update_display()
-                sleep(0.01)
-                last_encoder_val = new_val
-                last_encoder_time = now
-
-        if button_pressed:
-            button_pressed = False
-            if current_state == STATE_MAIN:
-                if current_pos == 0:
-                    current_state = STATE_NTP_MENU
-                    encoder.set(max_val=2)
-                    current_pos = 0
-                    menu_offset = 0
-                elif current_pos == 1:
-                    current_state = STATE_RTC_MENU
-                    encoder.set(max_val=1)
-                    current_pos = 0
-                    menu_offset = 0
-            elif current_state == STATE_NTP_MENU:
-                if current_pos == 0:
-                    sync_with_ntp()
-                elif current_pos == 1:
-                    save_to_rtc()
-                elif current_pos == 2:
-                    current_state = STATE_MAIN
-                    encoder.set(max_val=1)
-                    current_pos = 0
-                    menu_offset = 0
-                    force_display_refresh = True
-            elif current_state == STATE_RTC_MENU:
-                if current_pos == 0:
-                    show_rtc_time()
-                elif current_pos == 1:
-                    current_state = STATE_MAIN
-                    encoder.set(max_val=1)
-                    current_pos = 0
-                    menu_offset = 0
-                    force_display_refresh = True
-            elif current_state == STATE_ALARM_CONTROL:
-                if current_pos == 0:
-                    if alarm_paused:
-                        resume_alarm()
-                    else:
-                        pause_alarm()
-                elif current_pos == 1:
-                    stop_alarm()
-                    current_pos = 0
-                    menu_offset = 0
-                elif current_pos == 2:
-                    snooze_alarm()
-                    current_pos = 0
-                    menu_offset = 0
-            
-            # General update after any button press
-            if current_state != STATE_ALARM_CONTROL:
-                 update_display()
-
-        sleep(0.05)
+        stats.stop("alarm", t0)
+        send_telemetry()
+
+        kind = events.get()
+        while kind:
+            t0 = stats.start()
+            power.touch()
+            if kind == EV_DELTA:
+                handle_encoder(events.value)
+                stats.stop("encoder", t0)
+            elif kind == EV_RELEASE and events.value < LONG_PRESS_MS:
+                handle_button_press()
+                stats.stop("button", t0)
+            elif kind == EV_LONG_PRESS:
+                handle_long_press()
+                stats.stop("button", t0)
+            kind = events.get()
+
+        stats.loop_done(loop_start)
+        pass_us = ticks_diff(ticks_us(), pass_start)
+        if pass_us > loop_worst_us:
+            loop_worst_us = pass_us
+
+        # No light sleep while streaming telemetry: the UART sleeps too
+        if (current_state == STATE_MAIN and not alarm_playing and not telemetry_period_ms
+                and ntp_set_pending is None and power.idle()):
+            enter_low_power()
+            continue
+
+        events.wait(ntp_set_wait_ms(50))  # Returns early on encoder/button input
 except Exception as e:
     print("Main loop error:", e)
     lcd.move_to(0, 0)
     lcd.putstr("Main Loop Error")
     reset_buzzer()
     sleep(2)
+finally:
+    uart.close()  # Re-enables Ctrl-C for the REPL
 
 
 
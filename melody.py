@@ -0,0 +1,318 @@
+# melody.py
+# Compact melody storage and RTTTL import.
+#
+# A melody is a bytes-like object of little-endian uint16 words, one per
+# note:  note index << 9 | duration in DURATION_UNIT_MS units.
+# Note index 0 is a rest; 1..108 are C0..B8 (FREQ holds their pitch in Hz).
+# Bytes literals in a frozen module stay in flash, see to_source().
+# Uploaded melodies are stored in the same layout as MELODY_DIR/<name>.mel
+# and played through FileMelody without loading them into RAM.
+import os
+from array import array
+from frame import crc16
+
+MELODY_DIR = "/melodies"
+FILE_BUFFER_NOTES = 16
+DURATION_UNIT_MS = 8
+MAX_DURATION_MS = 0x1FF * DURATION_UNIT_MS
+REST = 0
+NOTE_NAMES = ("c", "c#", "d", "d#", "e", "f", "f#", "g", "g#", "a", "a#", "b")
+
+
+def _build_freqs():
+    freqs = array("H", [0] * 109)
+    for i in range(1, 109):
+        freqs[i] = int(440 * 2 ** ((i - 58) / 12) + 0.5)  # index 58 is A4
+    return freqs
+
+
+FREQ = _build_freqs()
+
+
+def note_index(name, octave=None):
+    """Index of a note such as "E7", "c#5" or ("a", 4); "p"/"R" is a rest."""
+    name = name.lower()
+    if name in ("p", "r"):
+        return REST
+    if octave is None:
+        i = len(name)
+        while i and name[i - 1].isdigit():
+            i -= 1
+        name, octave = name[:i], int(name[i:])
+    if name.endswith("s"):  # "cs7" spelling used by the old constants
+        name = name[:-1] + "#"
+    return octave * 12 + NOTE_NAMES.index(name) + 1
+
+
+def freq_index(hz):
+    """Nearest note index for a frequency in Hz (0 stays a rest)."""
+    if hz <= 0:
+        return REST
+    best = 1
+    for i in range(1, len(FREQ)):
+        if abs(FREQ[i] - hz) < abs(FREQ[best] - hz):
+            best = i
+    return best
+
+
+def pack(index, duration_ms):
+    units = (duration_ms + DURATION_UNIT_MS // 2) // DURATION_UNIT_MS
+    return (index << 9) | max(1, min(0x1FF, units))
+
+
+class Melody:
+    """Read-only view of a packed melody. `data` may be bytes (flash when
+    frozen), bytearray or a file-backed buffer of the same layout.
+    """
+
+    def __init__(self, data, name=""):
+        self.data = data
+        self.name = name
+
+    def __len__(self):
+        return len(self.data) >> 1
+
+    def word(self, i):
+        d = self.data
+        i <<= 1
+        return d[i] | (d[i + 1] << 8)
+
+    def freq(self, i):
+        return FREQ[self.word(i) >> 9]
+
+    def duration_ms(self, i):
+        return (self.word(i) & 0x1FF) * DURATION_UNIT_MS
+
+    def validate(self):
+        """Check every note once at load time, so playback needs no checks.
+        Raises ValueError on a bad note index or a zero duration.
+        """
+        top = len(FREQ)
+        for i in range(len(self)):
+            word = self.word(i)
+            if word >> 9 >= top or not word & 0x1FF:
+                raise ValueError("bad note {} in {}".format(i, self.name or "melody"))
+        return self
+
+    def total_ms(self):
+        return sum(self.duration_ms(i) for i in range(len(self)))
+
+    @classmethod
+    def from_notes(cls, notes, duration_ms, name=""):
+        """Pack a list of (index, ms) pairs, or of indexes with one length."""
+        words = array("H")
+        for n in notes:
+            if isinstance(n, tuple):
+                words.append(pack(n[0], n[1]))
+            else:
+                words.append(pack(n, duration_ms))
+        return cls(bytes(words), name)
+
+    @classmethod
+    def from_freqs(cls, freqs, duration_ms, name=""):
+        """Pack a legacy list of frequencies in Hz (0 = rest)."""
+        return cls.from_notes([freq_index(f) for f in freqs], duration_ms, name)
+
+
+class FileMelody(Melody):
+    """Melody read incrementally from a .mel file through a small buffer.
+    Sequential playback refills the buffer once every FILE_BUFFER_NOTES
+    notes; the file stays open until close().
+    """
+
+    def __init__(self, path, name="", buffer_notes=FILE_BUFFER_NOTES):
+        self.name = name
+        self._file = open(path, "rb")
+        self._len = os.stat(path)[6] >> 1
+        self.data = bytearray(buffer_notes * 2)
+        self._start = -1  # note index of data[0]
+        self._count = 0
+
+    def __len__(self):
+        return self._len
+
+    def word(self, i):
+        j = i - self._start
+        if self._start < 0 or not 0 <= j < self._count:
+            self._file.seek(i << 1)
+            self._count = self._file.readinto(self.data) >> 1
+            self._start = i
+            j = 0
+        d = self.data
+        j <<= 1
+        return d[j] | (d[j + 1] << 8)
+
+    def close(self):
+        self._file.close()
+
+
+def valid_name(name):
+    return 0 < len(name) <= 24 and all(c.isalpha() or c.isdigit() or c in "_-" for c in name)
+
+
+def melody_path(name):
+    return MELODY_DIR + "/" + name + ".mel"
+
+
+def list_files():
+    try:
+        return [f[:-4] for f in os.listdir(MELODY_DIR) if f.endswith(".mel")]
+    except OSError:
+        return []
+
+
+def open_file(name):
+    """FileMelody for an uploaded tune, or None if there is none."""
+    if not valid_name(name):
+        return None
+    try:
+        return FileMelody(melody_path(name), name)
+    except OSError:
+        return None
+
+
+class Upload:
+    """Receives a .mel file in chunks (MEL_BEGIN/MEL_DATA/MEL_END) into a
+    temporary file, renamed into place only once size and CRC match.
+    """
+
+    def __init__(self):
+        self._file = None
+
+    def begin(self, name, size):
+        if not valid_name(name):
+            raise ValueError("bad name")
+        if size <= 0 or size & 1:
+            raise ValueError("bad size")
+        self.abort()
+        try:
+            os.mkdir(MELODY_DIR)
+        except OSError:
+            pass  # Already exists
+        self.name = name
+        self.size = size
+        self.received = 0
+        self.crc = 0xFFFF
+        self._tmp = melody_path(name) + ".tmp"
+        self._file = open(self._tmp, "wb")
+
+    def data(self, chunk):
+        if self._file is None:
+            raise ValueError("no upload")
+        if self.received + len(chunk) > self.size:
+            self.abort()
+            raise ValueError("too much data")
+        self._file.write(chunk)
+        self.received += len(chunk)
+        self.crc = crc16(chunk, self.crc)
+
+    def end(self, crc):
+        if self._file is None:
+            raise ValueError("no upload")
+        self._file.close()
+        self._file = None
+        if self.received != self.size or crc != self.crc:
+            os.remove(self._tmp)
+            raise ValueError("size or crc mismatch")
+        path = melody_path(self.name)
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        os.rename(self._tmp, path)
+        return self.name
+
+    def abort(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            try:
+                os.remove(self._tmp)
+            except OSError:
+                pass
+
+
+def parse_rtttl(text):
+    """Parse an RTTTL ringtone ("name:d=4,o=5,b=63:8e6,8e6,p,...").
+    Raises ValueError on malformed text.
+    """
+    name, defaults, notes = text.strip().split(":", 2)
+    dur, octave, bpm = 4, 6, 63
+    for item in defaults.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        key, value = item.split("=")
+        key = key.strip().lower()
+        if key == "d":
+            dur = int(value)
+        elif key == "o":
+            octave = int(value)
+        elif key == "b":
+            bpm = int(value)
+    if dur <= 0 or bpm <= 0:
+        raise ValueError("bad RTTTL defaults")
+    whole_ms = 240000 // bpm
+    out = []
+    for token in notes.split(","):
+        token = token.strip().lower()
+        if not token:
+            continue
+        i = 0
+        while i < len(token) and token[i].isdigit():
+            i += 1
+        d = int(token[:i]) if i else dur
+        if i == len(token) or d <= 0:
+            raise ValueError("bad RTTTL note " + token)
+        note = token[i]
+        i += 1
+        if i < len(token) and token[i] == "#":
+            note += "#"
+            i += 1
+        dotted = False
+        if i < len(token) and token[i] == ".":
+            dotted = True
+            i += 1
+        o = octave
+        if i < len(token) and token[i].isdigit():
+            o = int(token[i])
+            i += 1
+        if i < len(token) and token[i] == ".":
+            dotted = True
+        ms = whole_ms // d
+        if dotted:
+            ms += ms // 2
+        index = REST if note == "p" else note_index(note, min(8, max(0, o)))
+        out.append((index, min(ms, MAX_DURATION_MS)))
+    return Melody.from_notes(out, 0, name.strip())
+
+
+def load_library(path="tunes.txt"):
+    """Read RTTTL tunes, one per line, into {name: Melody}. Lets users add
+    tunes by copying a text file to the board instead of editing code.
+    """
+    tunes = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    try:
+                        m = parse_rtttl(line)
+                    except ValueError as e:
+                        print("Bad tune:", e)  # Skip it, keep the rest
+                        continue
+                    tunes[m.name] = m
+    except OSError:
+        pass
+    return tunes
+
+
+def to_source(name, melody):
+    """Python source for a bytes literal of `melody`, for a frozen module."""
+    data = bytes(melody.data)
+    lines = ["{} = (".format(name)]
+    for i in range(0, len(data), 16):
+        lines.append("    {!r}".format(data[i:i + 16]))
+    lines.append(")")
+    return "\n".join(lines) + "\n"
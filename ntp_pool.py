@@ -0,0 +1,165 @@
+# ntp_pool.py
+# Host-side (CPython) SNTP client that asks several servers at once.
+#
+# Every server is queried from a worker thread with a few samples; each
+# server's lowest-delay sample is kept. The servers whose offsets agree
+# with the median (within AGREE_S) are trusted, and of those the one with
+# the lowest round-trip delay wins. Servers are "host" or "host:port", so
+# a local stand-in such as "127.0.0.1:12300" works for testing.
+#
+#   python ntp_pool.py [server ...]
+import socket
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_SERVERS = ("0.pool.ntp.org", "1.pool.ntp.org", "2.pool.ntp.org", "3.pool.ntp.org")
+NTP_PORT = 123
+NTP_SAMPLES = 4
+NTP_TIMEOUT = 1.0  # seconds per sample
+SAMPLE_GAP = 0.05  # seconds between samples to the same server
+AGREE_S = 0.05  # offsets further than this from the median are outliers
+NTP_DELTA = 2208988800  # 1900-01-01 to 1970-01-01
+
+
+def _to_ntp(t):
+    sec = int(t)
+    return struct.pack("!II", sec + NTP_DELTA, int((t - sec) * 2 ** 32))
+
+
+def _from_ntp(buf, offset):
+    sec, frac = struct.unpack_from("!II", buf, offset)
+    return sec - NTP_DELTA + frac / 2 ** 32
+
+
+def _address(server):
+    host, _, port = server.rpartition(":")
+    if not host:
+        return server, NTP_PORT
+    return host, int(port)
+
+
+class NtpResult:
+    """Offset of server time against time.time(), from one server."""
+
+    def __init__(self, server, offset, delay, samples):
+        self.server = server
+        self.offset = offset  # seconds to add to time.time()
+        self.delay = delay  # round-trip seconds of the sample used
+        self.samples = samples  # answered samples
+        self.agreeing = 1  # servers within AGREE_S of the median, see select()
+
+    def now(self):
+        """Current server time as a POSIX timestamp."""
+        return time.time() + self.offset
+
+    def __repr__(self):
+        return (f"NtpResult({self.server}, offset={self.offset * 1000:+.1f} ms, "
+                f"delay={self.delay * 1000:.1f} ms, agreeing={self.agreeing})")
+
+
+def query_once(server, timeout=NTP_TIMEOUT):
+    """One SNTP exchange (RFC 4330); returns (offset, delay) in seconds."""
+    addr = _address(server)
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.settimeout(timeout)
+        request = bytearray(48)
+        request[0] = 0x23  # LI 0, version 4, mode 3 (client)
+        t1 = time.time()
+        request[40:48] = _to_ntp(t1)
+        s.sendto(request, addr)
+        while True:
+            data, _ = s.recvfrom(512)
+            t4 = time.time()
+            # Ignore anything that is not the answer to this request
+            if len(data) >= 48 and data[24:32] == request[40:48]:
+                break
+    if data[0] & 0x07 != 4 or not 1 <= data[1] <= 15:
+        raise ValueError(f"{server}: bad reply (mode {data[0] & 7}, stratum {data[1]})")
+    t2 = _from_ntp(data, 32)
+    t3 = _from_ntp(data, 40)
+    return ((t2 - t1) + (t3 - t4)) / 2, (t4 - t1) - (t3 - t2)
+
+
+def query_server(server, samples=NTP_SAMPLES, timeout=NTP_TIMEOUT):
+    """Lowest-delay sample out of `samples` exchanges with one server."""
+    best = None
+    answered = 0
+    error = None
+    for i in range(samples):
+        if i:
+            time.sleep(SAMPLE_GAP)
+        try:
+            offset, delay = query_once(server, timeout)
+        except (OSError, ValueError) as e:
+            error = e
+            continue
+        answered += 1
+        if best is None or delay < best[1]:
+            best = (offset, delay)
+    if best is None:
+        raise error or OSError(f"{server}: no reply")
+    return NtpResult(server, best[0], best[1], answered)
+
+
+def select(results):
+    """Lowest-delay result among those agreeing with the median offset."""
+    if not results:
+        raise OSError("no NTP server answered")
+    offsets = sorted(r.offset for r in results)
+    n = len(offsets)
+    median = offsets[n // 2] if n & 1 else (offsets[n // 2 - 1] + offsets[n // 2]) / 2
+    agreeing = [r for r in results if abs(r.offset - median) <= AGREE_S]
+    if not agreeing:
+        agreeing = results
+    best = min(agreeing, key=lambda r: r.delay)
+    best.agreeing = len(agreeing)
+    return best
+
+
+class NtpPool:
+    """Queries `servers` in parallel. query() blocks; query_async() runs
+    in the background and calls callback(result, error) from a worker
+    thread, so UI code must hand the result over to its own thread.
+    """
+
+    def __init__(self, servers=DEFAULT_SERVERS, samples=NTP_SAMPLES, timeout=NTP_TIMEOUT):
+        self.servers = list(servers)
+        self.samples = samples
+        self.timeout = timeout
+        self.errors = {}  # server -> last error, from the latest query
+
+    def query(self):
+        results = []
+        self.errors = {}
+        with ThreadPoolExecutor(max_workers=len(self.servers) or 1) as pool:
+            futures = {pool.submit(query_server, s, self.samples, self.timeout): s
+                       for s in self.servers}
+            for future, server in futures.items():
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    self.errors[server] = e
+        return select(results)
+
+    def query_async(self, callback):
+        def worker():
+            try:
+                result = self.query()
+            except Exception as e:
+                callback(None, e)
+                return
+            callback(result, None)
+
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+        return thread
+
+
+if __name__ == "__main__":
+    import sys
+    pool = NtpPool(sys.argv[1:] or DEFAULT_SERVERS)
+    print(pool.query())
+    for server, error in pool.errors.items():
+        print(f"{server}: {error}")
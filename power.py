@@ -0,0 +1,97 @@
+# power.py
+# Idle power manager: puts the ESP32 into light sleep when nobody is
+# using the clock.
+#
+# Wake sources:
+#   - DS3231 INT/SQW (active low, RTC GPIO) via ext0, once per minute
+#   - encoder button, encoder CLK/DT and UART RX via GPIO level wake
+#   - a timer fallback, so a port without GPIO wake still polls input
+#
+# The byte that wakes the chip from UART is lost, so the clock stays
+# awake for HOST_AWAKE_MS after the host last talked to it, and hosts
+# send a wake preamble after a quiet spell (clock_host.Connection).
+import machine
+import esp32
+from machine import Pin
+from time import ticks_ms, ticks_diff, ticks_add
+
+IDLE_TIMEOUT_MS = 30000
+HOST_AWAKE_MS = 300000  # No sleep this long after the last host command
+FALLBACK_SLICE_MS = 250  # Max sleep when GPIO wake is not available
+UART_RX_PIN = 3
+
+
+class IdleManager:
+    def __init__(self, wake_pins, int_pin=None, idle_ms=IDLE_TIMEOUT_MS):
+        """`wake_pins` is a list of (Pin, handler, trigger) tuples whose
+        normal IRQ is restored after waking. `int_pin` is the DS3231 INT
+        pin number (must be an RTC GPIO for ext0 wake).
+        """
+        self.idle_ms = idle_ms
+        self.enabled = True
+        # Callable: True if input is waiting (events, UART); checked after
+        # every wake because the fallback path only ever sees TIMER_WAKE
+        self.pending = None
+        self._wake_pins = wake_pins
+        self._last = ticks_ms()
+        self._host_last = ticks_add(self._last, -HOST_AWAKE_MS - 1)  # No host yet
+        self._gpio_wake = True
+        self._int_pin = None
+        if int_pin is not None:
+            self._int_pin = Pin(int_pin, Pin.IN, Pin.PULL_UP)
+            esp32.wake_on_ext0(pin=self._int_pin, level=esp32.WAKEUP_ALL_LOW)
+
+    def touch(self):
+        """Record user activity."""
+        self._last = ticks_ms()
+
+    def touch_host(self):
+        """Record host (UART) activity: stay awake for HOST_AWAKE_MS."""
+        self._last = self._host_last = ticks_ms()
+
+    def idle(self):
+        now = ticks_ms()
+        return (self.enabled and ticks_diff(now, self._last) > self.idle_ms
+                and ticks_diff(now, self._host_last) > HOST_AWAKE_MS)
+
+    def _arm(self):
+        # Level wake on the opposite of each pin's current level, so any
+        # edge (encoder step, button press, UART start bit) wakes the chip.
+        if not self._gpio_wake:
+            return False
+        try:
+            for pin, _, _ in self._wake_pins:
+                trig = Pin.WAKE_LOW if pin.value() else Pin.WAKE_HIGH
+                pin.irq(trigger=trig, wake=machine.SLEEP)
+            Pin(UART_RX_PIN).irq(trigger=Pin.WAKE_LOW, wake=machine.SLEEP)
+            return True
+        except (AttributeError, ValueError, TypeError) as e:
+            print("GPIO wake unavailable:", e)
+            self._gpio_wake = False
+            self._disarm()
+            return False
+
+    def _disarm(self):
+        for pin, handler, trigger in self._wake_pins:
+            pin.irq(trigger=trigger, handler=handler)
+        try:
+            Pin(UART_RX_PIN).irq(handler=None)
+        except Exception:
+            pass
+
+    def sleep(self, ms):
+        """Light sleep for up to `ms`. Returns True if woken by user input
+        (button, encoder or UART), False for timer or RTC INT wake.
+        """
+        if self._arm():
+            machine.lightsleep(ms)
+            self._disarm()
+        else:
+            machine.lightsleep(min(ms, FALLBACK_SLICE_MS))
+        reason = machine.wake_reason()
+        user = reason not in (machine.TIMER_WAKE, machine.EXT0_WAKE)
+        if not user and self.pending:
+            user = self.pending()
+        if user:
+            self.touch()
+        return user
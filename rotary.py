@@ -8,6 +8,7 @@
 #   https://github.com/MikeTeachman/micropython-rotary
 
 import micropython
+from time import ticks_us, ticks_diff
 
 _DIR_CW = const(0x10)  # Clockwise step
 _DIR_CCW = const(0x20)  # Counter-clockwise step
@@ -46,22 +47,23 @@ _transition_table_half_step = [
     [_R_START,           _R_START, _R_START, _R_START],
     [_R_START,           _R_START, _R_START, _R_START]]
 
+# The ISR uses the tables above flattened into bytes, indexed by
+# (state << 2) | clk_dt_pins
+_FLAT_TABLE = bytes(n for row in _transition_table for n in row)
+_FLAT_TABLE_HALF_STEP = bytes(n for row in _transition_table_half_step for n in row)
+
 _STATE_MASK = const(0x07)
 _DIR_MASK = const(0x30)
 
+# Range handling selected in _configure(), not per edge
+_MODE_UNBOUNDED = const(0)
+_MODE_WRAP = const(1)
+_MODE_BOUNDED = const(2)
 
-def _wrap(value, incr, lower_bound, upper_bound):
-    range = upper_bound - lower_bound + 1
-    value = value + incr
-
-    if value < lower_bound:
-        value += range * ((lower_bound - value) // range + 1)
-
-    return lower_bound + (value - lower_bound) % range
-
-
-def _bound(value, incr, lower_bound, upper_bound):
-    return min(upper_bound, max(lower_bound, value + incr))
+# Acceleration defaults: detents closer together than ACCEL_SLOW_MS are
+# multiplied, up to the configured maximum for the fastest bucket
+ACCEL_SLOW_MS = const(150)
+ACCEL_BUCKETS = const(16)
 
 
 def _trigger(rotary_instance):
@@ -86,6 +88,12 @@ class Rotary(object):
         self._half_step = half_step
         self._invert = invert
         self._listener = []
+        self._event_sink = None
+        self._accel = b""
+        self._accel_bucket_us = 1
+        self._last_us = 0
+        self._last_dir = 0
+        self._configure()
 
     def set(self, value=None, min_val=None, incr=None,
             max_val=None, reverse=None, range_mode=None):
@@ -105,6 +113,7 @@ class Rotary(object):
         if range_mode is not None:
             self._range_mode = range_mode
         self._state = _R_START
+        self._configure()
 
         # enable DT and CLK pin interrupts
         self._hal_enable_irq()
@@ -121,54 +130,86 @@ class Rotary(object):
     def add_listener(self, l):
         self._listener.append(l)
 
+    def set_acceleration(self, max_mult=1, slow_ms=ACCEL_SLOW_MS, buckets=ACCEL_BUCKETS, power=2):
+        """Scale `incr` by rotation speed. The time between detents is
+        bucketed into `buckets` slices of `slow_ms`; a detent in bucket i
+        moves 1 + (max_mult - 1) * ((buckets - i) / buckets) ** power
+        steps, slower than `slow_ms` moves one. max_mult=1 turns it off.
+        Wrap and bound limits still apply to the accelerated value.
+        """
+        table = b""
+        if max_mult > 1:
+            table = bytes(min(255, int(1 + (max_mult - 1) * ((buckets - i) / buckets) ** power))
+                          for i in range(buckets))
+        self._hal_disable_irq()
+        self._accel_bucket_us = max(1, slow_ms * 1000 // buckets)
+        self._accel = table
+        self._last_dir = 0
+        self._hal_enable_irq()
+
+    def set_event_sink(self, sink):
+        # sink(delta) is called from IRQ context on every value change
+        self._event_sink = sink
+
     def remove_listener(self, l):
         if l not in self._listener:
             raise ValueError('{} is not an installed listener'.format(l))
         self._listener.remove(l)
         
-    def _process_rotary_pins(self, pin):
-        old_value = self._value
-        clk_dt_pins = (self._hal_get_clk_value() <<
-                       1) | self._hal_get_dt_value()
-                       
-        if self._invert:
-            clk_dt_pins = ~clk_dt_pins & 0x03
-            
-        # Determine next state
-        if self._half_step:
-            self._state = _transition_table_half_step[self._state &
-                                                      _STATE_MASK][clk_dt_pins]
-        else:
-            self._state = _transition_table[self._state &
-                                            _STATE_MASK][clk_dt_pins]
-        direction = self._state & _DIR_MASK
-
-        incr = 0
-        if direction == _DIR_CW:
-            incr = self._incr
-        elif direction == _DIR_CCW:
-            incr = -self._incr
-
-        incr *= self._reverse
-
+    def _configure(self):
+        # Everything the ISR needs, decided once here instead of per edge
+        self._table = _FLAT_TABLE_HALF_STEP if self._half_step else _FLAT_TABLE
+        self._pin_xor = 0x03 if self._invert else 0
+        self._step = self._incr * self._reverse
         if self._range_mode == self.RANGE_WRAP:
-            self._value = _wrap(
-                self._value,
-                incr,
-                self._min_val,
-                self._max_val)
+            self._mode = _MODE_WRAP
         elif self._range_mode == self.RANGE_BOUNDED:
-            self._value = _bound(
-                self._value,
-                incr,
-                self._min_val,
-                self._max_val)
+            self._mode = _MODE_BOUNDED
         else:
-            self._value = self._value + incr
+            self._mode = _MODE_UNBOUNDED
 
-        try:
-            if old_value != self._value and len(self._listener) != 0:
+    # The compiler only honours the literal decorator name, not an alias.
+    # The ESP32 port ships the native emitter.
+    @micropython.native
+    def _process_rotary_pins(self, pin):
+        pins = ((self._hal_get_clk_value() << 1) | self._hal_get_dt_value()) ^ self._pin_xor
+        state = self._table[((self._state & _STATE_MASK) << 2) | pins]
+        self._state = state
+        direction = state & _DIR_MASK
+        if not direction:
+            return
+        step = self._step
+        table = self._accel
+        if table:
+            # Speed up on quick detents in the same direction
+            now = ticks_us()
+            bucket = ticks_diff(now, self._last_us) // self._accel_bucket_us
+            self._last_us = now
+            # Negative after a ticks_us wrap or on the first detent
+            # (_last_us 0): would index the table from the end
+            if direction == self._last_dir and 0 <= bucket < len(table):
+                step *= table[bucket]
+            self._last_dir = direction
+        old_value = self._value
+        value = old_value + (step if direction == _DIR_CW else -step)
+        mode = self._mode
+        if mode == _MODE_WRAP:
+            lo = self._min_val
+            if value < lo or value > self._max_val:
+                value = lo + (value - lo) % (self._max_val - lo + 1)
+        elif mode == _MODE_BOUNDED:
+            if value < self._min_val:
+                value = self._min_val
+            elif value > self._max_val:
+                value = self._max_val
+        if value == old_value:
+            return
+        self._value = value
+
+        if self._event_sink is not None:
+            self._event_sink(value - old_value)
+        if self._listener:
+            try:
                 _trigger(self)
-        except:
-            pass
-
+            except:
+                pass
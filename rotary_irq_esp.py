@@ -18,7 +18,8 @@ _esp8266_deny_pins = [16]
 class RotaryIRQ(Rotary):
 
     def __init__(self, pin_num_clk, pin_num_dt, min_val=0, max_val=10, incr=1,
-                 reverse=False, range_mode=Rotary.RANGE_UNBOUNDED, pull_up=False, half_step=False, invert=False):
+                 reverse=False, range_mode=Rotary.RANGE_UNBOUNDED, pull_up=False, half_step=False, invert=False,
+                 accel=1):
 
         if platform == 'esp8266':
             if pin_num_clk in _esp8266_deny_pins:
@@ -41,6 +42,8 @@ class RotaryIRQ(Rotary):
 
         self._enable_clk_irq(self._process_rotary_pins)
         self._enable_dt_irq(self._process_rotary_pins)
+        if accel > 1:
+            self.set_acceleration(accel)
 
     def _enable_clk_irq(self, callback=None):
         self._pin_clk.irq(
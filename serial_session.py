@@ -0,0 +1,326 @@
+# serial_session.py
+# Host-side (CPython) record and replay of serial sessions, so device
+# interactions can be reproduced and the host's reader measured without
+# hardware.
+#
+# A session file is MAGIC followed by records: RECORD_HEAD (time.time(),
+# direction, length) and that many bytes. Directions are b"<" read from
+# the device, b">" written to it and b"!" port opened (data: port name).
+# Reads keep the chunking of the original port.
+#
+# ReplayPort plays the reads back at their recorded pace times `speed`
+# (0: as fast as the reader takes them) as a pyserial stand-in for
+# clock_host.Connection(opener=...); what the host writes is kept in
+# ReplayPort.written. serve_pty() plays them into a pseudo-terminal that
+# any serial program can open (Linux, macOS).
+#
+#   python serial_session.py show FILE
+#   python serial_session.py replay FILE [--speed X]   (lines as parsed)
+#   python serial_session.py bench FILE [--speed X] [--gui]
+#   python serial_session.py pty FILE [--speed X]
+import argparse
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+MAGIC = b"SES1"
+RECORD_HEAD = "<dcH"
+HEAD_SIZE = struct.calcsize(RECORD_HEAD)
+MAX_CHUNK = 0xFFFF
+READ = b"<"
+WRITE = b">"
+OPEN = b"!"
+
+
+def session_path(directory, port):
+    """New file name for a session on `port` in `directory`."""
+    safe = "".join(c if c.isalnum() or c in "_.-" else "_" for c in port.strip("/")) or "port"
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S-%f")
+    return os.path.join(directory, f"{safe}-{stamp}.ses")
+
+
+class SessionRecorder:
+    """Appends records to one session file; thread-safe. Writes after
+    close() are ignored, so a reader thread may race the owner.
+    """
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._file = open(path, "wb", buffering=64 * 1024)
+        self._file.write(MAGIC)
+        self._lock = threading.Lock()
+
+    def write(self, direction, data, t=None):
+        if t is None:
+            t = time.time()
+        with self._lock:
+            if self._file is None:
+                return
+            for i in range(0, len(data), MAX_CHUNK):
+                chunk = data[i:i + MAX_CHUNK]
+                self._file.write(struct.pack(RECORD_HEAD, t, direction, len(chunk)))
+                self._file.write(chunk)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def load(path):
+    """[(time, direction, bytes)] of a session file; a torn last record
+    (recorder killed mid-write) is dropped.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path}: not a session file")
+    records = []
+    pos = len(MAGIC)
+    while pos + HEAD_SIZE <= len(data):
+        t, direction, n = struct.unpack_from(RECORD_HEAD, data, pos)
+        pos += HEAD_SIZE
+        if pos + n > len(data):
+            break
+        records.append((t, direction, data[pos:pos + n]))
+        pos += n
+    return records
+
+
+def _schedule(records, speed):
+    # (seconds after start, bytes) of every read
+    reads = [(t, data) for t, direction, data in records if direction == READ]
+    if not reads:
+        return []
+    t0 = reads[0][0]
+    return [((t - t0) / speed if speed else 0.0, data) for t, data in reads]
+
+
+class ReplayPort:
+    """Enough of serial.Serial for clock_host.Connection: read() returns
+    the recorded reads one at a time once they are due, each whole
+    whatever `size` asks for, so the reader sees the original chunking.
+    `idle` is set when the reader asks for more after the last one, i.e.
+    it has finished handling everything.
+    """
+
+    def __init__(self, records, speed=1.0, timeout=0.1):
+        self.timeout = timeout
+        self.written = bytearray()
+        self.idle = threading.Event()
+        self._reads = _schedule(records, speed)
+        self._next = 0
+        self._start = time.monotonic()
+        self._closed = False
+
+    def opener(self, port, baudrate, timeout=None):
+        """For Connection(opener=...): one session, so one open."""
+        if self._closed:
+            raise OSError("replay finished")
+        if timeout is not None:
+            self.timeout = timeout
+        self._start = time.monotonic()
+        return self
+
+    @property
+    def in_waiting(self):
+        if self._next < len(self._reads) and self._due() <= 0:
+            return len(self._reads[self._next][1])
+        return 0
+
+    def _due(self):
+        return self._reads[self._next][0] - (time.monotonic() - self._start)
+
+    def read(self, size=1):
+        if self._closed:
+            raise OSError("port closed")
+        if self._next >= len(self._reads):
+            self.idle.set()
+            time.sleep(self.timeout)
+            return b""
+        wait = self._due()
+        if wait > 0:
+            time.sleep(min(wait, self.timeout))
+            if self._due() > 0:
+                return b""
+        data = self._reads[self._next][1]
+        self._next += 1
+        return data
+
+    def write(self, data):
+        if self._closed:
+            raise OSError("port closed")
+        self.written += data
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        pass
+
+    def close(self):
+        self._closed = True
+
+
+def serve_pty(records, speed=1.0, echo=False):
+    """Play the reads of `records` into a new pseudo-terminal, started
+    and closed by pressing Enter. Host writes are drained (and printed with
+    `echo`) so the other side never blocks.
+    """
+    import tty
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    print(f"Serving on {os.ttyname(slave)}; open it, then press Enter", flush=True)
+    sys.stdin.readline()
+    stop = threading.Event()
+
+    def drain():
+        while not stop.is_set():
+            try:
+                data = os.read(master, 4096)
+            except OSError:
+                return
+            if echo:
+                print(f"> {data!r}", flush=True)
+
+    threading.Thread(target=drain, daemon=True).start()
+    start = time.monotonic()
+    for at, data in _schedule(records, speed):
+        wait = at - (time.monotonic() - start)
+        if wait > 0:
+            time.sleep(wait)
+        os.write(master, data)
+    # Closing the master hangs up the other side, unread bytes with it
+    print(f"Replayed in {time.monotonic() - start:.2f} s; press Enter to close", flush=True)
+    sys.stdin.readline()
+    stop.set()
+    os.close(slave)
+    os.close(master)
+
+
+def replay_link(records, speed=0.0, on_line=None):
+    """Feed `records` through clock_host.ClockLink's reader; returns the
+    lines it would hand to on_line, in order.
+    """
+    from clock_host import ClockLink
+    port = ReplayPort(records, speed)
+    link = ClockLink("replay", opener=port.opener)
+    lines = []
+
+    def handle(link, line):
+        lines.append(line)
+        if on_line:
+            on_line(line)
+
+    link.on_line = handle
+    link.open()
+    port.idle.wait()
+    link.close()
+    return lines
+
+
+def bench_gui(records, speed=0.0):
+    """Feed `records` through the GUI's reader (on_serial_data and
+    handle_line) and log path (log_message, flush_log) on a hidden Tk
+    window; returns (seconds, UI frames). History and telemetry go to a
+    temporary directory and no real port is probed. Needs a display.
+    """
+    import tkinter as tk
+    import telemetry
+    import win_gui_app
+    from clock_host import Connection
+    scratch = tempfile.mkdtemp(prefix="session-bench-")
+    win_gui_app.LOG_HISTORY_FILE = os.path.join(scratch, "action_log.txt")
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        raise RuntimeError(f"the GUI needs a display: {e}") from None
+    root.withdraw()
+
+    class BenchApp(win_gui_app.AlarmControlApp):
+        def refresh_ports(self):
+            pass  # discovery would open every serial port on this machine
+
+    app = BenchApp(root)
+    app.telemetry_recorder = telemetry.Recorder(scratch)
+    port = ReplayPort(records, speed)
+    frames = [0]
+    start = time.perf_counter()
+    elapsed = [0.0]
+
+    def check():
+        frames[0] += 1
+        if port.idle.is_set() and app.serial_queue.empty():
+            elapsed[0] = time.perf_counter() - start
+            app.on_closing()
+        else:
+            root.after(win_gui_app.UI_FRAME_MS, check)
+
+    app.conn = Connection("replay", on_data=app.on_serial_data,
+                          on_state=app.on_connection_state, opener=port.opener)
+    app.conn.start()
+    root.after(win_gui_app.UI_FRAME_MS, check)
+    root.mainloop()
+    return elapsed[0], frames[0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="serial_session", description="Show and replay recorded serial sessions.")
+    sub = parser.add_subparsers(dest="action", required=True)
+    for name in ("show", "replay", "bench", "pty"):
+        p = sub.add_parser(name)
+        p.add_argument("file")
+        if name != "show":
+            p.add_argument("--speed", type=float, default=0.0 if name == "bench" else 1.0,
+                           help="replay pace, 1 = as recorded, 0 = as fast as possible")
+    sub.choices["bench"].add_argument("--gui", action="store_true",
+                                      help="through win_gui_app instead of clock_host.ClockLink")
+    sub.choices["pty"].add_argument("--echo", action="store_true", help="print what the host writes")
+    args = parser.parse_args(argv)
+    try:
+        records = load(args.file)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    if args.action == "show":
+        t0 = records[0][0] if records else 0.0
+        for t, direction, data in records:
+            print(f"{t - t0:10.6f} {direction.decode()} {data!r}")
+        return 0
+    if args.action == "replay":
+        replay_link(records, args.speed, print)
+        return 0
+    if args.action == "pty":
+        serve_pty(records, args.speed, args.echo)
+        return 0
+
+    size = sum(len(data) for _, direction, data in records if direction == READ)
+    lines = sum(data.count(b"\n") for _, direction, data in records if direction == READ)
+    if args.gui:
+        try:
+            elapsed, frames = bench_gui(records, args.speed)
+        except RuntimeError as e:
+            parser.error(str(e))
+        extra = f", {frames} UI frames"
+    else:
+        start = time.perf_counter()
+        replay_link(records, args.speed)
+        elapsed = time.perf_counter() - start
+        extra = ""
+    elapsed = max(elapsed, 1e-9)
+    print(f"{size} bytes, {lines} lines in {elapsed:.3f} s: "
+          f"{size / elapsed / 1024:.0f} KiB/s, {lines / elapsed:.0f} lines/s{extra}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+# sntp.py
+# Multi-sample SNTP client for the DS3231 clock.
+#
+# Takes several SNTP samples, keeps the one with the lowest round-trip delay
+# and maps the local ticks_us timeline onto server time. The RTC is then
+# written exactly at a second boundary, which also resets the DS3231
+# countdown chain, so the clock ticks in step with the NTP second.
+import socket
+import struct
+from time import gmtime
+try:
+    from time import ticks_us, ticks_ms, ticks_diff, ticks_add, sleep_ms
+except ImportError:
+    pass  # CPython: only parse_reply() is usable, e.g. from host tests
+
+NTP_PORT = 123
+NTP_SAMPLES = 4
+NTP_TIMEOUT = 1  # seconds per sample
+WRITE_MARGIN_US = 20000  # minimum time left before the boundary we aim for
+
+# NTP counts from 1900, MicroPython from 2000 (or 1970 on newer ports)
+if gmtime(0)[0] == 2000:
+    NTP_DELTA = 3155673600
+else:
+    NTP_DELTA = 2208988800
+
+_US_TICKS_SAFE = 500000000  # ticks_us stays comparable for ~536 s
+
+
+def _ntp_to_us(buf, offset):
+    sec, frac = struct.unpack_from("!II", buf, offset)
+    return (sec - NTP_DELTA) * 1000000 + ((frac * 1000000 + 0x80000000) >> 32)
+
+
+def parse_reply(pkt, t1, t4, n=48):
+    """(offset, delay) in microseconds from a server reply of `n` bytes
+    in `pkt`, sent at local time t1 and received at t4 (microseconds),
+    or None if it is not a usable server reply. Per RFC 4330:
+        offset = ((T2 - T1) + (T3 - T4)) / 2
+        delay  = (T4 - T1) - (T3 - T2)
+    """
+    if n < 48 or (pkt[0] & 0x07) != 4 or pkt[1] == 0:
+        return None  # not a server reply, or kiss-o'-death
+    t2 = _ntp_to_us(pkt, 32)
+    t3 = _ntp_to_us(pkt, 40)
+    return ((t2 - t1) + (t3 - t4)) // 2, (t4 - t1) - (t3 - t2)
+
+
+class NtpSample:
+    """Best SNTP sample: server time in microseconds at a local tick."""
+
+    def __init__(self, ref_us, ref_ms, server_us, delay_us):
+        self.ref_us = ref_us
+        self.ref_ms = ref_ms
+        self.server_us = server_us
+        self.delay_us = delay_us
+
+    def now_us(self):
+        """Current server time in microseconds since the local epoch."""
+        elapsed_ms = ticks_diff(ticks_ms(), self.ref_ms)
+        if elapsed_ms < _US_TICKS_SAFE // 1000:
+            return self.server_us + ticks_diff(ticks_us(), self.ref_us)
+        return self.server_us + elapsed_ms * 1000
+
+    def now(self):
+        """Current server time as (y, m, d, hh, mm, ss)."""
+        return gmtime(self.now_us() // 1000000)[:6]
+
+
+def query(host="pool.ntp.org", samples=NTP_SAMPLES, port=NTP_PORT, timeout=NTP_TIMEOUT):
+    """Send `samples` SNTP requests and return the lowest-delay NtpSample.
+    T1/T4 are taken from ticks_us relative to the first request, see
+    parse_reply().
+    """
+    addr = socket.getaddrinfo(host, port)[0][-1]
+    pkt = bytearray(48)
+    best = None
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        s.settimeout(timeout)
+        base_us = ticks_us()
+        base_ms = ticks_ms()
+        for _ in range(samples):
+            for i in range(48):
+                pkt[i] = 0
+            pkt[0] = 0x1B  # LI=0, VN=3, Mode=3 (client)
+            try:
+                t1 = ticks_diff(ticks_us(), base_us)
+                s.sendto(pkt, addr)
+                n = s.readinto(pkt)
+                t4 = ticks_diff(ticks_us(), base_us)
+            except OSError:
+                continue
+            sample = parse_reply(pkt, t1, t4, n)
+            if sample is not None and (best is None or sample[1] < best[1]):
+                best = sample
+    finally:
+        s.close()
+    if best is None:
+        raise OSError("no NTP reply")
+    return NtpSample(base_us, base_ms, best[0], best[1])
+
+
+def write_rtc(rtc, sample, tz_offset=0):
+    """Write the DS3231 exactly at the next second boundary of `sample`.
+
+    `tz_offset` (seconds) is added to the written wall time. Returns the
+    (y, m, d, hh, mm, ss) tuple written.
+    """
+    now = sample.now_us() + tz_offset * 1000000
+    target = (now // 1000000 + 1) * 1000000
+    if target - now < WRITE_MARGIN_US:
+        target += 1000000
+    dt = gmtime(target // 1000000)[:6]
+    deadline = ticks_add(ticks_us(), target - now)
+    remaining = ticks_diff(deadline, ticks_us())
+    if remaining > 5000:
+        sleep_ms((remaining - 5000) // 1000)
+    while ticks_diff(deadline, ticks_us()) > 0:
+        pass
+    rtc.set_time(dt)
+    return dt
@@ -0,0 +1,39 @@
+# songs.py
+# Built-in alarm tunes as packed melodies (see melody.py). Bytes literals
+# are kept in flash when this module is frozen into the firmware.
+
+# Mario theme, 150 ms per note
+mario = (
+    b'\x13\xb2\x13\xb2\x13\x00\x13\xb2\x13\x00\x13\xaa\x13\xb2\x13\x00'
+    b'\x13\xb8\x13\x00\x13\x00\x13\x00\x13\xa0\x13\x00\x13\x00\x13\x00'
+    b'\x13\xaa\x13\x00\x13\x00\x13\xa0\x13\x00\x13\x00\x13\x9a\x13\x00'
+    b'\x13\x00\x13\xa4\x13\x00\x13\xa8\x13\x00\x13\xa6\x13\xa4\x13\x00'
+    b'\x13\xa0\x13\xb2\x13\x00\x13\xb8\x13\xbc\x13\x00\x13\xb4\x13\xb8'
+    b'\x13\x00\x13\xb2\x13\x00\x13\xaa\x13\xae\x13\xa8\x13\x00\x13\x00'
+    b'\x13\xaa\x13\x00\x13\x00\x13\xa0\x13\x00\x13\x00\x13\x9a\x13\x00'
+    b'\x13\x00\x13\xa4\x13\x00\x13\xa8\x13\x00\x13\xa6\x13\xa4\x13\x00'
+    b'\x13\xa0\x13\xb2\x13\x00\x13\xb8\x13\xbc\x13\x00\x13\xb4\x13\xb8'
+    b'\x13\x00\x13\xb2\x13\x00\x13\xaa\x13\xae\x13\xa8\x13\x00\x13\x00'
+)
+
+# Jingle Bells, 250 ms per note
+jingle = (
+    b'\x1f\xb2\x1f\xb2\x1f\xb2\x1f\x00\x1f\xb2\x1f\xb2\x1f\xb2\x1f\x00'
+    b'\x1f\xb2\x1f\xb8\x1f\xaa\x1f\xae\x1f\xb2\x1f\x00\x1f\xb4\x1f\xb4'
+    b'\x1f\xb4\x1f\xb4\x1f\xb4\x1f\xb2\x1f\xb2\x1f\xb2\x1f\xb2\x1f\xae'
+    b'\x1f\xae\x1f\xb2\x1f\xae\x1f\x00\x1f\xb8\x1f\x00\x1f\xb2\x1f\xb2'
+    b'\x1f\xb2\x1f\x00\x1f\xb2\x1f\xb2\x1f\xb2\x1f\x00\x1f\xb2\x1f\xb8'
+    b'\x1f\xaa\x1f\xae\x1f\xb2\x1f\x00\x1f\xb4\x1f\xb4\x1f\xb4\x1f\xb4'
+    b'\x1f\xb4\x1f\xb2\x1f\xb2\x1f\xb2\x1f\xb8\x1f\xb8\x1f\xb4\x1f\xae'
+    b'\x1f\xaa\x1f\x00'
+)
+
+# Twinkle, Twinkle Little Star, 600 ms per note
+twinkle = (
+    b'K\x92K\x92K\xa0K\xa0K\xa4K\xa4K\xa0K\x00'
+    b'K\x9cK\x9cK\x9aK\x9aK\x96K\x96K\x92K\x00'
+    b'K\xa0K\xa0K\x9cK\x9cK\x9aK\x9aK\x96K\x00'
+    b'K\xa0K\xa0K\x9cK\x9cK\x9aK\x9aK\x96K\x00'
+    b'K\x92K\x92K\xa0K\xa0K\xa4K\xa4K\xa0K\x00'
+    b'K\x9cK\x9cK\x9aK\x9aK\x96K\x96K\x92K\x00'
+)
@@ -1,179 +1,252 @@
 from machine import Pin
 from machine import PWM
-from time import sleep_ms
+from machine import Timer
+from array import array
+from time import sleep_ms, ticks_ms, ticks_add, ticks_diff
+from melody import Melody, FREQ, DURATION_UNIT_MS
+from songs import mario, jingle, twinkle
 
 class GORILLACELL_BUZZER: 
     def __init__(self, sig_pin):
         self.pwm = PWM(Pin(sig_pin),duty_u16=0)      
         
-    def play(self, melodies, wait, duty=32767):
-        for note in melodies:
-            if note != 0:
-                self.pwm.freq(note)
-            self.pwm.duty_u16(duty)
-            sleep_ms(wait)
-        # Disable the pulse, setting the duty to 0
-        self.pwm.duty_u16(0)
-        # Disconnect the pwm driver
-        #self.pwm.deinit() # remove to play the next melodies
-        
+    def notes(self, melodies, wait=0, duty=32767):
+        """Generator: starts each note and yields how long (ms) to hold it.
+        The caller decides how to wait, so nothing here blocks.
+        """
+        # A Melody carries its own note lengths; lists of Hz use `wait`
+        try:
+            if isinstance(melodies, Melody):
+                for i in range(len(melodies)):
+                    word = melodies.word(i)
+                    if word >> 9:
+                        self.pwm.freq(FREQ[word >> 9])
+                        self.pwm.duty_u16(duty)
+                    else:
+                        self.pwm.duty_u16(0)
+                    yield (word & 0x1FF) * DURATION_UNIT_MS
+            else:
+                for note in melodies:
+                    if note != 0:
+                        self.pwm.freq(note)
+                    self.pwm.duty_u16(duty)
+                    yield wait
+        finally:
+            # Disable the pulse, setting the duty to 0
+            self.pwm.duty_u16(0)
+
+    def play(self, melodies, wait=0, duty=32767):
+        # Blocking: holds each note with sleep_ms
+        for ms in self.notes(melodies, wait, duty):
+            sleep_ms(ms)
+
+    async def play_async(self, melodies, wait=0, duty=32767):
+        # Yields to other asyncio tasks between notes; cancel to stop
+        import asyncio
+        for ms in self.notes(melodies, wait, duty):
+            await asyncio.sleep_ms(ms)
+
     def tone(self, notes, wait, duty=32767):
         self.pwm.freq(notes)
         self.pwm.duty_u16(duty)
         sleep_ms(wait)
         self.pwm.duty_u16(0)
 
-# Notes and its equivalent frequency
-           # Octave 0 ********************
-B0  = 31   # B
-           # Octave 1 ********************
-C1  = 33   # C
-CS1 = 35   # C#/Db
-D1  = 37   # D
-DS1 = 39   # D#/Eb
-E1  = 41   # E
-F1  = 44   # F
-FS1 = 46   # F#/Gb
-G1  = 49   # G
-GS1 = 52   # G#/Ab
-A1  = 55   # A
-AS1 = 58   # A#/Bb
-B1  = 62   # B
-           # Octave 2 ********************
-C2  = 65   # C
-CS2 = 69   # C#/Db
-D2  = 73   # D
-DS2 = 78   # D#/Eb
-E2  = 82   # E
-F2  = 87   # F
-FS2 = 93   # F#/Gb
-G2  = 98   # G
-GS2 = 104  # G#/Ab
-A2  = 110  # A
-AS2 = 117  # A#/Bb
-B2  = 123  # B
-           # Octave 3 ********************
-C3  = 131  # C
-CS3 = 139  # C#/Db
-D3  = 147  # D
-DS3 = 156  # D#/Eb
-E3  = 165  # E
-F3  = 175  # F
-FS3 = 185  # F#/Gb
-G3  = 196  # G
-GS3 = 208  # G#/Ab
-A3  = 220  # A
-AS3 = 233  # A#/Bb
-B3  = 247  # B
-           # Octave 4 ********************
-C4  = 262  # C
-CS4 = 277  # C#/Db
-D4  = 294  # D
-DS4 = 311  # D#/Eb
-E4  = 330  # E
-F4  = 349  # F
-FS4 = 370  # F#/Gb
-G4  = 392  # G
-GS4 = 415  # G#/Ab
-A4  = 440  # A
-AS4 = 466  # A#/Bb
-B4  = 494  # B
-           # Octave 5 ********************
-C5  = 523  # C
-CS5 = 554  # C#/Db
-D5  = 587  # D
-DS5 = 622  # D#/Eb
-E5  = 659  # E
-F5  = 698  # F
-FS5 = 740  # F#/Gb
-G5  = 784  # G
-GS5 = 831  # G#/Ab
-A5  = 880  # A
-AS5 = 932  # A#/Bb
-B5  = 988  # B
-           # Octave 6 ********************
-C6  = 1047 # C
-CS6 = 1109 # C#/Db
-D6  = 1175 # D
-DS6 = 1245 # D#/Eb
-E6  = 1319 # E
-F6  = 1397 # F
-FS6 = 1480 # F#/Gb
-G6  = 1568 # G
-GS6 = 1661 # G#/Ab
-A6  = 1760 # A
-AS6 = 1865 # A#/Bb
-B6  = 1976 # B
-           # Octave 7 ********************
-C7  = 2093 # C
-CS7 = 2217 # C#/Db
-D7  = 2349 # D
-DS7 = 2489 # D#/Eb
-E7  = 2637 # E
-F7  = 2794 # F
-FS7 = 2960 # F#/Gb
-G7  = 3136 # G
-GS7 = 3322 # G#/Ab
-A7  = 3520 # A
-AS7 = 3729 # A#/Bb
-B7  = 3951 # B
-           # Octave 8 ********************
-C8  = 4186 # C
-CS8 = 4435 # C#/Db
-D8  = 4699 # D
-DS8 = 4978 # D#/Eb
-
-
-
-# This is the list of notes for mario theme
-# 0 denotes rest notes
-mario = [
-     E7, E7,  0, E7,  0, C7, E7,  0,
-     G7,  0,  0,  0, G6,  0,  0,  0,
-     C7,  0,  0, G6,  0,  0, E6,  0,
-      0, A6,  0, B6,  0,AS6, A6,  0,
-     G6, E7,  0, G7, A7,  0, F7, G7,
-      0, E7,  0, C7, D7, B6,  0,  0,
-     C7,  0,  0, G6,  0,  0, E6,  0,
-      0, A6,  0, B6,  0,AS6, A6,  0,
-     G6, E7,  0, G7, A7,  0, F7, G7,
-      0, E7,  0, C7, D7, B6,  0,  0,
-    ]
-
-# This is the list of notes for jingle bells
-jingle = [
-    E7, E7, E7, 0,
-    E7, E7, E7, 0,
-    E7, G7, C7, D7, E7, 0,
-    F7, F7, F7, F7, F7, E7, E7, E7, E7, D7, D7, E7, D7, 0, G7, 0,
-    E7, E7, E7, 0,
-    E7, E7, E7, 0,
-    E7, G7, C7, D7, E7, 0,
-    F7, F7, F7, F7, F7, E7, E7, E7, G7, G7, F7, D7, C7, 0 
-    ]
-
-# This is the list of notes for Twinkle, Twinkle Little Star
-twinkle = [
-    C6, C6, G6, G6, A6, A6, G6, 0,
-    F6, F6, E6, E6, D6, D6, C6, 0,
-    G6, G6, F6, F6, E6, E6, D6, 0,
-    G6, G6, F6, F6, E6, E6, D6, 0,
-    C6, C6, G6, G6, A6, A6, G6, 0,
-    F6, F6, E6, E6, D6, D6, C6, 0,
-    ]
-
-
-buzzer = GORILLACELL_BUZZER(25)
-
-def test_all():
+    async def tone_async(self, notes, wait, duty=32767):
+        import asyncio
+        self.pwm.freq(notes)
+        self.pwm.duty_u16(duty)
+        try:
+            await asyncio.sleep_ms(wait)
+        finally:
+            self.pwm.duty_u16(0)
+
+class Envelope:
+    """Precomputed volume shape for the Sequencer.
+
+    ramp:   duty rises from `min_duty` to `max_duty` over `ramp_ms` along a
+            quadratic curve (gentle start), stored as `steps` duty values.
+    attack/decay: optional per-note levels (1..256, 256 = full note duty),
+            each held `step_ms` at the start / end of every note.
+    All float math happens here; playback only indexes tables.
+    """
+
+    def __init__(self, max_duty=32767, min_duty=1000, ramp_ms=60000, steps=32,
+                 attack=(), decay=(), step_ms=10):
+        self.ramp = array("H", [0] * steps)
+        for i in range(steps):
+            f = i / (steps - 1) if steps > 1 else 1
+            self.ramp[i] = int(min_duty + (max_duty - min_duty) * f * f)
+        self.ramp_step_ms = max(1, ramp_ms // steps)
+        self.attack = array("H", attack)
+        self.decay = array("H", decay)
+        self.step_ms = step_ms
+        # Shorter notes are played flat, there is no room for the shape
+        self.min_note_ms = (len(attack) + len(decay) + 1) * step_ms
+
+    def duty(self, elapsed_ms):
+        i = elapsed_ms // self.ramp_step_ms
+        ramp = self.ramp
+        return ramp[i] if i < len(ramp) else ramp[len(ramp) - 1]
+
+
+class Sequencer:
+    """Plays a packed Melody on a GORILLACELL_BUZZER from a machine.Timer
+    callback.
+
+    Each note (and each envelope step) is scheduled against an absolute
+    deadline, so callback latency does not accumulate and the tempo holds
+    while the main loop is busy. start/pause/resume/stop may be called from
+    the UI at any time. Melodies are expected to be validated on load
+    (Melody.validate()); the callback does no checks.
+    """
+
+    def __init__(self, buzzer, timer_id=0):
+        self.buzzer = buzzer
+        self._timer = Timer(timer_id)
+        self._callback = self._tick  # Bound once, not per note
+        self._song = None
+        self._duty = 32767
+        self._env = None
+        self._loop = False
+        self._index = 0
+        self._start_at = 0
+        self._next_at = 0  # end of the current note
+        self._step_at = 0  # next envelope step inside the note
+        self._phase = 0  # 0: between notes, else envelope phase
+        self._base = 0
+        self._paused_at = 0
+        self.playing = False
+        self.paused = False
+
+    def start(self, song, duty=32767, loop=False, envelope=None):
+        """Play `song`, a Melody (see melody.py), at a fixed `duty` or
+        shaped by an Envelope.
+        """
+        self.stop()
+        self._song = song
+        self._duty = duty
+        self._env = envelope
+        self._loop = loop
+        self._index = 0
+        self._phase = 0
+        self.playing = True
+        self.paused = False
+        self._start_at = self._next_at = ticks_ms()
+        self._tick(None)
+
+    def pause(self):
+        if not self.playing or self.paused:
+            return
+        self.paused = True
+        self._timer.deinit()
+        self._paused_at = ticks_ms()
+        self.buzzer.pwm.duty_u16(0)
+
+    def resume(self):
+        if not self.playing or not self.paused:
+            return
+        self.paused = False
+        # Shift every deadline by the pause, then finish the interrupted
+        # note (or step) silently and carry on
+        shift = ticks_diff(ticks_ms(), self._paused_at)
+        self._start_at = ticks_add(self._start_at, shift)
+        self._next_at = ticks_add(self._next_at, shift)
+        self._step_at = ticks_add(self._step_at, shift)
+        self._schedule(self._step_at if self._phase else self._next_at)
+
+    def stop(self):
+        self.playing = False
+        self.paused = False
+        self._timer.deinit()
+        self.buzzer.pwm.duty_u16(0)
+        # File-backed melodies (melody.FileMelody) hold an open file
+        close = getattr(self._song, "close", None)
+        if close:
+            close()
+        self._song = None
+
+    def _schedule(self, at):
+        delay = ticks_diff(at, ticks_ms())
+        self._timer.init(mode=Timer.ONE_SHOT, period=max(1, delay),
+                         callback=self._callback)
+
+    def _tick(self, timer):
+        if not self.playing or self.paused:
+            return
+        if self._phase:
+            self._envelope_step()
+            return
+        song = self._song
+        if self._index >= len(song):
+            if not self._loop:
+                self.stop()
+                return
+            self._index = 0
+        word = song.word(self._index)
+        start = self._next_at
+        dur = (word & 0x1FF) * DURATION_UNIT_MS
+        self._next_at = ticks_add(start, dur)
+        pwm = self.buzzer.pwm
+        env = self._env
+        duty = self._duty if env is None else env.duty(ticks_diff(start, self._start_at))
+        if word >> 9:
+            pwm.freq(FREQ[word >> 9])
+            if env is not None and dur > env.min_note_ms and (env.attack or env.decay):
+                self._base = duty
+                self._step_at = start
+                self._phase = 1
+                self._envelope_step()
+                return
+            pwm.duty_u16(duty)
+        else:
+            pwm.duty_u16(0)
+        self._index += 1
+        self._schedule(self._next_at)
+
+    def _envelope_step(self):
+        # Phases: 1..A attack levels, A+1 sustain, A+2..A+1+D decay levels
+        env = self._env
+        p = self._phase
+        a = len(env.attack)
+        d = len(env.decay)
+        if p <= a:
+            level = env.attack[p - 1]
+            self._step_at = ticks_add(self._step_at, env.step_ms)
+        elif p == a + 1:
+            level = 256
+            self._step_at = ticks_add(self._next_at, -d * env.step_ms)
+        elif p <= a + 1 + d:
+            level = env.decay[p - a - 2]
+            self._step_at = ticks_add(self._step_at, env.step_ms)
+        else:
+            # Note finished: start the next one now
+            self._phase = 0
+            self._index += 1
+            self._tick(None)
+            return
+        self.buzzer.pwm.duty_u16((self._base * level) >> 8)
+        self._phase = p + 1
+        self._schedule(self._step_at)
+
+
+# Demo: nothing below runs (or claims a PWM channel) on import.
+DEMO_PIN = 25
+
+def test_all(buzzer=None):
+    if buzzer is None:
+        buzzer = GORILLACELL_BUZZER(DEMO_PIN)
     print("Playing mario.")
-    buzzer.play(mario, 150, 32767)
+    buzzer.play(Melody(mario))
     sleep_ms(1000)
 
     print("Playing jingle bells.")
-    buzzer.play(jingle, 250, 32767)
+    buzzer.play(Melody(jingle))
     sleep_ms(1000)
 
     print("Playing twinkle, twinkle little star.")
-    buzzer.play(twinkle, 600, 32767)
+    buzzer.play(Melody(twinkle))
+
 
+if __name__ == "__main__":
+    test_all()
@@ -0,0 +1,166 @@
+# stats.py
+# Runtime instrumentation: main-loop latency histogram, per-device I2C
+# counters, display throughput, heap/GC and worst-case handler times.
+#
+# Everything is off by default. While disabled, start() returns 0 and
+# stop() returns at once, and the I2C buses are the plain objects: the
+# counting proxies are only swapped in by enable().
+import gc
+import json
+from time import ticks_us, ticks_ms, ticks_diff
+
+# Upper bounds (us) of the loop time histogram buckets; the last is open
+LOOP_BUCKETS_US = (1000, 2000, 5000, 10000, 20000, 50000, 100000, 200000, 500000)
+
+
+class _I2CProbe:
+    """Counts transactions, bytes and time of an I2C bus per device."""
+
+    def __init__(self, i2c, stats):
+        self._i2c = i2c
+        self._stats = stats
+
+    def _done(self, addr, nbytes, t0):
+        self._stats._i2c_done(addr, nbytes, ticks_diff(ticks_us(), t0))
+
+    def writeto(self, addr, buf, *args):
+        t0 = ticks_us()
+        r = self._i2c.writeto(addr, buf, *args)
+        self._done(addr, len(buf), t0)
+        return r
+
+    def readfrom_mem(self, addr, memaddr, nbytes, *args):
+        t0 = ticks_us()
+        r = self._i2c.readfrom_mem(addr, memaddr, nbytes, *args)
+        self._done(addr, nbytes, t0)
+        return r
+
+    def readfrom_mem_into(self, addr, memaddr, buf, *args):
+        t0 = ticks_us()
+        r = self._i2c.readfrom_mem_into(addr, memaddr, buf, *args)
+        self._done(addr, len(buf), t0)
+        return r
+
+    def writeto_mem(self, addr, memaddr, buf, *args):
+        t0 = ticks_us()
+        r = self._i2c.writeto_mem(addr, memaddr, buf, *args)
+        self._done(addr, len(buf), t0)
+        return r
+
+    def __getattr__(self, name):
+        return getattr(self._i2c, name)
+
+
+class Stats:
+    def __init__(self, devices):
+        """`devices` maps a name to an object with `.i2c` and an address
+        attribute (`addr` or `i2c_addr`), e.g. {"lcd": lcd, "rtc": rtc}.
+        """
+        self.enabled = False
+        self._devices = devices
+        self._names = {}
+        for name, dev in devices.items():
+            self._names[getattr(dev, "addr", None) or getattr(dev, "i2c_addr", None)] = name
+        self.reset()
+
+    def reset(self):
+        self.loop_hist = [0] * (len(LOOP_BUCKETS_US) + 1)
+        self.loop_max_us = 0
+        self.loops = 0
+        self.i2c = {}
+        for name in self._devices:
+            self.i2c[name] = [0, 0, 0]  # transactions, bytes, us
+        self.handler_max_us = {}
+        self.gc_collections = 0
+        self.alloc_loops = 0  # iterations that allocated anything
+        self.alloc_bytes = 0
+        self._alloc0 = 0
+        self._last_free = gc.mem_free()
+        self._since = ticks_ms()
+
+    def enable(self):
+        if self.enabled:
+            return
+        for dev in self._devices.values():
+            dev.i2c = _I2CProbe(dev.i2c, self)
+        self.reset()
+        self.enabled = True
+
+    def disable(self):
+        if not self.enabled:
+            return
+        self.enabled = False
+        for dev in self._devices.values():
+            if isinstance(dev.i2c, _I2CProbe):
+                dev.i2c = dev.i2c._i2c
+
+    def _i2c_done(self, addr, nbytes, us):
+        c = self.i2c.get(self._names.get(addr))
+        if c is not None:
+            c[0] += 1
+            c[1] += nbytes
+            c[2] += us
+
+    def start(self):
+        return ticks_us() if self.enabled else 0
+
+    def stop(self, name, t0):
+        """Record the time since `t0` as a run of handler `name`."""
+        if not self.enabled:
+            return
+        dt = ticks_diff(ticks_us(), t0)
+        if dt > self.handler_max_us.get(name, 0):
+            self.handler_max_us[name] = dt
+
+    def loop_begin(self):
+        """Start of a main-loop iteration; pass the result to loop_done()."""
+        if not self.enabled:
+            return 0
+        self._alloc0 = gc.mem_alloc()
+        return ticks_us()
+
+    def loop_done(self, t0):
+        """Record one main-loop iteration that started at `t0`."""
+        if not self.enabled:
+            return
+        dt = ticks_diff(ticks_us(), t0)
+        i = 0
+        for bound in LOOP_BUCKETS_US:
+            if dt <= bound:
+                break
+            i += 1
+        self.loop_hist[i] += 1
+        self.loops += 1
+        if dt > self.loop_max_us:
+            self.loop_max_us = dt
+        # The heap only grows back when a collection has run
+        free = gc.mem_free()
+        if free > self._last_free:
+            self.gc_collections += 1
+        else:
+            alloc = gc.mem_alloc() - self._alloc0
+            if alloc > 0:
+                self.alloc_loops += 1
+                self.alloc_bytes += alloc
+        self._last_free = free
+
+    def dump(self):
+        """One line of JSON with everything collected since reset()."""
+        elapsed_ms = ticks_diff(ticks_ms(), self._since) or 1
+        lcd = self.i2c.get("lcd", (0, 0, 0))
+        return json.dumps({
+            "enabled": self.enabled,
+            "elapsed_ms": elapsed_ms,
+            "loops": self.loops,
+            "loop_max_us": self.loop_max_us,
+            "loop_buckets_us": LOOP_BUCKETS_US,
+            "loop_hist": self.loop_hist,
+            "i2c": self.i2c,
+            "display_bytes_per_s": lcd[1] * 1000 // elapsed_ms,
+            "gc_collections": self.gc_collections,
+            "alloc_loops": self.alloc_loops,
+            "alloc_bytes": self.alloc_bytes,
+            "mem_free": gc.mem_free(),
+            "mem_alloc": gc.mem_alloc(),
+            "handler_max_us": self.handler_max_us,
+        })
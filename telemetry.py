@@ -0,0 +1,216 @@
+# telemetry.py
+# Host-side (CPython) store for device telemetry (TELEMETRY lines/frames,
+# see main.py cmd_telemetry).
+#
+# One directory per device holds append-only files of fixed-size
+# little-endian records: host time (f64) followed by frame.TELEMETRY_FMT.
+# Files start with an 8-byte header and rotate at MAX_FILE_BYTES; at
+# most MAX_FILES are kept per device. Writes go through a file buffer
+# flushed every FLUSH_S, so a record costs one struct.pack and a memcpy.
+#
+#   python telemetry.py list [--dir DIR]
+#   python telemetry.py query DEVICE [--since ISO] [--until ISO]   (CSV)
+#   python telemetry.py plot DEVICE [--since ISO] [--until ISO]    (matplotlib)
+import argparse
+import os
+import re
+import struct
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+import frame
+
+TELEMETRY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "telemetry")
+MAGIC = b"TLM1"
+RECORD_FMT = "<d" + frame.TELEMETRY_FMT[1:]
+RECORD_SIZE = struct.calcsize(RECORD_FMT)
+HEADER = MAGIC + struct.pack("<HH", RECORD_SIZE, 0)
+MAX_FILE_BYTES = 4 * 1024 * 1024  # about 150k records
+MAX_FILES = 50
+FLUSH_S = 5.0
+FIELDS = ("host_time", "rtc", "ticks_ms", "temp_q", "mem_free", "loop_max_us", "flags")
+EPOCH_2000 = 946684800  # MicroPython ports with a 2000 epoch report this much less
+
+
+def device_dir(name):
+    """File-system safe directory name for a port or device id."""
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", name.strip("/")) or "device"
+
+
+def parse_line(data):
+    """Values of a "TELEMETRY:a:b:..." line's data part."""
+    values = tuple(int(v) for v in data.split(":"))
+    if len(values) != len(FIELDS) - 1:
+        raise ValueError("bad telemetry")
+    return values
+
+
+def parse_frame(payload):
+    return struct.unpack(frame.TELEMETRY_FMT, payload)
+
+
+def rtc_unix(rtc, flags=0):
+    """POSIX time of a device rtc count. The epoch is 2000 or 1970
+    depending on the port, as reported in `flags` (frame.EPOCH_*).
+    """
+    if flags & frame.EPOCH_1970:
+        return rtc
+    if flags & frame.EPOCH_2000:
+        return rtc + EPOCH_2000
+    # Records from firmware without the flags: 2000-based counts stay
+    # below 1e9 until September 2031
+    return rtc + EPOCH_2000 if rtc < 1000000000 else rtc
+
+
+class Recorder:
+    """Appends records for any number of devices; thread-safe."""
+
+    def __init__(self, root=TELEMETRY_DIR, max_bytes=MAX_FILE_BYTES, max_files=MAX_FILES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self._files = {}  # device -> [file, size, last flush]
+        self._lock = threading.Lock()
+
+    def write(self, device, values, host_time=None):
+        record = struct.pack(RECORD_FMT, time.time() if host_time is None else host_time, *values)
+        with self._lock:
+            entry = self._files.get(device)
+            if entry is None or entry[1] + RECORD_SIZE > self.max_bytes:
+                entry = self._rotate(device, entry)
+            entry[0].write(record)
+            entry[1] += RECORD_SIZE
+            now = time.monotonic()
+            if now - entry[2] >= FLUSH_S:
+                entry[0].flush()
+                entry[2] = now
+
+    def _rotate(self, device, entry):
+        if entry:
+            entry[0].close()
+        path = os.path.join(self.root, device_dir(device))
+        os.makedirs(path, exist_ok=True)
+        names = sorted(n for n in os.listdir(path) if n.endswith(".tlm"))
+        for old in names[:max(0, len(names) - self.max_files + 1)]:
+            os.remove(os.path.join(path, old))
+        name = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S-%f") + ".tlm"
+        f = open(os.path.join(path, name), "ab", buffering=64 * 1024)
+        f.write(HEADER)
+        entry = [f, len(HEADER), time.monotonic()]
+        self._files[device] = entry
+        return entry
+
+    def flush(self):
+        with self._lock:
+            for entry in self._files.values():
+                entry[0].flush()
+
+    def close(self):
+        with self._lock:
+            for entry in self._files.values():
+                entry[0].close()
+            self._files.clear()
+
+
+def devices(root=TELEMETRY_DIR):
+    try:
+        return sorted(d for d in os.listdir(root) if os.path.isdir(os.path.join(root, d)))
+    except OSError:
+        return []
+
+
+def read(device, since=None, until=None, root=TELEMETRY_DIR):
+    """Records of `device` (tuples in FIELDS order) with since <= host
+    time < until, oldest first. Whole files outside the range are skipped
+    by looking at their first and last record only.
+    """
+    path = os.path.join(root, device_dir(device))
+    try:
+        names = sorted(n for n in os.listdir(path) if n.endswith(".tlm"))
+    except OSError:
+        return
+    for name in names:
+        with open(os.path.join(path, name), "rb") as f:
+            data = f.read()
+        if data[:4] != MAGIC or struct.unpack_from("<H", data, 4)[0] != RECORD_SIZE:
+            continue
+        body = memoryview(data)[len(HEADER):]
+        body = body[:len(body) - len(body) % RECORD_SIZE]  # torn last write
+        if not body:
+            continue
+        if until is not None and struct.unpack_from("<d", body, 0)[0] >= until:
+            return
+        if since is not None and struct.unpack_from("<d", body, len(body) - RECORD_SIZE)[0] < since:
+            continue
+        for record in struct.iter_unpack(RECORD_FMT, body):
+            t = record[0]
+            if since is not None and t < since:
+                continue
+            if until is not None and t >= until:
+                return
+            yield record
+
+
+def drift(record):
+    """RTC minus host clock in seconds (1 s resolution from the RTC)."""
+    return rtc_unix(record[1], record[6]) - record[0]
+
+
+def _timestamp(text):
+    if text is None:
+        return None
+    dt = datetime.fromisoformat(text)
+    if dt.tzinfo is None:
+        dt = dt.astimezone()
+    return dt.timestamp()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="telemetry", description="Query recorded clock telemetry.")
+    parser.add_argument("--dir", default=TELEMETRY_DIR)
+    sub = parser.add_subparsers(dest="action", required=True)
+    sub.add_parser("list")
+    for name in ("query", "plot"):
+        p = sub.add_parser(name)
+        p.add_argument("device")
+        p.add_argument("--since", help="ISO date/time, local unless it has an offset")
+        p.add_argument("--until")
+    args = parser.parse_args(argv)
+
+    if args.action == "list":
+        for device in devices(args.dir):
+            print(device)
+        return 0
+    records = read(args.device, _timestamp(args.since), _timestamp(args.until), args.dir)
+    if args.action == "query":
+        print(",".join(FIELDS + ("drift_s", "temp_c")))
+        for r in records:
+            print(",".join(str(v) for v in r) + f",{drift(r):.3f},{r[3] / 4:.2f}")
+        return 0
+
+    try:
+        import matplotlib.pyplot as plt
+    except ImportError:
+        parser.error("plot needs matplotlib (pip install matplotlib); use query for CSV")
+    times, drifts, temps = [], [], []
+    for r in records:
+        times.append(datetime.fromtimestamp(r[0]))
+        drifts.append(drift(r))
+        temps.append(r[3] / 4)
+    if not times:
+        parser.error(f"no records for {args.device}")
+    fig, (ax1, ax2) = plt.subplots(2, 1, sharex=True)
+    ax1.plot(times, drifts)
+    ax1.set_ylabel("RTC drift (s)")
+    ax2.plot(times, temps, color="tab:red")
+    ax2.set_ylabel("Temperature (°C)")
+    fig.suptitle(args.device)
+    fig.autofmt_xdate()
+    plt.show()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
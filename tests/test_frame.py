@@ -0,0 +1,90 @@
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import frame  # noqa: E402
+
+
+def decoder():
+    frames = []
+    dec = frame.FrameDecoder(lambda seq, ftype, payload: frames.append((seq, ftype, payload)))
+    return dec, frames
+
+
+def test_round_trip():
+    dec, frames = decoder()
+    sent = [(0, frame.TIME_GET, b""), (1, frame.TIME, frame.pack_time((2026, 10, 19, 12, 0, 5))),
+            (255, frame.TEXT, b"ALARM_STATUS"), (7, frame.TELEMETRY, bytes(range(256)) * 4)]
+    for seq, ftype, payload in sent:
+        dec.feed(frame.encode(seq, ftype, payload))
+    assert frames == sent
+    assert frame.unpack_time(frames[1][2]) == (2026, 10, 19, 12, 0, 5)
+    assert dec.crc_errors == 0
+
+
+def test_ack():
+    dec, frames = decoder()
+    dec.feed(frame.encode_ack(3, 9, frame.ST_UNKNOWN))
+    assert frames == [(3, frame.ACK, bytes((9, frame.ST_UNKNOWN)))]
+
+
+def test_garbage_before_frame():
+    dec, frames = decoder()
+    # Stray print() output, and a SYNC byte whose length is impossible
+    dec.feed(b"Alarm triggered\r\n\xa5\xff\xff" + frame.encode(4, frame.TEXT, b"OK PING"))
+    assert frames == [(4, frame.TEXT, b"OK PING")]
+
+
+def test_corrupt_crc_is_dropped_and_next_frame_found():
+    dec, frames = decoder()
+    bad = bytearray(frame.encode(1, frame.TEXT, b"first"))
+    bad[-1] ^= 0xFF
+    dec.feed(bytes(bad) + frame.encode(2, frame.TEXT, b"second"))
+    assert frames == [(2, frame.TEXT, b"second")]
+    assert dec.crc_errors == 1
+
+
+def test_frame_inside_a_corrupt_one():
+    # A frame whose length field swallowed the next frame: the decoder
+    # rescans the bytes after the bad SYNC and finds it
+    dec, frames = decoder()
+    good = frame.encode(5, frame.TEXT, b"inner")
+    dec.feed(bytes((frame.SYNC, len(good), 0, 0, frame.TEXT)) + good + b"\x00\x00")
+    assert frames == [(5, frame.TEXT, b"inner")]
+
+
+def test_oversized_length_resyncs():
+    dec, frames = decoder()
+    dec.feed(bytes((frame.SYNC, 0xFF, 0xFF)) + frame.encode(6, frame.TIME_GET))
+    assert frames == [(6, frame.TIME_GET, b"")]
+
+
+def test_split_over_feeds():
+    data = b"".join(frame.encode(i, frame.TEXT, b"x" * i) for i in range(40))
+    rng = random.Random(1)
+    for _ in range(20):
+        dec, frames = decoder()
+        i = 0
+        while i < len(data):
+            n = rng.randint(1, 7)
+            dec.feed(data[i:i + n])
+            i += n
+        assert frames == [(i, frame.TEXT, b"x" * i) for i in range(40)]
+
+
+def test_long_garbage_burst():
+    # Many SYNC bytes in a row must not recurse per byte
+    dec, frames = decoder()
+    dec.feed(bytes((frame.SYNC, 4, 0)) * 2000 + frame.encode(8, frame.TEXT, b"after"))
+    assert frames[-1] == (8, frame.TEXT, b"after")
+
+
+def test_encode_rejects_long_payload():
+    try:
+        frame.encode(0, frame.TEXT, bytes(frame.MAX_PAYLOAD + 1))
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("expected ValueError")
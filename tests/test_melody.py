@@ -0,0 +1,114 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import frame  # noqa: E402
+import melody  # noqa: E402
+
+
+def stored(ms):
+    # Durations are kept in DURATION_UNIT_MS steps, rounded to nearest
+    return (ms + melody.DURATION_UNIT_MS // 2) // melody.DURATION_UNIT_MS * melody.DURATION_UNIT_MS
+
+
+def notes(m):
+    return [(m.word(i) >> 9, m.duration_ms(i)) for i in range(len(m))]
+
+
+def test_note_index():
+    assert melody.FREQ[melody.note_index("a4")] == 440
+    assert melody.note_index("C#5") == melody.note_index("cs5") == melody.note_index("c", 5) + 1
+    assert melody.note_index("p") == melody.note_index("R") == melody.REST
+
+
+def test_rtttl_defaults():
+    # d=4, o=6, b=63 when the section is empty
+    m = melody.parse_rtttl("Beep::c,8p")
+    whole = 240000 // 63
+    assert m.name == "Beep"
+    assert notes(m) == [(melody.note_index("c", 6), stored(whole // 4)), (melody.REST, stored(whole // 8))]
+
+
+def test_rtttl_explicit_defaults_and_overrides():
+    m = melody.parse_rtttl("t: d=8, o=5, b=120 :c,4d#,16e7,2p")
+    assert notes(m) == [(melody.note_index("c5"), stored(250)), (melody.note_index("d#5"), stored(500)),
+                        (melody.note_index("e7"), stored(125)), (melody.REST, stored(1000))]
+
+
+def test_rtttl_dotted_notes():
+    # The dot may come before or after the octave
+    m = melody.parse_rtttl("t:d=4,o=5,b=120:c.,c.6,c6.,8c")
+    assert [n[1] for n in notes(m)] == [stored(750)] * 3 + [stored(250)]
+    assert [n[0] for n in notes(m)][1:3] == [melody.note_index("c6")] * 2
+
+
+def test_rtttl_octave_and_duration_bounds():
+    m = melody.parse_rtttl("t:d=1,o=9,b=10:c,b8")
+    assert notes(m)[0] == (melody.note_index("c8"), melody.MAX_DURATION_MS)
+    assert notes(m)[1][0] == len(melody.FREQ) - 1  # B8, the highest note
+    assert melody.parse_rtttl("t:o=0,b=120:c").word(0) >> 9 == melody.note_index("c0")
+
+
+@pytest.mark.parametrize("text", ["no sections", "t:d=x:c", "t:d=4:x", "t:b=0:c", "t:d=0:c",
+                                  "t::4", "t::0c", "t:o5:c"])
+def test_rtttl_bad_input(text):
+    with pytest.raises(ValueError):
+        melody.parse_rtttl(text)
+
+
+def test_validate():
+    good = melody.Melody.from_notes([(1, 100), (108, 8)], 0, "ok")
+    assert good.validate() is good
+    with pytest.raises(ValueError):
+        melody.Melody(bytes((0x00, 109 << 1)), "high").validate()  # note 109, past B8
+    with pytest.raises(ValueError):
+        melody.Melody(bytes((0x00, 0x02)), "silent").validate()  # zero duration
+
+
+def test_upload_and_play_from_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(melody, "MELODY_DIR", str(tmp_path / "melodies"))
+    data = melody.parse_rtttl("t:d=8,o=5,b=140:" + ",".join("c,d,e,f,g,a,b" for _ in range(5))).data
+    upload = melody.Upload()
+    upload.begin("scale", len(data))
+    for i in range(0, len(data), 12):
+        upload.data(data[i:i + 12])
+    assert upload.end(frame.crc16(data)) == "scale"
+    assert melody.list_files() == ["scale"]
+    tune = melody.open_file("scale")
+    try:
+        # Reads cross the 16-note buffer several times
+        assert notes(tune) == notes(melody.Melody(data))
+    finally:
+        tune.close()
+
+
+def test_upload_rejects_bad_crc_and_size(tmp_path, monkeypatch):
+    monkeypatch.setattr(melody, "MELODY_DIR", str(tmp_path))
+    upload = melody.Upload()
+    upload.begin("tune", 4)
+    upload.data(b"\x01\x02\x03\x04")
+    with pytest.raises(ValueError):
+        upload.end(frame.crc16(b"\x01\x02\x03\x05"))
+    assert os.listdir(tmp_path) == []  # Temporary file removed, nothing installed
+
+    upload.begin("tune", 4)
+    with pytest.raises(ValueError):
+        upload.data(b"\x00" * 6)
+    with pytest.raises(ValueError):
+        upload.end(0)  # Aborted by the overrun
+    assert os.listdir(tmp_path) == []
+
+    with pytest.raises(ValueError):
+        upload.begin("tune", 3)  # Odd: not whole notes
+    with pytest.raises(ValueError):
+        upload.begin("../tune", 4)
+
+
+def test_library_skips_bad_lines(tmp_path):
+    path = tmp_path / "tunes.txt"
+    path.write_text("# comment\nOne:d=4,o=5,b=120:c\nBroken:b=0:c\n\nTwo::p\n")
+    assert sorted(melody.load_library(str(path))) == ["One", "Two"]
+    assert melody.load_library(str(tmp_path / "missing.txt")) == {}
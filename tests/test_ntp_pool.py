@@ -0,0 +1,127 @@
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import ntp_pool  # noqa: E402
+
+
+class FakeServer:
+    """SNTP server on 127.0.0.1 that is `offset` seconds ahead and takes
+    `delay` seconds of round trip, half each way. With reply=False it
+    reads requests and never answers.
+    """
+
+    def __init__(self, offset=0.0, delay=0.0, reply=True):
+        self.offset = offset
+        self.delay = delay
+        self.reply = reply
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.settimeout(0.05)
+        self.address = f"127.0.0.1:{self.sock.getsockname()[1]}"
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def _serve(self):
+        while not self._stop.is_set():
+            try:
+                request, client = self.sock.recvfrom(512)
+            except socket.timeout:
+                continue
+            if not self.reply:
+                continue
+            time.sleep(self.delay / 2)
+            pkt = bytearray(48)
+            pkt[0] = 0x24  # LI 0, version 4, mode 4 (server)
+            pkt[1] = 2
+            pkt[24:32] = request[40:48]
+            t = time.time() + self.offset
+            pkt[32:40] = ntp_pool._to_ntp(t)
+            pkt[40:48] = ntp_pool._to_ntp(t)
+            time.sleep(self.delay / 2)
+            self.sock.sendto(pkt, client)
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        self.sock.close()
+
+
+def result(offset, delay):
+    return ntp_pool.NtpResult(f"s{offset}:{delay}", offset, delay, 1)
+
+
+def test_query_once_offset_and_delay():
+    server = FakeServer(offset=5.0, delay=0.04)
+    try:
+        offset, delay = ntp_pool.query_once(server.address, timeout=1.0)
+    finally:
+        server.close()
+    assert abs(offset - 5.0) < 0.005
+    assert 0.04 <= delay < 0.05
+
+
+def test_query_once_times_out_on_a_silent_server():
+    server = FakeServer(reply=False)
+    try:
+        try:
+            ntp_pool.query_once(server.address, timeout=0.1)
+        except socket.timeout:
+            pass
+        else:
+            raise AssertionError("expected a timeout")
+    finally:
+        server.close()
+
+
+def test_select_drops_outlier_and_prefers_lowest_delay():
+    results = [result(1.0, 0.030), result(1.01, 0.010), result(0.99, 0.020), result(9.0, 0.001)]
+    best = ntp_pool.select(results)
+    assert best.offset == 1.01
+    assert best.agreeing == 3
+
+
+def test_select_without_results():
+    try:
+        ntp_pool.select([])
+    except OSError:
+        pass
+    else:
+        raise AssertionError("expected OSError")
+
+
+def test_pool_skips_silent_server():
+    servers = [FakeServer(offset=2.0, delay=0.03), FakeServer(offset=2.0, delay=0.0),
+               FakeServer(reply=False)]
+    try:
+        pool = ntp_pool.NtpPool([s.address for s in servers], samples=2, timeout=0.2)
+        best = pool.query()
+    finally:
+        for s in servers:
+            s.close()
+    assert best.server == servers[1].address
+    assert abs(best.offset - 2.0) < 0.005
+    assert best.agreeing == 2
+    assert list(pool.errors) == [servers[2].address]
+
+
+def test_query_async_delivers_result_or_error():
+    server = FakeServer(offset=-1.0)
+    silent = FakeServer(reply=False)
+    calls = []
+    try:
+        ntp_pool.NtpPool([server.address], samples=1).query_async(
+            lambda *args: calls.append(args)).join(2)
+        ntp_pool.NtpPool([silent.address], samples=1, timeout=0.1).query_async(
+            lambda *args: calls.append(args)).join(2)
+    finally:
+        server.close()
+        silent.close()
+    (good, error), (bad, failure) = calls
+    assert error is None and abs(good.offset + 1.0) < 0.005
+    assert bad is None and isinstance(failure, OSError)
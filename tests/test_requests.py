@@ -0,0 +1,118 @@
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import clock_host  # noqa: E402
+from serial_session import READ, ReplayPort  # noqa: E402
+
+
+def replay(*reads):
+    """ClockLink on a ReplayPort that sends each (seconds, bytes) read at
+    that time after the port opens; returns (link, port, unsolicited lines).
+    """
+    records = [(0.0, READ, b"boot\n")] + [(t, READ, data) for t, data in reads]
+    port = ReplayPort(records, speed=1.0)
+    link = clock_host.ClockLink("replay", opener=port.opener)
+    lines = []
+    link.on_line = lambda link, line: lines.append(line)
+    link.open()
+    return link, port, lines
+
+
+def error(future, timeout=2.0):
+    try:
+        future.result(timeout)
+    except IOError as e:
+        return str(e)
+    raise AssertionError("expected IOError")
+
+
+def test_replies_resolve_out_of_order():
+    link, port, lines = replay((0.3, b"OK @2 ALARM_STATUS:SET:07:30\nOK @1 ID:alarmclock:abc:1\n"))
+    try:
+        first = link.submit("ID")
+        second = link.submit("ALARM_STATUS")
+        assert second.result(2.0)[0] == "SET:07:30"
+        assert first.result(2.0)[0] == "alarmclock:abc:1"
+        assert first.result()[1] == second.result()[1]  # read together
+    finally:
+        link.close()
+    assert port.written.endswith(b"@1 ID\n@2 ALARM_STATUS\n")
+    assert lines == ["boot"]
+
+
+def test_err_reply_fails_only_its_request():
+    link, port, lines = replay((0.2, b"ERR @1 ALARM_SET:invalid time\nOK @2 ALARM_STATUS:STOPPED\n"))
+    try:
+        bad = link.submit("ALARM_SET:25:00")
+        good = link.submit("ALARM_STATUS")
+        assert error(bad) == "ALARM_SET:invalid time"
+        assert good.result(2.0)[0] == "STOPPED"
+    finally:
+        link.close()
+
+
+def test_timeout_then_late_reply():
+    link, port, lines = replay((0.5, b"OK @1 ECHO:123\n"))
+    try:
+        future = link.submit("ECHO", timeout=0.1)
+        assert error(future) == "no reply to ECHO"
+        port.idle.wait(2.0)
+    finally:
+        link.close()
+    # Not matched to anything any more: handed on like any other line
+    assert lines == ["boot", "OK @1 ECHO:123"]
+
+
+def test_close_fails_pending_and_queued():
+    link, port, lines = replay()
+    link.requests.max_in_flight = 1
+    sent = link.submit("ALARM_STATUS")
+    queued = link.submit("ID")
+    assert link.requests.depth == 2
+    link.close()
+    assert error(sent) == "replay closed"
+    assert error(queued) == "replay closed"
+    assert link.requests.depth == 0
+
+
+def test_backlog_goes_out_as_replies_come_in():
+    sent = []
+    table = clock_host.RequestTable(sent.append, max_in_flight=2)
+    futures = [table.submit(f"CMD{i}") for i in range(4)]
+    assert sent == ["@1 CMD0", "@2 CMD1"]
+    assert table.resolve("2", True, "CMD1:b", 1.0)
+    assert sent[-1] == "@3 CMD2"
+    assert not table.resolve("2", True, "CMD1:b", 1.0)  # already done
+    assert not table.resolve("77", True, "X", 1.0)
+    table.resolve("1", True, "CMD0:a", 2.0)
+    assert sent[-1] == "@4 CMD3"
+    assert futures[0].result(0) == ("a", 2.0)
+    assert futures[1].result(0) == ("b", 1.0)
+    assert [f.done() for f in futures] == [True, True, False, False]
+
+
+def test_send_failure_fails_the_request():
+    def send(line):
+        raise OSError("port gone")
+
+    table = clock_host.RequestTable(send)
+    assert error(table.submit("ID")) == "port gone"
+    assert table.depth == 0
+
+
+def test_expire_frees_a_slot():
+    sent = []
+    table = clock_host.RequestTable(sent.append, max_in_flight=1)
+    first = table.submit("A", timeout=0.05)
+    second = table.submit("B")
+    done = threading.Event()
+    first.add_done_callback(lambda f: done.set())
+    while not done.is_set():
+        table.expire()
+        done.wait(0.01)
+    assert error(first) == "no reply to A"
+    assert sent == ["@1 A", "@2 B"]
+    assert not second.done()
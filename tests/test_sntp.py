@@ -0,0 +1,43 @@
+import os
+import struct
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import sntp  # noqa: E402
+
+
+def reply(t2_us, t3_us, mode=4, stratum=2):
+    """48-byte server reply with receive/transmit times in local-epoch us."""
+    pkt = bytearray(48)
+    pkt[0] = 0x20 | mode  # LI 0, version 4
+    pkt[1] = stratum
+    for offset, t in ((32, t2_us), (40, t3_us)):
+        sec, us = divmod(t, 1000000)
+        struct.pack_into("!II", pkt, offset, sec + sntp.NTP_DELTA, (us << 32) // 1000000)
+    return pkt
+
+
+def test_offset_and_delay():
+    # Server 5 s ahead, 10 ms each way, 2 ms spent in the server
+    t1, t4 = 0, 22000
+    pkt = reply(5010000, 5012000)
+    assert sntp.parse_reply(pkt, t1, t4) == (5000000, 20000)
+
+
+def test_asymmetric_path_splits_the_difference():
+    # 30 ms out, 10 ms back: SNTP cannot tell, offset is off by half of it
+    pkt = reply(1000000 + 30000, 1000000 + 30000)
+    assert sntp.parse_reply(pkt, 0, 40000) == (1000000 + 10000, 40000)
+
+
+def test_fractional_seconds():
+    pkt = reply(500000, 750000)  # 0.5 s and 0.75 s
+    assert sntp.parse_reply(pkt, 0, 250000) == (500000, 0)
+
+
+def test_rejects_non_server_replies():
+    pkt = reply(1000000, 1000000)
+    assert sntp.parse_reply(pkt, 0, 1000, n=47) is None
+    assert sntp.parse_reply(reply(0, 0, mode=3), 0, 1000) is None
+    assert sntp.parse_reply(reply(0, 0, stratum=0), 0, 1000) is None  # kiss-o'-death
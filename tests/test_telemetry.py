@@ -0,0 +1,67 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import frame  # noqa: E402
+import telemetry  # noqa: E402
+
+T0 = 1800000000.0  # 2027-01-15, host time of the first record
+
+
+def values(host_time, drift_ppm=0, flags=frame.EPOCH_2000):
+    """Device fields for `host_time` with the RTC running fast by `drift_ppm`."""
+    rtc = int(host_time + (host_time - T0) * drift_ppm / 1e6)
+    if flags & frame.EPOCH_2000:
+        rtc -= telemetry.EPOCH_2000
+    return (rtc, 1000, 100, 50000, 900, flags)
+
+
+def test_rotation_and_read_back(tmp_path):
+    max_files = 3
+    per_file = 10
+    recorder = telemetry.Recorder(str(tmp_path), len(telemetry.HEADER) + per_file * telemetry.RECORD_SIZE,
+                                  max_files)
+    for i in range(45):
+        recorder.write("/dev/ttyUSB0", values(T0 + i), T0 + i)
+    recorder.close()
+
+    path = tmp_path / telemetry.device_dir("/dev/ttyUSB0")
+    assert len(list(path.glob("*.tlm"))) == max_files
+    assert telemetry.devices(str(tmp_path)) == ["dev_ttyUSB0"]
+    # 45 records over files of 10: the oldest two files were pruned
+    records = list(telemetry.read("/dev/ttyUSB0", root=str(tmp_path)))
+    assert [r[0] for r in records] == [T0 + i for i in range(20, 45)]
+    assert records[0][1:] == values(T0 + 20)
+
+
+def test_read_since_until(tmp_path):
+    recorder = telemetry.Recorder(str(tmp_path), len(telemetry.HEADER) + 8 * telemetry.RECORD_SIZE)
+    for i in range(30):
+        recorder.write("clock", values(T0 + i), T0 + i)
+    recorder.close()
+    records = telemetry.read("clock", since=T0 + 5, until=T0 + 17, root=str(tmp_path))
+    assert [r[0] for r in records] == [T0 + i for i in range(5, 17)]
+    assert list(telemetry.read("clock", since=T0 + 100, root=str(tmp_path))) == []
+    assert list(telemetry.read("other", root=str(tmp_path))) == []
+
+
+def test_drift_slope(tmp_path):
+    recorder = telemetry.Recorder(str(tmp_path))
+    for i in range(0, 30 * 86400 + 1, 3600):
+        recorder.write("clock", values(T0 + i, drift_ppm=50), T0 + i)
+    recorder.close()
+    records = list(telemetry.read("clock", root=str(tmp_path)))
+    drifts = [telemetry.drift(r) for r in records]
+    assert drifts[0] == 0
+    slope = (drifts[-1] - drifts[0]) / (records[-1][0] - records[0][0])
+    assert abs(slope * 1e6 - 50) < 0.5  # 1 s RTC resolution over 30 days
+
+
+def test_epoch_flags():
+    # After September 2031 a 2000-based count passes 1e9
+    late = 2000000000
+    assert telemetry.rtc_unix(late - telemetry.EPOCH_2000, frame.EPOCH_2000) == late
+    assert telemetry.rtc_unix(late, frame.EPOCH_1970) == late
+    assert telemetry.rtc_unix(int(T0) - telemetry.EPOCH_2000) == int(T0)  # unflagged, old firmware
+    assert telemetry.drift((float(late),) + values(late, flags=frame.EPOCH_1970)) == 0
@@ -0,0 +1,69 @@
+import os
+import random
+import sys
+from datetime import datetime, timezone
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import tz  # noqa: E402
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:
+    ZoneInfo = None
+
+ZONES = (
+    ("EET-2EEST,M3.5.0/3,M10.5.0/4", "Europe/Kyiv"),
+    ("AEST-10AEDT,M10.1.0,M4.1.0/3", "Australia/Sydney"),
+    ("<+0530>-5:30", "Asia/Kolkata"),
+    ("UTC0", "UTC"),
+)
+START = 1609459200  # 2021-01-01
+END = 2208988800  # 2040-01-01
+
+
+def expected(zone, t):
+    return datetime.fromtimestamp(t, timezone.utc).astimezone(zone).timetuple()[:6]
+
+
+def times(spec):
+    # Random instants, plus one second either side of every transition
+    rng = random.Random(spec)
+    result = [rng.randrange(START, END) for _ in range(5000)]
+    probe = tz.TimeZone(spec)
+    for year in range(2021, 2040):
+        probe._build(year)
+        for instant, _ in probe.table:
+            result += [instant - 1, instant, instant + 1]
+    return result
+
+
+@pytest.mark.skipif(ZoneInfo is None, reason="needs zoneinfo")
+@pytest.mark.parametrize("spec,name", ZONES)
+def test_localtime_matches_zoneinfo(spec, name):
+    zone, local = ZoneInfo(name), tz.TimeZone(spec)
+    mismatches = [t for t in times(spec) if tuple(local.localtime(t)[:6]) != expected(zone, t)]
+    assert mismatches == []
+
+
+@pytest.mark.skipif(ZoneInfo is None, reason="needs zoneinfo")
+@pytest.mark.parametrize("spec,name", ZONES)
+def test_local_into_matches_zoneinfo(spec, name):
+    zone, local = ZoneInfo(name), tz.TimeZone(spec)
+    buf = [0] * 6
+    samples = times(spec)
+    # Random order jumps the cached window around, sorted order walks it
+    for t in samples + sorted(samples):
+        day, sod = divmod(t, 86400)
+        assert tuple(local.local_into(buf, day, sod)) == expected(zone, t), t
+
+
+def test_epoch_days_round_trip():
+    buf = [0] * 3
+    for y, m, d in ((1970, 1, 1), (2000, 2, 29), (2024, 12, 31), (2100, 3, 1)):
+        z = tz.epoch_days(y, m, d) + tz._EPOCH_DAYS
+        tz._civil_into(buf, z)
+        assert buf == [y, m, d]
+        assert z == (datetime(y, m, d) - datetime(1970, 1, 1)).days
@@ -0,0 +1,241 @@
+# tz.py
+# POSIX TZ string timezone with a precomputed DST transition table.
+#
+# The RTC is kept in UTC; TimeZone converts UTC seconds (MicroPython epoch)
+# to local time. Transition instants for the current and next year are
+# computed once, so a lookup is a single range comparison against the
+# cached [since, until) window of the current offset. local_into() keeps
+# that window as (day, second of day) pairs, so the per-second path works
+# on small integers only and allocates nothing (UTC seconds since 1970 do
+# not fit a MicroPython small int).
+from time import gmtime
+
+DEFAULT_TZ = "EET-2EEST,M3.5.0/3,M10.5.0/4"  # Odessa
+
+
+def _days_from_civil(y, m, d):
+    # Days since 1970-01-01 (proleptic Gregorian)
+    y -= m <= 2
+    era = (y if y >= 0 else y - 399) // 400
+    yoe = y - era * 400
+    doy = (153 * (m + (-3 if m > 2 else 9)) + 2) // 5 + d - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    return era * 146097 + doe - 719468
+
+
+_EPOCH_DAYS = _days_from_civil(gmtime(0)[0], 1, 1)
+_NEVER_DAY = 1 << 29  # Window end when no transition follows
+
+
+def epoch_days(y, m, d):
+    """Days since the MicroPython epoch."""
+    return _days_from_civil(y, m, d) - _EPOCH_DAYS
+
+
+def _civil_into(buf, z):
+    # Days since 1970 to buf[0:3] = y, m, d (inverse of _days_from_civil)
+    z += 719468
+    era = (z if z >= 0 else z - 146096) // 146097
+    doe = z - era * 146097
+    yoe = (doe - doe // 1460 + doe // 36524 - doe // 146096) // 365
+    doy = doe - (365 * yoe + yoe // 4 - yoe // 100)
+    mp = (5 * doy + 2) // 153
+    m = mp + 3 if mp < 10 else mp - 9
+    buf[0] = yoe + era * 400 + (m <= 2)
+    buf[1] = m
+    buf[2] = doy - (153 * mp + 2) // 5 + 1
+
+
+def _is_leap(y):
+    return y % 4 == 0 and (y % 100 != 0 or y % 400 == 0)
+
+
+def _parse_name(s, i):
+    if s[i] == "<":
+        j = s.index(">", i)
+        return s[i + 1:j], j + 1
+    j = i
+    while j < len(s) and s[j].isalpha():
+        j += 1
+    if j - i < 3:
+        raise ValueError("bad TZ name")
+    return s[i:j], j
+
+
+def _parse_hms(s, i):
+    # [+|-]hh[:mm[:ss]] -> seconds
+    sign = 1
+    if i < len(s) and s[i] in "+-":
+        sign = -1 if s[i] == "-" else 1
+        i += 1
+    secs = 0
+    mult = 3600
+    while mult:
+        j = i
+        while j < len(s) and s[j].isdigit():
+            j += 1
+        if j == i:
+            break
+        secs += int(s[i:j]) * mult
+        i = j
+        if i < len(s) and s[i] == ":" and mult > 1:
+            i += 1
+            mult //= 60
+        else:
+            break
+    return sign * secs, i
+
+
+def _parse_rule(s, i):
+    # Mm.w.d | Jn | n, optionally followed by /time
+    if s[i] == "M":
+        j = s.index(".", i)
+        k = s.index(".", j + 1)
+        e = k + 1
+        while e < len(s) and s[e].isdigit():
+            e += 1
+        rule = ("M", int(s[i + 1:j]), int(s[j + 1:k]), int(s[k + 1:e]))
+    else:
+        kind = "J" if s[i] == "J" else "N"
+        if kind == "J":
+            i += 1
+        e = i
+        while e < len(s) and s[e].isdigit():
+            e += 1
+        rule = (kind, int(s[i:e]))
+    at = 7200
+    if e < len(s) and s[e] == "/":
+        at, e = _parse_hms(s, e + 1)
+    return rule, at, e
+
+
+def _rule_day(rule, year):
+    """Day number (since the local epoch) the rule selects in `year`."""
+    jan1 = _days_from_civil(year, 1, 1)
+    if rule[0] == "M":
+        _, month, week, wday = rule
+        first = _days_from_civil(year, month, 1)
+        # 1970-01-01 was a Thursday (4); POSIX weekdays count from Sunday
+        day = first + (wday - (first + 4)) % 7
+        if week == 5:
+            nxt = _days_from_civil(year + (month == 12), month % 12 + 1, 1)
+            while day + 7 < nxt:
+                day += 7
+        else:
+            day += (week - 1) * 7
+    elif rule[0] == "J":
+        n = rule[1]
+        day = jan1 + n - 1 + (n >= 60 and _is_leap(year))
+    else:
+        day = jan1 + rule[1]
+    return day - _EPOCH_DAYS
+
+
+class TimeZone:
+    """Local time from UTC using a POSIX TZ string such as
+    "EET-2EEST,M3.5.0/3,M10.5.0/4" or "UTC0".
+    """
+
+    def __init__(self, spec=DEFAULT_TZ):
+        self.spec = spec
+        self.std_name, i = _parse_name(spec, 0)
+        off, i = _parse_hms(spec, i)
+        self.std_offset = -off  # POSIX offsets are west-positive
+        self.dst_name = None
+        self.dst_offset = self.std_offset
+        self._start = self._end = None
+        if i < len(spec):
+            self.dst_name, i = _parse_name(spec, i)
+            self.dst_offset = self.std_offset + 3600
+            if i < len(spec) and spec[i] != ",":
+                off, i = _parse_hms(spec, i)
+                self.dst_offset = -off
+            if i >= len(spec) or spec[i] != ",":
+                raise ValueError("TZ rules required")
+            self._start, self._start_at, i = _parse_rule(spec, i + 1)
+            if i >= len(spec) or spec[i] != ",":
+                raise ValueError("TZ rules required")
+            self._end, self._end_at, i = _parse_rule(spec, i + 1)
+        if i != len(spec):
+            raise ValueError("bad TZ string")
+        self.table = []
+        self._year = None
+        self._since = self._until = 0
+        self._offset = self.std_offset
+        # local_into() window, [since, until) as (day, second of day)
+        self._day_since = self._sod_since = 0
+        self._day_until = self._sod_until = 0
+        self._day_offset = self.std_offset
+
+    def _build(self, year):
+        """Precompute (utc_instant, offset_after) for `year` and `year + 1`."""
+        table = []
+        if self._start is not None:
+            for y in (year, year + 1):
+                on = _rule_day(self._start, y) * 86400 + self._start_at - self.std_offset
+                off = _rule_day(self._end, y) * 86400 + self._end_at - self.dst_offset
+                table.append((on, self.dst_offset))
+                table.append((off, self.std_offset))
+            table.sort()
+        self.table = table
+        self._year = year
+
+    def _locate(self, t):
+        year = gmtime(t)[0]
+        if year != self._year:
+            self._build(year)
+        table = self.table
+        if not table:
+            self._since, self._until = t, 1 << 62
+            self._offset = self.std_offset
+            return
+        # Before the first transition the offset is whatever the last one set
+        since, offset = t, table[-1][1]
+        until = table[0][0]
+        for i in range(len(table) - 1):
+            if t < table[i][0]:
+                break
+            since, offset = table[i]
+            until = table[i + 1][0]
+        self._since, self._until, self._offset = since, until, offset
+
+    def utc_offset(self, t):
+        """Offset in seconds east of UTC at UTC time `t`."""
+        if not self._since <= t < self._until:
+            self._locate(t)
+        return self._offset
+
+    def local_into(self, buf, day, sod):
+        """Local time into buf[0:6] (y, m, d, hh, mm, ss) for UTC `day`
+        (see epoch_days()) and second of day `sod`.
+        """
+        if not ((day > self._day_since or (day == self._day_since and sod >= self._sod_since))
+                and (day < self._day_until or (day == self._day_until and sod < self._sod_until))):
+            self._locate_day(day, sod)
+        sod += self._day_offset
+        if sod < 0:
+            sod += 86400
+            day -= 1
+        elif sod >= 86400:
+            sod -= 86400
+            day += 1
+        _civil_into(buf, day + _EPOCH_DAYS)
+        buf[3] = sod // 3600
+        buf[4] = sod // 60 % 60
+        buf[5] = sod % 60
+        return buf
+
+    def _locate_day(self, day, sod):
+        self._day_offset = self.utc_offset(day * 86400 + sod)
+        self._day_since, self._sod_since = divmod(self._since, 86400)
+        if self._until >= _NEVER_DAY * 86400:
+            self._day_until, self._sod_until = _NEVER_DAY, 0
+        else:
+            self._day_until, self._sod_until = divmod(self._until, 86400)
+
+    def localtime(self, t):
+        """(y, m, d, hh, mm, ss, wd, yd) for UTC seconds `t`."""
+        return gmtime(t + self.utc_offset(t))
+
+    def is_dst(self, t):
+        return self.dst_name is not None and self.utc_offset(t) == self.dst_offset
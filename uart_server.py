@@ -0,0 +1,220 @@
+# uart_server.py
+# Line-based UART command server with a dispatch table.
+#
+# Request:  [@<id> ]<NAME>[:<args>]
+# Reply:    OK [@<id> ]<NAME>[:<data>]
+#           ERR [@<id> ]<NAME>:<message>
+#
+# Each poll() drains everything pending on the stream (up to
+# MAX_READ_PER_POLL bytes) and dispatches every complete line, so the
+# command rate is bounded by the serial link, not by the main loop tick.
+#
+# A handler that can only answer later returns LATER, keeps `current`
+# (rid, name) and sends the reply itself with reply().
+#
+# "BIN" switches the link to the framed binary protocol in frame.py;
+# text commands can still be tunnelled in TEXT frames. Stray print()
+# output in binary mode is skipped by the host decoder as it resyncs.
+# Ctrl-C is disabled in binary mode, where 0x03 is an ordinary byte;
+# close() turns it back on.
+import sys
+import select
+import micropython
+import frame
+
+MAX_LINE = 128
+LATER = object()  # handler result: no reply now, see `current`
+MAX_READ_PER_POLL = 512
+RX_CHUNK = 64  # bytes per readinto() from a stream that reports any()
+
+
+class CommandServer:
+    def __init__(self, stream=None, max_line=MAX_LINE):
+        self._stream = stream or sys.stdin
+        # Read raw bytes where the port offers them (sys.stdin.buffer)
+        self._reader = getattr(self._stream, "buffer", self._stream)
+        self._poller = select.poll()
+        self._poller.register(self._stream, select.POLLIN)
+        # ipoll() reuses its result tuple, poll() builds a list per call
+        self._ipoll = getattr(self._poller, "ipoll", self._poller.poll)
+        self._buf = bytearray(max_line)
+        self._rx = bytearray(RX_CHUNK)
+        # A UART says how much is waiting; the REPL stream only that
+        # something is, so it is read a byte at a time
+        self._any = getattr(self._reader, "any", None)
+        self._len = 0
+        self._overflow = False
+        self.commands = {"BIN": self._cmd_bin}
+        self.current = None  # (rid, name) of the command being handled
+        self.on_activity = None
+        self._out = getattr(sys.stdout, "buffer", sys.stdout)
+        # Binary mode state
+        self.binary = False
+        self.frames = {}
+        self._decoder = None
+        self._decoder_frames = 0
+        self._switch = False
+        self._tx_seq = 0
+        self._rx_seq = -1
+        self._last_reply = None
+
+    def add(self, name, handler):
+        """Register handler(args) -> reply data (str) or None. Raise
+        ValueError to send an ERR reply with the exception message.
+        """
+        self.commands[name] = handler
+
+    def add_frame(self, ftype, handler):
+        """Register handler(payload) -> (type, payload) reply frame or None
+        for binary mode. Exceptions are reported as an ERROR ack status.
+        """
+        self.frames[ftype] = handler
+
+    def poll(self):
+        """Read all pending input and dispatch complete lines. Returns the
+        number of commands handled.
+        """
+        handled = 0
+        rx = self._rx
+        budget = MAX_READ_PER_POLL
+        while budget > 0 and self._ready():
+            n = self._any() if self._any else 1
+            n = min(n, budget, len(rx))
+            # Into the preallocated buffer: no bytes object per read
+            got = self._reader.readinto(rx, n) if n > 0 else 0
+            if not got:
+                break
+            budget -= got
+            for i in range(got):
+                c = rx[i]
+                if self.binary:
+                    n = self._decoder_frames
+                    self._decoder.feed_byte(c)
+                    handled += self._decoder_frames - n
+                elif c == 10 or c == 13:  # \n or \r ends a line
+                    if self._len and not self._overflow:
+                        self.dispatch(bytes(self._buf[:self._len]).decode())
+                        handled += 1
+                    elif self._overflow:
+                        self.reply(False, None, "LINE", "too long")
+                    self._len = 0
+                    self._overflow = False
+                elif self._len < len(self._buf):
+                    self._buf[self._len] = c
+                    self._len += 1
+                else:
+                    self._overflow = True
+        if handled and self.on_activity:
+            self.on_activity()
+        return handled
+
+    def pending(self):
+        """True if input is waiting on the stream."""
+        return self._ready()
+
+    def _ready(self):
+        for _ in self._ipoll(0):
+            return True
+        return False
+
+    def reply(self, ok, rid, name, data=None):
+        head = "OK " if ok else "ERR "
+        if rid is not None:
+            head += "@" + rid + " "
+        line = head + name if data is None else head + name + ":" + data
+        if self.binary:
+            # Kept for a retransmitted TEXT frame whose reply was lost
+            self._last_reply = self.send_frame(frame.TEXT, line.encode())
+        else:
+            print(line)
+
+    # Binary protocol
+
+    def _cmd_bin(self, args):
+        self._switch = True  # After the OK reply has gone out as text
+        return str(frame.VERSION)
+
+    def _set_binary(self, on):
+        self.binary = on
+        # 0x03 in a frame (type, length, CRC or payload) must not raise
+        # KeyboardInterrupt
+        micropython.kbd_intr(-1 if on else 3)
+        if on and self._decoder is None:
+            self._decoder = frame.FrameDecoder(self._on_frame)
+        if on:
+            self._decoder.reset()
+            self._rx_seq = -1
+
+    def close(self):
+        """Back to text mode with Ctrl-C enabled, e.g. when main.py exits."""
+        if self.binary:
+            self._set_binary(False)
+
+    def send_frame(self, ftype, payload=b""):
+        data = frame.encode(self._tx_seq, ftype, payload)
+        self._tx_seq = (self._tx_seq + 1) & 0xFF
+        self._out.write(data)
+        return data
+
+    def _on_frame(self, seq, ftype, payload):
+        self._decoder_frames += 1
+        if ftype == frame.ACK:
+            return
+        if seq == self._rx_seq:
+            # Retransmission: our ACK was lost, repeat it and the reply
+            self._out.write(frame.encode_ack(self._tx_seq, seq))
+            if self._last_reply:
+                self._out.write(self._last_reply)
+            return
+        self._rx_seq = seq
+        self._last_reply = None
+        if ftype == frame.MODE_TEXT:
+            self.send_frame(frame.ACK, bytes((seq, frame.ST_OK)))
+            self._set_binary(False)
+            return
+        if ftype == frame.TEXT:
+            self.send_frame(frame.ACK, bytes((seq, frame.ST_OK)))
+            self.dispatch(payload.decode())
+            return
+        handler = self.frames.get(ftype)
+        if handler is None:
+            self.send_frame(frame.ACK, bytes((seq, frame.ST_UNKNOWN)))
+            return
+        try:
+            result = handler(payload)
+        except Exception:
+            self.send_frame(frame.ACK, bytes((seq, frame.ST_ERROR)))
+            return
+        self.send_frame(frame.ACK, bytes((seq, frame.ST_OK)))
+        if result is not None:
+            self._last_reply = self.send_frame(result[0], result[1])
+
+    def dispatch(self, line):
+        line = line.strip()
+        rid = None
+        if line.startswith("@"):
+            sp = line.find(" ")
+            if sp < 0:
+                self.reply(False, line[1:], "LINE", "missing command")
+                return
+            rid = line[1:sp]
+            line = line[sp + 1:].strip()
+        sep = line.find(":")
+        if sep < 0:
+            name, args = line, ""
+        else:
+            name, args = line[:sep], line[sep + 1:]
+        handler = self.commands.get(name)
+        if handler is None:
+            self.reply(False, rid, name, "unknown command")
+            return
+        self.current = (rid, name)
+        try:
+            data = handler(args)
+            if data is not LATER:
+                self.reply(True, rid, name, data)
+        except Exception as e:
+            self.reply(False, rid, name, str(e) or type(e).__name__)
+        if self._switch:
+            self._switch = False
+            self._set_binary(True)
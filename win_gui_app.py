@@ -1,27 +1,68 @@
 import tkinter as tk
 from tkinter import ttk, filedialog
-import serial
-import serial.tools.list_ports
-import ntplib
-from datetime import datetime, timezone, timedelta
+from datetime import datetime, timezone
 import threading
 import queue
 import time
+import os
+import shutil
+from collections import deque
+import frame
+import telemetry
+from ntp_pool import NtpPool, DEFAULT_SERVERS
+import clock_host
+from clock_host import Connection, Fleet, RequestTable
+from serial_session import SessionRecorder, session_path
+
+FRAME_ACK_TIMEOUT = 0.3  # seconds before an unacknowledged frame is resent
+FRAME_RETRIES = 3
+UI_FRAME_MS = 50  # the UI applies queued serial events this often
+UI_BATCH = 500  # most queued events applied per frame
+LOG_MAX_LINES = 500  # lines kept in the log window
+LOG_HISTORY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "action_log.txt")
+NTP_SERVERS = DEFAULT_SERVERS  # "host" or "host:port"
+MAX_LINE = 4096  # text-mode bytes without a newline before they are dropped
+TELEMETRY_S = 10  # report period asked for by the Telemetry checkbox
+SESSION_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sessions")
 
 class AlarmControlApp:
     def __init__(self, root):
         self.root = root
         self.root.title("ESP32 Alarm Control")
-        self.root.geometry("360x570")
+        self.root.geometry("360x650")
         self.root.resizable(False, False)
         
-        self.serial = None
+        # Long-lived port (clock_host.Connection): reconnects on its own and
+        # queues commands meanwhile
+        self.conn = None
+        self.rx_buf = bytearray()
+        # (function, args) posted by background threads, applied by drain_queue
         self.serial_queue = queue.Queue()
         self.running = True
+        self.log_pending = deque(maxlen=LOG_MAX_LINES)
+        try:
+            self.log_file = open(LOG_HISTORY_FILE, "a", encoding="utf-8", buffering=1)
+        except OSError:
+            self.log_file = None
+        # Binary protocol state (frame.py), negotiated with "BIN"
+        self.binary = False
+        self.decoder = frame.FrameDecoder(self.handle_frame)
+        self.tx_seq = 0
+        self.pending = {}
+        self.pending_lock = threading.Lock()
+        # @id-tagged commands, pipelined; handle_line resolves their futures
+        self.requests = RequestTable(self.write_command)
+        self.rx_time = 0.0  # time.time() when the current input was read
+        self.ntp_pool = NtpPool(NTP_SERVERS)
+        self.ntp_busy = False
+        self.telemetry_recorder = None  # telemetry.Recorder, once reports arrive
+        self.discovering = False
+        self.session_recorder = None  # Record checkbox, see serial_session.py
+        self.tune_name = None  # Last melody loaded for upload, for Use as Alarm
         
         self.setup_ui()
         self.refresh_ports()
-        self.start_serial_reader()
+        self.drain_queue()
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
     
     def setup_ui(self):
@@ -73,6 +114,17 @@ class AlarmControlApp:
         
         ttk.Button(button_frame, text="Alarm Status", command=self.get_alarm_status).grid(row=0, column=0, padx=2, sticky="ew")
         ttk.Button(button_frame, text="NTP Request", command=self.ntp_request).grid(row=0, column=1, padx=2, sticky="ew")
+        ttk.Button(button_frame, text="Upload Melody", command=self.upload_melody).grid(row=2, column=0, padx=2, sticky="ew")
+        ttk.Button(button_frame, text="Use as Alarm", command=self.select_alarm_tune).grid(row=2, column=1, padx=2, sticky="ew")
+        ttk.Button(button_frame, text="Fleet...", command=self.open_fleet).grid(row=3, column=0, columnspan=2, padx=2, sticky="ew")
+        self.binary_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(button_frame, text="Binary protocol", variable=self.binary_var, command=self.toggle_binary).grid(row=1, column=0, sticky="w")
+        self.precise_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(button_frame, text="Precise set", variable=self.precise_var).grid(row=1, column=1, sticky="w")
+        self.telemetry_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(button_frame, text="Telemetry", variable=self.telemetry_var, command=self.toggle_telemetry).grid(row=4, column=0, sticky="w")
+        self.record_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(button_frame, text="Record session", variable=self.record_var, command=self.toggle_record).grid(row=4, column=1, sticky="w")
         
         ttk.Separator(main_frame, orient="horizontal").grid(row=9, column=0, columnspan=3, sticky="ew", pady=10)
         
@@ -81,16 +133,24 @@ class AlarmControlApp:
         self.alarm_status_label = ttk.Label(main_frame, text="Unknown")
         self.alarm_status_label.grid(row=10, column=1, columnspan=2, sticky="w")
         
-        ttk.Label(main_frame, text="Action Log:").grid(row=11, column=0, sticky="nw")
+        ttk.Label(main_frame, text="Connection:").grid(row=11, column=0, sticky="w")
+        self.connection_label = ttk.Label(main_frame, text="Not connected")
+        self.connection_label.grid(row=11, column=1, columnspan=2, sticky="w")
+        
+        ttk.Label(main_frame, text="Telemetry:").grid(row=12, column=0, sticky="w")
+        self.telemetry_label = ttk.Label(main_frame, text="Off")
+        self.telemetry_label.grid(row=12, column=1, columnspan=2, sticky="w")
+        
+        ttk.Label(main_frame, text="Action Log:").grid(row=13, column=0, sticky="nw")
         self.log_text = tk.Text(main_frame, height=8, width=40, wrap=tk.WORD, state="disabled")
-        self.log_text.grid(row=12, column=0, columnspan=3, sticky="ew", pady=5)
+        self.log_text.grid(row=14, column=0, columnspan=3, sticky="ew", pady=5)
         scrollbar = ttk.Scrollbar(main_frame, orient="vertical", command=self.log_text.yview)
-        scrollbar.grid(row=12, column=3, sticky="ns")
+        scrollbar.grid(row=14, column=3, sticky="ns")
         self.log_text["yscrollcommand"] = scrollbar.set
         
         # Log control buttons
         log_button_frame = ttk.Frame(main_frame)
-        log_button_frame.grid(row=13, column=0, columnspan=3, sticky="ew", pady=5)
+        log_button_frame.grid(row=15, column=0, columnspan=3, sticky="ew", pady=5)
         log_button_frame.columnconfigure(0, weight=1)
         log_button_frame.columnconfigure(1, weight=1)
         
@@ -100,13 +160,86 @@ class AlarmControlApp:
         # Configure style for Set Alarm button
         style.configure("Accent.TButton", background="lightgreen")
     
+    def post(self, func, *args):
+        # Thread-safe: runs func(*args) on the Tk thread at the next frame
+        self.serial_queue.put((func, args))
+
+    def drain_queue(self):
+        for _ in range(UI_BATCH):
+            try:
+                func, args = self.serial_queue.get_nowait()
+            except queue.Empty:
+                break
+            func(*args)
+        self.flush_log()
+        self.show_connection()
+        if self.running:
+            self.root.after(UI_FRAME_MS, self.drain_queue)
+
+    def show_connection(self):
+        conn = self.conn
+        if conn is None:
+            text = "Not connected"
+        elif conn.state == "reconnecting":
+            wait = max(0.0, conn.next_attempt - time.monotonic())
+            text = f"Reconnecting in {wait:.1f} s, {conn.queue_depth} queued"
+        elif conn.state == "open":
+            text = f"Open, {conn.reconnects} reconnects"
+            if conn.queue_depth:
+                text += f", {conn.queue_depth} queued"
+        else:
+            text = conn.state.capitalize()
+        if self.connection_label.cget("text") != text:
+            self.connection_label.config(text=text)
+
+    def on_connection_state(self, conn):
+        # Connection thread (or Tk thread on start/close); UI via post()
+        if conn.state == "open":
+            self.rx_buf.clear()
+            self.decoder.reset()
+            if conn.reconnects:
+                self.post(self.resume_telemetry)
+            if self.binary:
+                # A reconnect usually means the board reset into text mode;
+                # frames queued for the old session would be garbage now
+                self.binary = False
+                with self.pending_lock:
+                    self.pending.clear()
+                dropped = conn.clear_queue()
+                self.post(self.binary_var.set, False)
+                self.post(self.log_message, f"Reconnected in text mode, {dropped} queued frames dropped")
+                return
+            if conn.reconnects:
+                self.post(self.log_message, f"Reconnected to {conn.port}, sending {conn.queue_depth} queued")
+        elif conn.state == "reconnecting":
+            self.post(self.log_message, f"Disconnected: {conn.last_error}, retrying")
+
+    def set_status(self, text):
+        self.alarm_status_label.config(text=text)
+
     def log_message(self, message):
+        now = datetime.now()
+        self.log_pending.append(f"{now.strftime('%H:%M:%S')}: {message}\n")
+        if self.log_file:
+            self.log_file.write(f"{now.strftime('%Y-%m-%d %H:%M:%S')}: {message}\n")
+
+    def flush_log(self):
+        # One insert per frame; the widget keeps the last LOG_MAX_LINES lines
+        if not self.log_pending:
+            return
+        text = "".join(self.log_pending)
+        self.log_pending.clear()
         self.log_text.config(state="normal")
-        self.log_text.insert(tk.END, f"{datetime.now().strftime('%H:%M:%S')}: {message}\n")
+        self.log_text.insert(tk.END, text)
+        lines = int(self.log_text.index("end-1c").split(".")[0]) - 1
+        if lines > LOG_MAX_LINES:
+            self.log_text.delete("1.0", f"{lines - LOG_MAX_LINES + 1}.0")
         self.log_text.see(tk.END)
         self.log_text.config(state="disabled")
     
     def clear_log(self):
+        # Only the window: the history file keeps everything
+        self.log_pending.clear()
         self.log_text.config(state="normal")
         self.log_text.delete("1.0", tk.END)
         self.log_text.config(state="disabled")
@@ -120,113 +253,559 @@ class AlarmControlApp:
         )
         if file_path:
             try:
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    log_content = self.log_text.get("1.0", tk.END).strip()
-                    f.write(log_content)
+                if not self.log_file:
+                    raise IOError(f"no history file ({LOG_HISTORY_FILE})")
+                self.log_file.flush()
+                shutil.copyfile(LOG_HISTORY_FILE, file_path)
                 self.log_message(f"Log saved to {file_path}")
             except Exception as e:
                 self.log_message(f"Save error: {str(e)}")
     
-    def send_to_esp32(self, command):
+    def ensure_serial(self):
         port = self.port_var.get()
         if not port:
             self.log_message("No ESP32 port selected")
             self.alarm_status_label.config(text="Error: No port")
             return False
+        if self.conn is None:
+            self.conn = Connection(port, on_data=self.on_serial_data, on_state=self.on_connection_state)
+            self.conn.recorder = self.session_recorder
+            self.conn.start()
+        else:
+            self.conn.set_port(port)
+        return True
+
+    def write_command(self, command):
+        # No UI calls here: also used from worker threads
+        if self.binary:
+            self.send_command_frame(command)
+        else:
+            self.conn.write((command + '\n').encode('utf-8'))
+
+    def send_to_esp32(self, command):
+        if not self.ensure_serial():
+            return False
         try:
-            if not self.serial or self.serial.port != port:
-                if self.serial:
-                    self.serial.close()
-                self.serial = serial.Serial(port, 115200, timeout=0.1)
-            self.serial.write((command + '\n').encode('utf-8'))
-            self.serial.flush()
-            self.log_message(f"Sent: {command}")
-            return True
+            self.write_command(command)
         except Exception as e:
             self.log_message(f"Serial error: {str(e)}")
             self.alarm_status_label.config(text="Error: Serial")
-            if self.serial:
-                self.serial.close()
-                self.serial = None
             return False
+        if self.conn.state == "open" and not self.conn.queue_depth:
+            self.log_message(f"Sent: {command}")
+        else:
+            self.log_message(f"Queued: {command} ({self.conn.queue_depth} waiting)")
+        return True
     
+    def send_command_frame(self, command):
+        # Compact encodings for the common commands, TEXT tunnel otherwise
+        # (@id-tagged commands from request() always use the tunnel)
+        name, _, args = command.partition(":")
+        if name == "ALARM_SET":
+            hh, mm = map(int, args.split(":"))
+            self.send_frame(frame.ALARM_SET, bytes((hh, mm)))
+        elif name == "ALARM_CLEAR":
+            self.send_frame(frame.ALARM_CLEAR)
+        elif name == "ALARM_STATUS":
+            self.send_frame(frame.ALARM_TABLE_GET)
+        elif name == "NTP_SET":
+            self.send_frame(frame.TIME_SET, frame.pack_time([int(v) for v in args.split(":")]))
+        elif name == "MODE_TEXT":
+            self.send_frame(frame.MODE_TEXT)
+        else:
+            self.send_frame(frame.TEXT, command.encode('utf-8'))
+
+    def command(self, command, on_done=None, timeout=clock_host.REPLY_TIMEOUT):
+        """Send a tagged command without waiting. on_done(ok, data) runs on
+        the Tk thread once the device has answered (or it timed out), so
+        labels only ever show confirmed state.
+        """
+        if not self.ensure_serial():
+            return None
+        try:
+            future = self.requests.submit(command, timeout)
+        except Exception as e:
+            self.log_message(f"Serial error: {str(e)}")
+            return None
+        self.log_message(f"Sent: {command}")
+        future.add_done_callback(lambda f: self.post(self.command_done, command, f, on_done))
+        return future
+
+    def command_done(self, command, future, on_done):
+        try:
+            data, _ = future.result()
+            ok = True
+        except Exception as e:
+            data, ok = str(e), False
+            self.log_message(f"{command.split(':')[0]} failed: {data}")
+        if on_done:
+            on_done(ok, data)
+
     def set_alarm(self):
         hh = int(self.hour_spinbox.get())
         mm = int(self.minute_spinbox.get())
-        command = f"ALARM_SET:{hh:02d}:{mm:02d}"
-        if self.send_to_esp32(command):
-            self.alarm_status_label.config(text=f"Set at {hh:02d}:{mm:02d}")
+        self.set_status("Setting...")
+        self.command(f"ALARM_SET:{hh:02d}:{mm:02d}",
+                     lambda ok, data: self.set_status(f"Set at {data}" if ok else "Set Error"))
     
     def clear_alarm(self):
-        if self.send_to_esp32("ALARM_CLEAR"):
-            self.alarm_status_label.config(text="Cleared")
+        self.command("ALARM_CLEAR", lambda ok, data: self.set_status("Cleared" if ok else "Clear Error"))
     
     def get_alarm_status(self):
-        self.send_to_esp32("ALARM_STATUS")
+        self.command("ALARM_STATUS", lambda ok, data: self.show_alarm_status(data) if ok else None)
+
+    def show_alarm_status(self, status):
+        if status.startswith("SET:"):
+            hh, mm = status[4:].split(":")
+            self.set_status(f"Set at {hh}:{mm}")
+        elif status.startswith("SNOOZED:"):
+            hh, mm = status[8:].split(":")
+            self.set_status(f"Snoozed to {hh}:{mm}")
+        else:
+            self.set_status(status.capitalize())
+        self.log_message(f"Status: {status}")
     
     def ntp_request(self):
-        try:
-            ntp_client = ntplib.NTPClient()
-            response = ntp_client.request('pool.ntp.org')
-            utc_time = datetime.fromtimestamp(response.tx_time, tz=timezone.utc)
-            local_time = utc_time + timedelta(hours=3)  # UTC+3 for Odessa
-            y, m, d, hh, mm, ss = local_time.year, local_time.month, local_time.day, local_time.hour, local_time.minute, local_time.second
-            if 2000 <= y <= 2099 and 1 <= m <= 12 and 1 <= d <= 31 and 0 <= hh <= 23 and 0 <= mm <= 59 and 0 <= ss <= 59:
-                command = f"NTP_SET:{y}:{m}:{d}:{hh}:{mm}:{ss}"
-                self.log_message(f"Preparing: {command}")
-                if self.send_to_esp32(command):
-                    self.log_message(f"NTP time set: {local_time.strftime('%Y-%m-%d %H:%M:%S')}")
-                    self.alarm_status_label.config(text="RTC Updated")
-            else:
-                self.log_message("Invalid NTP time values")
-                self.alarm_status_label.config(text="NTP Error")
-        except Exception as e:
-            self.log_message(f"NTP error: {str(e)}")
+        # Servers are queried from worker threads; ntp_done() gets the result
+        if self.ntp_busy:
+            return
+        self.ntp_busy = True
+        self.log_message(f"Querying {len(self.ntp_pool.servers)} NTP servers")
+        self.ntp_pool.query_async(lambda result, error: self.post(self.ntp_done, result, error))
+
+    def ntp_done(self, result, error):
+        self.ntp_busy = False
+        for server, e in self.ntp_pool.errors.items():
+            self.log_message(f"NTP {server}: {str(e)}")
+        if error:
+            self.log_message(f"NTP error: {str(error)}")
+            self.alarm_status_label.config(text="NTP Error")
+            return
+        self.log_message(f"NTP {result.server}: offset {result.offset * 1000:+.1f} ms, "
+                         f"delay {result.delay * 1000:.1f} ms, {result.agreeing} agreeing")
+        if self.precise_var.get():
+            if self.ensure_serial():
+                self.log_message("Measuring serial round trip")
+                threading.Thread(target=self.precise_set_worker, args=(result,), daemon=True).start()
+            return
+        utc_time = datetime.fromtimestamp(result.now(), tz=timezone.utc)
+        # The device keeps its RTC in UTC and applies its own TZ rules
+        y, m, d, hh, mm, ss = utc_time.year, utc_time.month, utc_time.day, utc_time.hour, utc_time.minute, utc_time.second
+        if 2000 <= y <= 2099 and 1 <= m <= 12 and 1 <= d <= 31 and 0 <= hh <= 23 and 0 <= mm <= 59 and 0 <= ss <= 59:
+            command = f"NTP_SET:{y}:{m}:{d}:{hh}:{mm}:{ss}"
+            self.log_message(f"Preparing: {command}")
+
+            def done(ok, data):
+                if ok:
+                    self.log_message(f"NTP time set: {utc_time.strftime('%Y-%m-%d %H:%M:%S')} UTC")
+                self.set_status("RTC Updated" if ok else "RTC Set Error")
+            self.command(command, done)
+        else:
+            self.log_message("Invalid NTP time values")
             self.alarm_status_label.config(text="NTP Error")
     
-    def start_serial_reader(self):
-        def reader():
-            while self.running:
-                if self.serial and self.serial.is_open:
-                    try:
-                        if self.serial.in_waiting:
-                            line = self.serial.readline().decode('utf-8').strip()
-                            if line.startswith("ALARM_STATUS:"):
-                                status = line[13:]
-                                if status.startswith("SET:"):
-                                    hh, mm = status[4:].split(":")
-                                    self.root.after(0, lambda: self.alarm_status_label.config(text=f"Set at {hh}:{mm}"))
-                                elif status.startswith("SNOOZED:"):
-                                    hh, mm = status[8:].split(":")
-                                    self.root.after(0, lambda: self.alarm_status_label.config(text=f"Snoozed to {hh}:{mm}"))
-                                else:
-                                    self.root.after(0, lambda: self.alarm_status_label.config(text=status.capitalize()))
-                                self.root.after(0, lambda: self.log_message(f"Status: {status}"))
-                            elif line.startswith("RTC set error"):
-                                self.root.after(0, lambda: self.alarm_status_label.config(text="RTC Set Error"))
-                                self.root.after(0, lambda: self.log_message(f"ESP32 error: {line}"))
-                            else:
-                                self.root.after(0, lambda: self.log_message(f"ESP32: {line}"))
-                    except Exception as e:
-                        self.root.after(0, lambda: self.log_message(f"Read error: {str(e)}"))
-                time.sleep(0.01)
-        
-        threading.Thread(target=reader, daemon=True).start()
+    def handle_line(self, line):
+        ok = line.startswith("OK ")
+        if ok or line.startswith("ERR "):
+            # Structured reply: OK|ERR [@id ]NAME[:data]
+            reply = line.split(" ", 1)[1] if " " in line else ""
+            rid = None
+            if reply.startswith("@"):
+                rid, _, reply = reply[1:].partition(" ")
+            if rid is not None and self.requests.resolve(rid, ok, reply, self.rx_time):
+                return  # The command's future reports it
+            if ok and reply.startswith("BIN:"):
+                self.binary = True
+                self.post(self.log_message, "Binary protocol active")
+                return
+            if ok:
+                line = reply
+            elif reply.startswith("NTP_SET:"):
+                line = "RTC set error: " + reply[8:]
+        if line.startswith("ALARM_STATUS:"):
+            self.post(self.show_alarm_status, line[13:])
+        elif line.startswith("TELEMETRY:"):
+            try:
+                self.record_telemetry(telemetry.parse_line(line[10:]))
+            except ValueError:
+                self.post(self.log_message, f"ESP32: {line}")
+        elif line.startswith("RTC set error"):
+            self.post(self.set_status, "RTC Set Error")
+            self.post(self.log_message, f"ESP32 error: {line}")
+        else:
+            self.post(self.log_message, f"ESP32: {line}")
+
+    def handle_frame(self, seq, ftype, payload):
+        if ftype == frame.ACK:
+            acked, status = payload[0], payload[1]
+            with self.pending_lock:
+                sent = self.pending.pop(acked, None)
+            if sent and status != frame.ST_OK:
+                self.post(self.log_message, f"Frame {acked} rejected: status {status}")
+            elif sent and sent[3] == frame.MODE_TEXT:
+                self.binary = False
+                self.post(self.log_message, "Text protocol active")
+            return
+        # Acknowledge everything else the device sends
+        self.conn.write(frame.encode_ack(self.next_seq(), seq))
+        if ftype == frame.TEXT:
+            self.handle_line(payload.decode("utf-8", "replace").strip())
+        elif ftype == frame.TIME:
+            y, m, d, hh, mm, ss = frame.unpack_time(payload)
+            self.post(self.log_message, f"RTC: {y}-{m:02d}-{d:02d} {hh:02d}:{mm:02d}:{ss:02d} UTC")
+        elif ftype == frame.ALARM_TABLE:
+            alarms = frame.unpack_alarms(payload)
+            self.post(self.show_alarm_table, alarms)
+        elif ftype == frame.TELEMETRY:
+            self.record_telemetry(telemetry.parse_frame(payload))
+
+    def record_telemetry(self, values):
+        # Connection thread
+        if self.telemetry_recorder is None:
+            self.telemetry_recorder = telemetry.Recorder()
+        try:
+            self.telemetry_recorder.write(self.conn.port, values, self.rx_time)
+        except OSError as e:
+            self.post(self.log_message, f"Telemetry not saved: {e}")
+        record = (self.rx_time,) + values
+        self.post(self.show_telemetry, record)
+
+    def show_telemetry(self, record):
+        self.telemetry_label.config(
+            text=f"Drift {telemetry.drift(record):+.0f} s, {record[3] / 4:.1f} °C, loop {record[5] / 1000:.1f} ms")
+
+    def show_alarm_table(self, alarms):
+        if not alarms:
+            self.set_status("Stopped")
+            return
+        hh, mm, flags = alarms[0]
+        if flags & frame.ALARM_PAUSED:
+            text = "Paused"
+        elif flags & frame.ALARM_PLAYING:
+            text = "Playing"
+        elif flags & frame.ALARM_ENABLED:
+            text = f"Set at {hh:02d}:{mm:02d}"
+        else:
+            text = "Stopped"
+        self.set_status(text)
+        self.log_message(f"Alarm table: {alarms}")
+
+    def next_seq(self):
+        self.tx_seq = (self.tx_seq + 1) & 0xFF
+        return self.tx_seq
+
+    def send_frame(self, ftype, payload=b""):
+        seq = self.next_seq()
+        data = frame.encode(seq, ftype, payload)
+        with self.pending_lock:
+            self.pending[seq] = [data, time.monotonic(), 1, ftype]
+        self.conn.write(data)
+
+    def retransmit_frames(self):
+        now = time.monotonic()
+        with self.pending_lock:
+            for seq, entry in list(self.pending.items()):
+                if now - entry[1] < FRAME_ACK_TIMEOUT:
+                    continue
+                if entry[2] >= FRAME_RETRIES:
+                    del self.pending[seq]
+                    self.post(self.log_message, f"Frame {seq} not acknowledged")
+                    continue
+                entry[1] = now
+                entry[2] += 1
+                self.conn.write(entry[0])
+
+    def toggle_binary(self):
+        if self.binary_var.get():
+            self.send_to_esp32("BIN")
+        elif self.binary:
+            self.send_to_esp32("MODE_TEXT")  # Switches back once acknowledged
+
+    def toggle_telemetry(self):
+        period = TELEMETRY_S if self.telemetry_var.get() else 0
+        def done(ok, data):
+            if ok:
+                self.telemetry_label.config(text=f"Every {data} s" if period else "Off")
+        self.command(f"TELEMETRY:{period}", done)
+
+    def toggle_record(self):
+        if self.record_var.get():
+            path = session_path(SESSION_DIR, self.port_var.get() or "port")
+            try:
+                self.session_recorder = SessionRecorder(path)
+            except OSError as e:
+                self.log_message(f"Cannot record: {e}")
+                self.record_var.set(False)
+                return
+            self.log_message(f"Recording to {path}")
+        else:
+            recorder, self.session_recorder = self.session_recorder, None
+            if recorder:
+                recorder.close()
+                self.log_message(f"Recorded {recorder.path}")
+        if self.conn:
+            self.conn.recorder = self.session_recorder
+
+    def resume_telemetry(self):
+        # After a reconnect: the board may have reset, which stops reports
+        if self.telemetry_var.get():
+            self.toggle_telemetry()
+
+    def upload_melody(self):
+        file_path = filedialog.askopenfilename(
+            filetypes=[("Melodies", "*.txt *.rtttl *.mel"), ("All files", "*.*")],
+            title="Upload Melody"
+        )
+        if not file_path:
+            return
+        try:
+            name, data = clock_host.load_melody_file(file_path)
+        except Exception as e:
+            self.log_message(f"Melody error: {str(e)}")
+            return
+        self.tune_name = name
+        if not self.ensure_serial():
+            return
+        self.log_message(f"Uploading melody '{name}' ({len(data)} bytes)")
+        threading.Thread(target=self.upload_worker, args=(name, data), daemon=True).start()
+
+    def request(self, command, timeout=clock_host.REPLY_TIMEOUT):
+        # Blocking form for worker threads: (data, reply time) or IOError
+        return self.requests.call(command, timeout)
+
+    def precise_set_worker(self, result):
+        try:
+            outcome = clock_host.precise_set(self.request, result)
+            self.post(self.precise_set_done, outcome)
+        except Exception as e:
+            self.post(self.log_message, f"Precise set error: {str(e)}")
+            self.post(self.set_status, "NTP Error")
+
+    def precise_set_done(self, outcome):
+        self.log_message(f"NTP time set: {outcome}")
+        self.set_status("RTC Updated" if outcome.readback_ok else "RTC Set Error")
+
+    def upload_worker(self, name, data):
+        # Runs off the Tk thread
+        try:
+            self.post(self.log_message, "Melody " + clock_host.upload_melody(self.requests, name, data))
+        except Exception as e:
+            self.post(self.log_message, f"Upload error: {str(e)}")
+
+    def select_alarm_tune(self):
+        name = self.tune_name
+        if not name:
+            self.log_message("Upload a melody first")
+            return
+        self.command(f"ALARM_TUNE:{name}",
+                     lambda ok, data: self.log_message(f"Alarm tune: {data}") if ok else None)
+
+    def on_serial_data(self, data, rx_time):
+        # Connection thread, after every read (b"" on timeout): protocol
+        # state is handled here, UI work is posted to the queue
+        self.rx_time = rx_time
+        self.requests.expire()
+        try:
+            if self.binary:
+                self.decoder.feed(data)
+                self.retransmit_frames()
+                return
+            buf = self.rx_buf
+            buf += data
+            while not self.binary:
+                i = buf.find(b"\n")
+                if i < 0:
+                    break
+                line = buf[:i].decode('utf-8', 'replace').strip()
+                del buf[:i + 1]
+                if line:
+                    self.handle_line(line)
+            if self.binary:
+                # "OK BIN" may share a read with the first frame
+                self.decoder.reset()
+                self.decoder.feed(bytes(buf))
+                buf.clear()
+            elif len(buf) > MAX_LINE:
+                buf.clear()
+        except Exception as e:
+            self.post(self.log_message, f"Read error: {str(e)}")
     
+    def open_fleet(self):
+        FleetWindow(self)
+
     def refresh_ports(self):
-        ports = [port.device for port in serial.tools.list_ports.comports()]
+        # Probe every port for a clock in the background; our own open
+        # port is not probed (it would steal its replies) but kept
+        if self.discovering:
+            return
+        self.discovering = True
+        own = self.conn.port if self.conn and self.conn.state != "closed" else None
+        ports = [p for p in clock_host.list_ports() if p != own]
+
+        def worker():
+            try:
+                clocks = clock_host.discover(ports)
+            except Exception as e:
+                self.post(self.log_message, f"Port search failed: {e}")
+                clocks = []
+            self.post(self.show_ports, own, ports, clocks)
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def show_ports(self, own, ports, clocks):
+        self.discovering = False
+        for clock in clocks:
+            self.log_message(f"Found clock {clock}")
+        found = ([own] if own else []) + [c.port for c in clocks]
+        if found:
+            self.port_combobox['values'] = found
+            if self.port_var.get() not in found:
+                self.port_var.set(found[0])
+            return
+        # Nothing answered: a board still booting or in binary mode does
+        # not, so offer every port as before
         self.port_combobox['values'] = ports
-        if ports:
-            self.port_var.set(ports[0])
-        else:
-            self.port_var.set("")
+        self.port_var.set(ports[0] if ports else "")
+        self.log_message("No clock answered, listing every port" if ports else "No serial ports")
     
     def on_closing(self):
         self.running = False
-        if self.serial:
-            self.serial.close()
+        if self.conn:
+            self.conn.close()
+        if self.log_file:
+            self.log_file.close()
+        if self.telemetry_recorder:
+            self.telemetry_recorder.close()
         self.root.destroy()
 
+class FleetWindow:
+    """Every clock found by clock_host.discover() except the one on the
+    main window's port, driven at once through clock_host.Fleet. Alarm
+    values come from the main window.
+    """
+
+    COLUMNS = ("port", "state", "alarm", "result")
+
+    def __init__(self, app):
+        self.app = app
+        self.fleet = Fleet([])
+        self.busy = False
+        self.closed = False
+        self.window = tk.Toplevel(app.root)
+        self.window.title("Fleet (searching...)")
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+
+        buttons = ttk.Frame(self.window, padding=5)
+        buttons.pack(fill="x")
+        for text, command in (("Search", self.search), ("Connect", self.connect),
+                              ("Status", self.status), ("Set Alarm", self.set_alarm), ("Clear Alarm", self.clear_alarm),
+                              ("Sync Time", self.sync_time)):
+            ttk.Button(buttons, text=text, command=command).pack(side="left", padx=2)
+
+        self.table = ttk.Treeview(self.window, columns=self.COLUMNS, show="headings", height=15)
+        for column, width in zip(self.COLUMNS, (90, 70, 110, 360)):
+            self.table.heading(column, text=column.capitalize())
+            self.table.column(column, width=width, anchor="w")
+        self.table.pack(fill="both", expand=True, padx=5, pady=5)
+        self.search()
+
+    def search(self):
+        # Probe every port off the Tk thread; only clocks get a row
+        if self.busy:
+            return
+        self.busy = True
+        own = self.app.conn.port if self.app.conn else None
+        ports = [p for p in clock_host.list_ports() if p != own]
+
+        def worker():
+            try:
+                clocks = clock_host.discover(ports)
+            except Exception as e:
+                self.app.post(self.app.log_message, f"Fleet search error: {str(e)}")
+                clocks = []
+            self.app.post(self.show_clocks, clocks)
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def show_clocks(self, clocks):
+        self.busy = False
+        if self.closed:
+            return
+        self.fleet.close()
+        self.fleet = Fleet([c.port for c in clocks])
+        self.table.delete(*self.table.get_children())
+        for clock in clocks:
+            self.table.insert("", "end", iid=clock.port,
+                              values=(clock.port, "closed", "", f"id {clock.device_id}"))
+        self.window.title(f"Fleet ({len(clocks)} devices)")
+        self.app.log_message(f"Fleet: {len(clocks)} clocks found")
+        if clocks:
+            self.connect()
+
+    def update_row(self, port, **values):
+        if self.closed or not self.table.exists(port):
+            return
+        row = dict(zip(self.COLUMNS, self.table.item(port, "values")))
+        row.update(values)
+        row["state"] = self.fleet.links[port].state
+        self.table.item(port, values=[row[c] for c in self.COLUMNS])
+
+    def run(self, name, operation, column="result"):
+        # One broadcast at a time, off the Tk thread; rows update as
+        # each device answers
+        if self.busy:
+            return
+        self.busy = True
+        started = time.monotonic()
+
+        def on_result(port, ok, result):
+            text = str(result) if ok else f"error: {result}"
+            self.app.post(self.update_row, port, **{column: text})
+
+        def worker():
+            try:
+                results = operation(on_result)
+            except Exception as e:
+                self.app.post(self.done, f"Fleet {name} error: {str(e)}")
+                return
+            failed = sum(1 for ok, _ in results.values() if not ok)
+            for port, (ok, result) in results.items():
+                if not ok and result == "timeout":
+                    on_result(port, False, result)
+            self.app.post(self.done, f"Fleet {name}: {len(results) - failed}/{len(results)} ok "
+                                     f"in {time.monotonic() - started:.1f} s")
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def done(self, message):
+        self.busy = False
+        self.app.log_message(message)
+
+    def connect(self):
+        self.run("connect", lambda cb: self.fleet.open_all(on_result=cb), "result")
+
+    def status(self):
+        self.run("status", lambda cb: self.fleet.alarm_status(on_result=cb), "alarm")
+
+    def set_alarm(self):
+        hh = int(self.app.hour_spinbox.get())
+        mm = int(self.app.minute_spinbox.get())
+        self.run("alarm set", lambda cb: self.fleet.set_alarm(hh, mm, on_result=cb))
+
+    def clear_alarm(self):
+        self.run("alarm clear", lambda cb: self.fleet.clear_alarm(on_result=cb))
+
+    def sync_time(self):
+        def operation(cb):
+            result = self.app.ntp_pool.query()
+            return self.fleet.sync_time(result, on_result=cb)
+        self.run("time sync", operation)
+
+    def close(self):
+        self.closed = True
+        self.fleet.close()
+        self.window.destroy()
+
 if __name__ == "__main__":
     root = tk.Tk()
     app = AlarmControlApp(root)